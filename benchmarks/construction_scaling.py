@@ -0,0 +1,64 @@
+"""Compare suffix tree build times for the insertion and Ukkonen paths,
+and for insertion bounded to MAX_TOKEN_LEN characters per suffix.
+
+A single long clause with no delimiters is the case the insertion path handles
+worst, since it costs O(L^2) per clause when suffixes share long prefixes.
+Clause length doubles on each step for a random DNA-like clause and for a
+repetitive one (a short motif repeated, like code or URLs).
+"""
+import random
+import time
+
+from tokenBN.SuffixNode import SuffixNode
+
+CLAUSE_LENGTHS = [500, 1000, 2000, 4000, 8000]
+ALPHABET = "ACGT"
+MOTIF_LENGTH = 40
+DELIMITERS = {" ", "\n"}
+THRESHOLD = 2
+MAX_TOKEN_LEN = 16
+REPEATS = 3
+SEED = 0
+
+
+def random_clause(rng: random.Random, length: int) -> str:
+    return "".join(rng.choice(ALPHABET) for _ in range(length))
+
+
+def repetitive_clause(rng: random.Random, length: int) -> str:
+    motif = random_clause(rng, MOTIF_LENGTH)
+    return (motif * (length // MOTIF_LENGTH + 1))[:length]
+
+
+def time_build(text: str, method: str, **build_kwargs) -> float:
+    # best of a few runs, to keep GC pauses out of the comparison
+    best = float("inf")
+    for _ in range(REPEATS):
+        start_time = time.perf_counter()
+        SuffixNode.build_tree(
+            text=text,
+            delimiters=DELIMITERS,
+            threshold=THRESHOLD,
+            method=method,
+            **build_kwargs
+        )
+        best = min(best, time.perf_counter() - start_time)
+    return best
+
+
+def main() -> None:
+    rng = random.Random(SEED)
+    for name, make_clause in [("random", random_clause), ("repetitive", repetitive_clause)]:
+        print(f"\n{name} clause")
+        print(f"{'length':>8} {'insert (s)':>12} {'ukkonen (s)':>12} {'speedup':>8} {'k-bounded (s)':>14}")
+        for length in CLAUSE_LENGTHS:
+            text = make_clause(rng, length)
+            insert_time = time_build(text, "insert")
+            ukkonen_time = time_build(text, "ukkonen")
+            bounded_time = time_build(text, "insert", max_token_len=MAX_TOKEN_LEN)
+            print(f"{length:>8} {insert_time:>12.4f} {ukkonen_time:>12.4f} {insert_time / ukkonen_time:>7.1f}x "
+                  f"{bounded_time:>14.4f}")
+
+
+if __name__ == "__main__":
+    main()
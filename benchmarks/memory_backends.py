@@ -0,0 +1,61 @@
+"""Compare the memory held by the object and compact suffix tree backends.
+
+Builds the same unpruned tree with each backend and reports the memory still
+allocated once the build returns, along with the peak during the build, as
+measured by tracemalloc. The corpus is random words from a small vocabulary,
+so clause lengths and repeats look roughly like natural text.
+"""
+import gc
+import random
+import tracemalloc
+
+from tokenBN.SuffixNode import SuffixNode
+
+CORPUS_WORDS = [2000, 8000, 32000]
+VOCABULARY_SIZE = 500
+ALPHABET = "abcdefghijklmnopqrstuvwxyz"
+DELIMITERS = {" ", "\n"}
+THRESHOLD = 2
+SEED = 0
+
+
+def make_corpus(rng: random.Random, num_words: int) -> str:
+    vocabulary = ["".join(rng.choice(ALPHABET) for _ in range(rng.randint(2, 12)))
+                  for _ in range(VOCABULARY_SIZE)]
+    return " ".join(rng.choice(vocabulary) for _ in range(num_words))
+
+
+def measure(text: str, **build_kwargs):
+    gc.collect()
+    tracemalloc.start()
+    tree = SuffixNode.build_tree(
+        text=text,
+        delimiters=DELIMITERS,
+        threshold=THRESHOLD,
+        **build_kwargs
+    )
+    gc.collect()
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    num_nodes = len(tree.flat_tree_store.child_dict)
+    return num_nodes, retained, peak
+
+
+def main() -> None:
+    rng = random.Random(SEED)
+    backends = [
+        ("objects/insert", {"method": "insert"}),
+        ("objects/ukkonen", {"method": "ukkonen"}),
+        ("compact", {"backend": "compact"}),
+    ]
+    print(f"{'words':>7} {'backend':>16} {'nodes':>8} {'retained (MB)':>14} {'peak (MB)':>10} {'bytes/node':>11}")
+    for num_words in CORPUS_WORDS:
+        text = make_corpus(rng, num_words)
+        for name, build_kwargs in backends:
+            num_nodes, retained, peak = measure(text, **build_kwargs)
+            print(f"{num_words:>7} {name:>16} {num_nodes:>8} {retained / 2**20:>14.2f} "
+                  f"{peak / 2**20:>10.2f} {retained / num_nodes:>11.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""Report the bytes per node and insertion throughput of the object backend.
+
+Bytes per node is the memory tracemalloc sees allocated by an insertion-path
+build, divided by the number of nodes in the tree. Throughput is suffixes
+inserted per second with tracing off.
+"""
+import gc
+import random
+import time
+import tracemalloc
+
+from tokenBN.SuffixNode import SuffixNode
+from tokenBN.CompositionDAGNode import CompositionDAGNode
+
+NUM_WORDS = 20000
+VOCABULARY_SIZE = 4000
+ALPHABET = "abcdefghijklmnopqrstuvwxyz"
+DELIMITERS = {" ", "\n"}
+THRESHOLD = 2
+REPEATS = 3
+SEED = 0
+
+
+def make_corpus(rng: random.Random) -> str:
+    vocabulary = ["".join(rng.choice(ALPHABET) for _ in range(rng.randint(2, 12)))
+                  for _ in range(VOCABULARY_SIZE)]
+    return " ".join(rng.choice(vocabulary) for _ in range(NUM_WORDS))
+
+
+def build(text: str) -> SuffixNode:
+    return SuffixNode.build_tree(text=text, delimiters=DELIMITERS, threshold=THRESHOLD)
+
+
+def main() -> None:
+    text = make_corpus(random.Random(SEED))
+    num_suffixes = len(text)
+
+    gc.collect()
+    tracemalloc.start()
+    tree = build(text)
+    gc.collect()
+    tree_bytes, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    num_nodes = len(tree.flat_tree_store.child_dict)
+
+    best = float("inf")
+    for _ in range(REPEATS):
+        start_time = time.perf_counter()
+        build(text)
+        best = min(best, time.perf_counter() - start_time)
+
+    tree.clean()
+    gc.collect()
+    tracemalloc.start()
+    dag = CompositionDAGNode()
+    dag.suffix_tree_to_dag(tree)
+    gc.collect()
+    dag_bytes, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    num_vertices = len(dag.dag_store.vertices)
+
+    print(f"suffix tree: {num_nodes} nodes, {tree_bytes / num_nodes:.1f} bytes/node")
+    print(f"insertion:   {num_suffixes / best:,.0f} suffixes/s ({best:.3f} s)")
+    print(f"DAG:         {num_vertices} vertices, {dag_bytes / num_vertices:.1f} bytes/vertex")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""Compare building the full tree with building it against the threshold.
+
+Builds the same tree with method="insert" and method="threshold", reporting
+the nodes allocated, the peak memory tracemalloc sees during the build, and
+the time of a build with tracing off, then checks both give the same tokens once cleaned. Clauses
+are sentences of Zipf-distributed words, so most long branches are singletons.
+"""
+import gc
+import random
+import time
+import tracemalloc
+
+from tokenBN.SuffixNode import SuffixNode
+
+NUM_SENTENCES = [200, 800, 3200]
+WORDS_PER_SENTENCE = 12
+VOCABULARY_SIZE = 5000
+ALPHABET = "abcdefghijklmnopqrstuvwxyz"
+DELIMITERS = {"\n"}
+THRESHOLD = 2
+SEED = 0
+
+
+def make_corpus(rng: random.Random, num_sentences: int) -> str:
+    vocabulary = ["".join(rng.choice(ALPHABET) for _ in range(rng.randint(2, 10)))
+                  for _ in range(VOCABULARY_SIZE)]
+    weights = [1 / rank for rank in range(1, VOCABULARY_SIZE + 1)]
+    return "\n".join(" ".join(rng.choices(vocabulary, weights, k=WORDS_PER_SENTENCE))
+                     for _ in range(num_sentences))
+
+
+def build(text: str, method: str) -> SuffixNode:
+    return SuffixNode.build_tree(text=text, delimiters=DELIMITERS, threshold=THRESHOLD, method=method)
+
+
+def measure(text: str, method: str):
+    gc.collect()
+    tracemalloc.start()
+    tree = build(text, method)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    num_nodes = len(tree.flat_tree_store.child_dict)
+    tree.clean()
+
+    # time a separate build, since tracing slows allocation down
+    del tree
+    gc.collect()
+    start_time = time.perf_counter()
+    tree = build(text, method)
+    elapsed = time.perf_counter() - start_time
+    tree.clean()
+    return num_nodes, peak, elapsed, tree.get_tokens()
+
+
+def main() -> None:
+    rng = random.Random(SEED)
+    print(f"{'sentences':>9} {'method':>10} {'nodes':>8} {'peak (MB)':>10} {'time (s)':>9} {'same tokens':>12}")
+    for num_sentences in NUM_SENTENCES:
+        text = make_corpus(rng, num_sentences)
+        tokens = None
+        for method in ["insert", "threshold"]:
+            num_nodes, peak, elapsed, method_tokens = measure(text, method)
+            if tokens is None:
+                tokens = method_tokens
+            print(f"{num_sentences:>9} {method:>10} {num_nodes:>8} {peak / 2**20:>10.2f} "
+                  f"{elapsed:>9.2f} {str(method_tokens == tokens):>12}")
+
+
+if __name__ == "__main__":
+    main()
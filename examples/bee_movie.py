@@ -8,6 +8,7 @@ import matplotlib.pyplot as plt
 from tokenBN.config import DEBUG_VERBOSITY
 
 from tokenBN.SuffixNode import SuffixNode
+from tokenBN.ThresholdIndex import ThresholdIndex
 from tokenBN.CompositionDAGNode import CompositionDAGNode
 from tokenBN.utils.figures import plot_dag
 
@@ -57,30 +58,30 @@ def run_test(
     text: str,
     min_freq: int,
     delimiters: Optional[set] = None,
-    suffix_tree: Optional[SuffixNode] = None,
+    threshold_index: Optional[ThresholdIndex] = None,
     num_graphs_to_plot: int = 1
-) -> Tuple[float, Any, Optional[SuffixNode]]:
+) -> Tuple[float, Any, Optional[ThresholdIndex]]:
     """Run a single test on the given text with specified parameters.
     
     Args:
         text: Input text to process
         min_freq: Minimum frequency threshold for tokens
         delimiters: Set of delimiter characters
-        suffix_tree: Previously constructed tree to build upon
+        threshold_index: Index over a previously built, unpruned tree for this text
         num_graphs_to_plot: Number of DAG visualizations to generate
         
     Returns:
-        Tuple of (execution_time, suffix_tree, token_vector_mappings)
+        Tuple of (execution_time, threshold_index, token_vector_mappings)
     """
     start_time = time.time()
-    if not suffix_tree:
-        suffix_tree = SuffixNode.from_text(
+    if not threshold_index:
+        threshold_index = SuffixNode.build_tree(
             text=text,
             threshold=min_freq,
             delimiters=delimiters
-        )
-    else:
-        suffix_tree.clean()
+        ).threshold_index()
+    # prune a copy, so the same tree serves every threshold
+    suffix_tree = threshold_index.pruned_tree(min_freq)
     tokenizations[(text, min_freq)] = suffix_tree.get_tokens()
 
     if DEBUG_VERBOSITY["SuffixNode"]["general"] > 0:
@@ -108,7 +109,7 @@ def run_test(
     end_time = 0
     token_vector_mappings = None
 
-    return end_time, suffix_tree, token_vector_mappings
+    return end_time, threshold_index, token_vector_mappings
 
 
 def run_tests(tests: List[str]) -> None:
@@ -118,22 +119,22 @@ def run_tests(tests: List[str]) -> None:
         tests: List of test text strings to process
     """
     num_graphs_to_plot = 1
-    prev_trees: Dict[int, Optional[Any]] = {}
+    threshold_indexes: Dict[int, Optional[ThresholdIndex]] = {}
 
     for min_freq in FREQ_RANGE:
         print(f"Testing minimum frequency: {min_freq}")
 
         for test_idx, test_text in enumerate(tests):
-            if test_idx not in prev_trees:
-                prev_trees[test_idx] = None
+            if test_idx not in threshold_indexes:
+                threshold_indexes[test_idx] = None
 
             total_time = 0.0
             for fold in range(FOLDS):
-                execution_time, prev_trees[test_idx], _ = run_test(
+                execution_time, threshold_indexes[test_idx], _ = run_test(
                     text=test_text,
                     min_freq=min_freq,
                     delimiters=DELIMITERS,
-                    suffix_tree=prev_trees[test_idx],
+                    threshold_index=threshold_indexes[test_idx],
                     num_graphs_to_plot=num_graphs_to_plot
                 )
                 num_graphs_to_plot = max(0, num_graphs_to_plot - 1)
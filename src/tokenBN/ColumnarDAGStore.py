@@ -0,0 +1,257 @@
+from array import array
+from collections.abc import Mapping, Set
+from sys import intern
+
+import numpy as np
+import scipy.sparse as sp
+
+from tokenBN.config import DEBUG_VERBOSITY
+
+from tokenBN.DAGStore import DAGStore
+from tokenBN.utils.binary_format import StringIndex, StringTable, read_arrays
+from tokenBN.utils.util import tokenization_pattern
+
+
+class ColumnarVertex:
+    """
+    A lightweight handle on one vertex of a ColumnarDAGStore, exposing the
+    token, frequency, pattern and parents a CompositionDAGNode would have.
+    """
+    __slots__ = ("dag_store", "token_id")
+
+    def __init__(self, dag_store, token_id):
+        self.dag_store = dag_store
+        self.token_id = token_id
+
+    def __str__(self):
+        return f"Token: {self.token}\nParents: {set(self.dag_store.parents(self.token))}"
+
+    @property
+    def token(self):
+        return self.dag_store.tokens[self.token_id]
+
+    @property
+    def frequency(self):
+        return self.dag_store.frequency[self.token_id]
+
+    @property
+    def pattern(self):
+        return self.dag_store.patterns[self.dag_store.pattern_ids[self.token_id]]
+
+    @property
+    def parents(self):
+        return [ColumnarVertex(self.dag_store, parent_id)
+                for parent_id in self.dag_store.parent_ids(self.token_id).tolist()]
+
+
+class ColumnarVertexDict(Mapping):
+    """
+    Read-only token -> vertex view over a ColumnarDAGStore,
+    standing in for DAGStore.vertices without storing any vertex objects.
+    """
+    def __init__(self, dag_store):
+        self.dag_store = dag_store
+
+    def __getitem__(self, token):
+        return ColumnarVertex(self.dag_store, self.dag_store.token_index_map[token])
+
+    def __contains__(self, token):
+        return token in self.dag_store.token_index_map
+
+    def __iter__(self):
+        return iter(self.dag_store.tokens)
+
+    def __len__(self):
+        return len(self.dag_store.tokens)
+
+
+class ColumnarTokenTable(Mapping):
+    """
+    Read-only id -> token view over a ColumnarDAGStore's string table,
+    standing in for DAGStore.reversed_token_map.
+    """
+    def __init__(self, dag_store):
+        self.dag_store = dag_store
+
+    def __getitem__(self, token_id):
+        if not 0 <= token_id < len(self.dag_store.tokens):
+            raise KeyError(token_id)
+        return self.dag_store.tokens[token_id]
+
+    def __iter__(self):
+        return iter(range(len(self.dag_store.tokens)))
+
+    def __len__(self):
+        return len(self.dag_store.tokens)
+
+
+class ColumnarPatternMap(Mapping):
+    """
+    Read-only pattern -> tokens view over a ColumnarDAGStore, standing in for
+    DAGStore.pattern_map. Each pattern's tokens are found when it's looked up.
+    """
+    def __init__(self, dag_store):
+        self.dag_store = dag_store
+
+    def __getitem__(self, pattern):
+        pattern_id = self.dag_store.pattern_index[pattern]
+        token_ids = np.flatnonzero(np.array(self.dag_store.pattern_ids, dtype=np.int32) == pattern_id)
+        return {self.dag_store.tokens[token_id] for token_id in token_ids.tolist()}
+
+    def __iter__(self):
+        return iter(self.dag_store.patterns)
+
+    def __len__(self):
+        return len(self.dag_store.patterns)
+
+
+class ColumnarEdgeSet(Set):
+    """
+    Read-only view of a ColumnarDAGStore's edges as the (token, token, position)
+    tuples DAGStore.edge_set holds, built only while they're iterated over.
+    """
+    def __init__(self, dag_store):
+        self.dag_store = dag_store
+
+    def __contains__(self, edge):
+        source, target, position = edge
+        token_index_map = self.dag_store.token_index_map
+        if source not in token_index_map or target not in token_index_map:
+            return False
+        parent_ids = self.dag_store.parent_ids(token_index_map[target])
+        return 0 <= position < len(parent_ids) and parent_ids[position] == token_index_map[source]
+
+    def __iter__(self):
+        tokens = self.dag_store.tokens
+        for source, target, position in zip(*(column.tolist() for column in self.dag_store.edge_arrays())):
+            yield tokens[source], tokens[target], position
+
+    def __len__(self):
+        return len(self.dag_store.edge_sources)
+
+
+class ColumnarDAGStore(DAGStore):
+    """
+    A composition DAG held in columns instead of CompositionDAGNode objects.
+
+    Tokens are numbered shortest first and kept once, in a shared string table.
+    Each vertex's frequency and pattern id sit in arrays indexed by its token id,
+    and every edge is one row of the parallel source/target/position arrays,
+    with repeated edges kept as rows of their own. A token's edges are added
+    together, in position order, once all of its parts have ids, so the edges
+    come out grouped by target and the parents of any token are one slice.
+    """
+    def __init__(self):
+        super().__init__(vertices=ColumnarVertexDict(self),
+                         edge_set=ColumnarEdgeSet(self),
+                         pattern_map=ColumnarPatternMap(self))
+        self.tokens = []
+        self.token_index_map = dict()
+        self.reversed_token_map = ColumnarTokenTable(self)
+        self.frequency = array("i")
+        self.pattern_ids = array("i")
+        # every distinct pattern, indexed by pattern id
+        self.patterns = []
+        self.pattern_index = dict()
+        # where each token's parents start in the edge arrays
+        self.parent_starts = np.zeros(1, dtype=np.int64)
+
+    @classmethod
+    def from_suffix_tree(cls, suffix_tree) -> 'ColumnarDAGStore':
+        """
+        The columnar counterpart of CompositionDAGNode.suffix_tree_to_dag,
+        building the same vertices, edges and patterns shortest token first.
+        """
+        if DEBUG_VERBOSITY["DAGNode"] > -1:
+            print("Building columnar DAG from modified suffix tree...")
+
+        dag_store = cls()
+        tokens_by_length = dict()
+        for token in suffix_tree.get_tokens():
+            tokens_by_length.setdefault(len(token), []).append(token)
+
+        child_dict = suffix_tree.flat_tree_store.child_dict
+        token_index_map = dag_store.token_index_map
+        parent_counts = array("i")
+        for length in sorted(tokens_by_length):
+            for token in tokens_by_length[length]:
+                suffix_node = child_dict[token]
+                token_id = len(dag_store.tokens)
+                dag_store.tokens.append(intern(token))
+                token_index_map[token] = token_id
+                dag_store.frequency.append(suffix_node.frequency)
+
+                # top-level tokens hang off the DAG's root, which has no vertex of its own
+                if suffix_node.parent is None or suffix_node.parent.token is None:
+                    tokenization = [token]
+                    parent_counts.append(0)
+                else:
+                    # every token is decomposed just once, so there's nothing to cache
+                    tokenization = suffix_node.flat_tree_store.tokenize(token, len(token) - 1)
+                    dag_store.edge_sources.extend(token_index_map[part] for part in tokenization)
+                    dag_store.edge_targets.extend([token_id] * len(tokenization))
+                    dag_store.edge_positions.extend(range(len(tokenization)))
+                    parent_counts.append(len(tokenization))
+                dag_store.add_vertex_pattern(tokenization_pattern(tokenization))
+
+        dag_store.parent_starts = np.zeros(len(parent_counts) + 1, dtype=np.int64)
+        np.cumsum(np.array(parent_counts, dtype=np.int64), out=dag_store.parent_starts[1:])
+        dag_store.assemble_adjacency_matrix()
+        return dag_store
+
+    @classmethod
+    def load(cls, filename: str) -> 'ColumnarDAGStore':
+        """
+        Load a DAG written by DAGStore.save, from any kind of DAGStore. Its
+        columns, edges, adjacency matrix and string tables are all memory-mapped
+        read-only, so loading takes the same time whatever the DAG's size.
+        Tokens and patterns are decoded as they're looked up, and the dicts
+        finding a token's or pattern's id are built the first time they're used.
+        """
+        metadata, arrays = read_arrays(filename, "dag")
+        num_tokens = metadata["num_tokens"]
+        dag_store = cls()
+        dag_store.tokens = StringTable(arrays["token_data"], arrays["token_offsets"])
+        dag_store.token_index_map = StringIndex(dag_store.tokens)
+        dag_store.frequency = arrays["frequency"]
+        dag_store.pattern_ids = arrays["pattern_ids"]
+        dag_store.patterns = StringTable(arrays["pattern_data"], arrays["pattern_offsets"])
+        dag_store.pattern_index = StringIndex(dag_store.patterns)
+        dag_store.edge_sources = arrays["edge_sources"]
+        dag_store.edge_targets = arrays["edge_targets"]
+        dag_store.edge_positions = arrays["edge_positions"]
+        dag_store.parent_starts = arrays["parent_starts"]
+        dag_store.adjacency_matrix = sp.csr_matrix(
+            (arrays["adjacency_data"], arrays["adjacency_indices"], arrays["adjacency_indptr"]),
+            shape=(num_tokens, num_tokens)
+        )
+        return dag_store
+
+    def columns(self):
+        return self.tokens, np.asarray(self.frequency, dtype=np.int32), \
+            np.asarray(self.pattern_ids, dtype=np.int32), self.patterns
+
+    def add_vertex_pattern(self, pattern):
+        pattern_id = self.pattern_index.get(pattern)
+        if pattern_id is None:
+            pattern_id = self.pattern_index[pattern] = len(self.patterns)
+            self.patterns.append(pattern)
+        self.pattern_ids.append(pattern_id)
+
+    def parent_ids(self, token_id) -> np.ndarray:
+        # the tokens composing token_id, in order
+        start, end = self.parent_starts[token_id], self.parent_starts[token_id + 1]
+        return np.array(self.edge_sources[start:end], dtype=np.int32)
+
+    def parents(self, token):
+        return [self.tokens[parent_id] for parent_id in self.parent_ids(self.token_index_map[token]).tolist()]
+
+    def child_ids(self, token_id):
+        # every token that token_id is part of, with how many times it appears in each
+        adjacency_matrix = self.adjacency_matrix
+        start, end = adjacency_matrix.indptr[token_id], adjacency_matrix.indptr[token_id + 1]
+        return adjacency_matrix.indices[start:end], adjacency_matrix.data[start:end]
+
+    def children(self, token):
+        child_ids, _ = self.child_ids(self.token_index_map[token])
+        return [self.tokens[child_id] for child_id in child_ids.tolist()]
@@ -0,0 +1,146 @@
+from typing import List
+
+from tokenBN.config import DEBUG_VERBOSITY
+
+from tokenBN.CompiledTokenizer import CompiledTokenizer
+from tokenBN.ThresholdIndex import ThresholdIndex
+from tokenBN.utils.util import common_prefix_length
+
+
+class CompactSuffixNode:
+    """
+    A lightweight handle on one node of a CompactTreeStore.
+
+    It exposes the read side of the SuffixNode API (token, suffix, frequency,
+    parent, children, get_tokens, prune_tree, clean, ...) by reading the
+    store's arrays, so handles are cheap to create and are never stored.
+    Pruning renumbers the store, after which only the root's handle stays valid.
+    """
+    __slots__ = ("flat_tree_store", "node_id")
+
+    def __init__(self, flat_tree_store, node_id):
+        self.flat_tree_store = flat_tree_store
+        self.node_id = node_id
+
+    def __str__(self):
+        return f"CompactSuffixNode: {self.token}"
+
+    def __eq__(self, other):
+        return isinstance(other, CompactSuffixNode) \
+            and self.flat_tree_store is other.flat_tree_store \
+            and self.node_id == other.node_id
+
+    def __hash__(self):
+        return hash((id(self.flat_tree_store), self.node_id))
+
+    @property
+    def token(self):
+        return self.flat_tree_store.token(self.node_id)
+
+    @property
+    def suffix(self):
+        return self.flat_tree_store.suffix(self.node_id)
+
+    @property
+    def frequency(self):
+        return self.flat_tree_store.frequency[self.node_id]
+
+    @frequency.setter
+    def frequency(self, frequency):
+        self.flat_tree_store.frequency[self.node_id] = frequency
+
+    @property
+    def parent(self):
+        parent_id = self.flat_tree_store.parent[self.node_id]
+        if parent_id < 0:
+            return None
+        return self.flat_tree_store.node(parent_id)
+
+    @property
+    def delimiters(self):
+        return self.flat_tree_store.delimiters
+
+    @property
+    def threshold(self):
+        return self.flat_tree_store.threshold
+
+    @property
+    def keys_to_my_children(self):
+        store = self.flat_tree_store
+        return {store.token(child) for child in store.children(self.node_id)}
+
+    @property
+    def child_index(self):
+        store = self.flat_tree_store
+        return {store.text[store.start[child]]: store.token(child)
+                for child in store.children(self.node_id)}
+
+    def longest_common_prefix(self, suffix, doSuffix):
+        store = self.flat_tree_store
+        # same contract as SuffixNode.longest_common_prefix
+        if doSuffix or self.node_id == store.ROOT:
+            depth = 0
+        else:
+            depth = store.depth[self.node_id]
+        if len(suffix) <= depth:
+            return -1, None
+
+        child = store.find_child(self.node_id, suffix[depth])
+        if child < 0:
+            return -1, None
+
+        if doSuffix:
+            i = common_prefix_length(suffix, store.suffix(child))
+        else:
+            i = common_prefix_length(suffix, store.token(child))
+        if i <= depth:
+            return -1, None
+        return i, store.token(child)
+
+    def clean(self):
+        if DEBUG_VERBOSITY["SuffixNode"]["general"] > -1:
+            print("Pruning modified suffix tree...")
+        self.prune_tree()
+        self.add_delimiters_to_tree(self.delimiters)
+
+        if DEBUG_VERBOSITY["SuffixNode"]["pruning"] > 0:
+            self.print_tree()
+
+    def print_tree(self, indent:int=0):
+        store = self.flat_tree_store
+        stack = [(child, indent) for child in store.children(self.node_id)]
+        while stack:
+            child, depth = stack.pop()
+            print(f"{' ' * depth} '{store.suffix(child)}': {store.frequency[child]}")
+            stack.extend((grandchild, depth + 4) for grandchild in store.children(child))
+
+    def add_delimiters_to_tree(self, delimiters:List[str]):
+        self.flat_tree_store.add_delimiters(delimiters)
+
+    def prune_tree(self, threshold=None, indent=0):
+        if threshold is None:
+            threshold = self.threshold
+        self.flat_tree_store.prune(threshold, self.node_id)
+        return self
+
+    def pruned_copy(self, threshold=None):
+        # prune a copy of the whole store, leaving this tree as it is
+        if threshold is None:
+            threshold = self.threshold
+        store = self.flat_tree_store.copy()
+        store.threshold = threshold
+        store.root.clean()
+        return store.root
+
+    def threshold_index(self):
+        return ThresholdIndex(self)
+
+    def compile(self, max_token_len=None, token_index_map=None):
+        return CompiledTokenizer(self, max_token_len, token_index_map)
+
+    def get_tokens(self):
+        return self.flat_tree_store.get_tokens()
+
+    def save(self, filename: str):
+        # the tree below this node, which CompactTreeStore.load maps back into memory
+        type(self.flat_tree_store).from_tree(self).write(filename)
@@ -0,0 +1,543 @@
+from array import array
+from collections.abc import Mapping
+from typing import Iterable, Set
+
+import numpy as np
+
+from tokenBN.config import COMPACT_BATCH_SIZE, DEBUG_VERBOSITY
+
+from tokenBN.FlatTreeStore import FlatTreeStore
+from tokenBN.CompactSuffixNode import CompactSuffixNode
+from tokenBN.utils.binary_format import MappedText, encode_text, read_arrays, write_arrays
+from tokenBN.utils.util import common_prefix_length
+
+
+NO_NODE = -1
+
+
+class CompactChildDict(Mapping):
+    """
+    Read-only token -> node view over a CompactTreeStore,
+    standing in for FlatTreeStore.child_dict without storing any token strings.
+    """
+    def __init__(self, store):
+        self.store = store
+
+    def __getitem__(self, token):
+        node_id = self.store.find(token)
+        if node_id == NO_NODE:
+            raise KeyError(token)
+        return self.store.node(node_id)
+
+    def __contains__(self, token):
+        return self.store.find(token) != NO_NODE
+
+    def __iter__(self):
+        for node_id in self.store.iter_nodes():
+            yield self.store.token(node_id)
+
+    def __len__(self):
+        return self.store.num_nodes - 1
+
+
+class CompactTreeStore(FlatTreeStore):
+    """
+    Struct-of-arrays storage for a suffix tree.
+
+    Nodes are integer ids into parallel arrays. Edge labels are (start, end)
+    offsets into the store's text, and each node's edge is taken from an
+    occurrence of its whole token, so token(i) is text[end[i] - depth[i]:end[i]].
+    The text only keeps the spans some token covers, not the whole corpus.
+    Children are kept as first-child/next-sibling lists, with a dict index,
+    keyed by first character, only for the root's children, which have a large fan-out.
+    Tokens are only built as strings when asked for.
+
+    A store can be saved to a binary file and loaded back with its columns
+    memory-mapped, in which case it's read-only: prune a pruned_copy() instead.
+    """
+    ROOT = 0
+    # the array typecode of each column
+    COLUMNS = {
+        "start": "q",
+        "end": "q",
+        "depth": "i",
+        "parent": "i",
+        "frequency": "i",
+        "first_child": "i",
+        "next_sibling": "i",
+    }
+
+    def __init__(self, text: str = "", delimiters: Set[str] = set(), threshold: int = 2):
+        self.text = text
+
+        self.start = array("q")
+        self.end = array("q")
+        self.depth = array("i")
+        self.parent = array("i")
+        self.frequency = array("i")
+        self.first_child = array("i")
+        self.next_sibling = array("i")
+        self.root_index = dict()
+        self.num_nodes = 0
+        # offsets along a node's edge at which shorter suffixes stopped, like SuffixNode's
+        #   edge_ends, kept only while suffixes are being inserted
+        self.edge_ends = None
+
+        self.new_node(0, 0, 0, NO_NODE, 0)
+        super().__init__(child_dict=CompactChildDict(self),
+                         root=self.node(CompactTreeStore.ROOT),
+                         delimiters=delimiters,
+                         threshold=threshold)
+
+    @classmethod
+    def from_clauses(cls,
+            clauses: Iterable[str],
+            delimiters: Set[str],
+            threshold: int,
+            batch_size: int = COMPACT_BATCH_SIZE
+        ) -> 'CompactTreeStore':
+        """
+        Build the suffix tree straight into the arrays, inserting every suffix
+        of every clause just as SuffixNode's insertion path does. The clauses
+        are added in batches at least as long as the store's text, and after
+        each one the text is cut back to what the tokens use, so memory tracks
+        the size of the tree rather than the corpus.
+        """
+        store = cls(delimiters=delimiters, threshold=threshold)
+        store.edge_ends = dict()
+        batch = []
+        length = 0
+        for clause in clauses:
+            batch.append(clause)
+            length += len(clause)
+            if length >= max(batch_size, len(store.text)):
+                store.add_clauses(batch)
+                batch = []
+                length = 0
+        store.add_clauses(batch)
+        store.edge_ends = None
+        return store
+
+    def node(self, node_id):
+        return CompactSuffixNode(self, node_id)
+
+    def new_node(self, start, end, depth, parent, frequency):
+        node_id = self.num_nodes
+        self.start.append(start)
+        self.end.append(end)
+        self.depth.append(depth)
+        self.parent.append(parent)
+        self.frequency.append(frequency)
+        self.first_child.append(NO_NODE)
+        self.next_sibling.append(NO_NODE)
+        self.num_nodes += 1
+
+        if parent != NO_NODE:
+            # prepend to the parent's sibling list
+            self.next_sibling[node_id] = self.first_child[parent]
+            self.first_child[parent] = node_id
+            if parent == CompactTreeStore.ROOT:
+                # the root's children are indexed by first character, like every node's
+                self.root_index[self.text[start]] = node_id
+        return node_id
+
+    def add_clauses(self, clauses):
+        # the batch's text goes on the end of the store's in one piece
+        position = len(self.text)
+        self.text += "".join(clauses)
+        for clause in clauses:
+            if DEBUG_VERBOSITY["SuffixNode"]["general"] > 0:
+                print(f"Building suffix tree for '{clause}'...")
+            stop = position + len(clause)
+            # shortest suffix first, like SuffixNode.add_all_suffixes
+            for suffix_start in range(stop - 1, position - 1, -1):
+                self.add_suffix(suffix_start, stop)
+            position = stop
+        self.compact_text()
+
+    def add_suffix(self, position, stop):
+        """
+        Insert the suffix text[position:stop] the way SuffixNode.add_suffix does,
+        with the same frequencies, splits and edge ends, but walking down
+        the tree in a loop rather than recursing.
+        """
+        text, start, end, frequency = self.text, self.start, self.end, self.frequency
+        node_id = CompactTreeStore.ROOT
+        while True:
+            child = self.find_child(node_id, text[position])
+            if child == NO_NODE:
+                if node_id == CompactTreeStore.ROOT:
+                    # an unseen character joins the alphabet, with the rest of the suffix below it
+                    node_id = self.new_node(position, position + 1, 1, node_id, 1)
+                    position += 1
+                    if position == stop:
+                        return
+                self.new_node(position, stop, self.depth[node_id] + stop - position, node_id, 1)
+                return
+
+            frequency[child] += 1
+            label_length = end[child] - start[child]
+            index = common_prefix_length(text[position:min(stop, position + label_length)],
+                                         text[start[child]:end[child]])
+            if index == label_length and index < stop - position:
+                node_id = child
+                position += index
+                continue
+
+            if index < stop - position:
+                # the new suffix was counted on the child, but it never reaches the child's lower half
+                frequency[child] -= 1
+                split_node = self.split_child(child, index)
+                frequency[split_node] += 1
+                self.new_node(position + index, stop, self.depth[split_node] + stop - position - index,
+                              split_node, 1)
+            elif index < label_length:
+                # the suffix stops partway along the child's edge, so remember where
+                edge_ends = self.edge_ends.setdefault(child, dict())
+                edge_ends[index] = edge_ends.get(index, 0) + 1
+            return
+
+    def split_child(self, child, split_index):
+        # a new node takes the first split_index characters of child's edge,
+        #   and child's place among its parent's children
+        parent = self.parent[child]
+        split_node = self.new_node(self.start[child], self.start[child] + split_index,
+                                   self.depth[parent] + split_index, NO_NODE, self.frequency[child])
+        self.parent[split_node] = parent
+        self.next_sibling[split_node] = self.next_sibling[child]
+        if parent == CompactTreeStore.ROOT:
+            self.root_index[self.text[self.start[child]]] = split_node
+        if self.first_child[parent] == child:
+            self.first_child[parent] = split_node
+        else:
+            previous = self.first_child[parent]
+            while self.next_sibling[previous] != child:
+                previous = self.next_sibling[previous]
+            self.next_sibling[previous] = split_node
+
+        # child is kept as the lower half of the edge, the split node's only child
+        self.parent[child] = split_node
+        self.next_sibling[child] = NO_NODE
+        self.first_child[split_node] = child
+        self.start[child] += split_index
+
+        # suffixes that stopped above the split no longer reach child
+        edge_ends = None if self.edge_ends is None else self.edge_ends.pop(child, None)
+        if edge_ends is not None:
+            for offset, count in edge_ends.items():
+                if offset <= split_index:
+                    self.frequency[child] -= count
+                    if offset < split_index:
+                        self.edge_ends.setdefault(split_node, dict())[offset] = count
+                else:
+                    self.edge_ends.setdefault(child, dict())[offset - split_index] = count
+        return split_node
+
+    def compact_text(self):
+        """
+        Cut the text back to the spans the nodes' tokens cover, shifting every
+        edge to match, so text only used by pruned nodes or by clauses
+        whose suffixes were all in the tree already is freed.
+        """
+        if self.num_nodes == 1:
+            self.text = ""
+            return
+        end = np.frombuffer(self.end, dtype=np.int64)
+        token_starts = end[1:] - np.frombuffer(self.depth, dtype=np.int32)[1:]
+
+        # the tokens' spans, merged wherever they overlap or touch
+        order = np.argsort(token_starts, kind="stable")
+        sorted_starts = token_starts[order]
+        reach = np.maximum.accumulate(end[1:][order])
+        first = np.flatnonzero(np.concatenate(([True], sorted_starts[1:] > reach[:-1])))
+        span_starts = sorted_starts[first]
+        span_ends = reach[np.append(first[1:], len(order)) - 1]
+        span_lengths = span_ends - span_starts
+
+        self.text = "".join(self.text[span_start:span_end]
+                            for span_start, span_end in zip(span_starts.tolist(), span_ends.tolist()))
+        shifts = np.zeros(self.num_nodes, dtype=np.int64)
+        shifts[1:] = (np.cumsum(span_lengths) - span_lengths - span_starts)[
+            np.searchsorted(span_starts, token_starts, side="right") - 1]
+        self.start = array("q", (np.frombuffer(self.start, dtype=np.int64) + shifts).tobytes())
+        self.end = array("q", (end + shifts).tobytes())
+
+    @classmethod
+    def from_tree(cls, tree) -> 'CompactTreeStore':
+        """
+        Copy any tree, SuffixNode or compact, into a new store whose text holds
+        only the tokens of the tree's leaves, one after another. Every other
+        token is the start of one of the leaf tokens below it, so its edge
+        label is taken from there, and no text outside the tree is kept.
+        """
+        if isinstance(tree, CompactSuffixNode):
+            source = tree.flat_tree_store
+            children = lambda node: [source.node(child) for child in source.children(node.node_id)]
+        else:
+            child_dict = tree.flat_tree_store.child_dict
+            children = lambda node: [child_dict[token] for token in node.keys_to_my_children]
+
+        # the nodes in preorder, each with its parent's position in the list
+        nodes, parents = [tree], [NO_NODE]
+        for position, node in enumerate(nodes):
+            node_children = children(node)
+            nodes.extend(node_children)
+            parents.extend([position] * len(node_children))
+        depths = [0] + [len(node.token) for node in nodes[1:]]
+
+        # where the leaf each node takes its token from starts in the new text,
+        #   found bottom up, with each node using its first child's leaf
+        pieces = []
+        text_length = 0
+        leaf_starts = [0] * len(nodes)
+        first_children = [NO_NODE] * len(nodes)
+        for position in range(len(nodes) - 1, 0, -1):
+            if parents[position] != NO_NODE:
+                first_children[parents[position]] = position
+            if first_children[position] == NO_NODE:
+                leaf_starts[position] = text_length
+                pieces.append(nodes[position].token)
+                text_length += depths[position]
+            else:
+                leaf_starts[position] = leaf_starts[first_children[position]]
+
+        store = cls(text="".join(pieces), delimiters=tree.delimiters, threshold=tree.threshold)
+        store.frequency[CompactTreeStore.ROOT] = tree.frequency
+        for position in range(1, len(nodes)):
+            end = leaf_starts[position] + depths[position]
+            store.new_node(end - (depths[position] - depths[parents[position]]), end, depths[position],
+                           parents[position], nodes[position].frequency)
+        return store
+
+    def save(self, filename: str):
+        # only the text the tree uses is saved
+        CompactTreeStore.from_tree(self.root).write(filename)
+
+    def write(self, filename: str):
+        """
+        Write the store's columns and text, as they are, to a binary file,
+        which CompactTreeStore.load maps back into memory.
+        """
+        arrays = {name: np.frombuffer(getattr(self, name), dtype=np.dtype(typecode))
+                  for name, typecode in CompactTreeStore.COLUMNS.items()}
+        arrays["text"] = encode_text(str(self.text))
+        write_arrays(filename, "tree", {
+            "num_nodes": self.num_nodes,
+            "delimiters": sorted(self.delimiters),
+            "threshold": self.threshold,
+        }, arrays)
+
+    @classmethod
+    def load(cls, filename: str) -> 'CompactTreeStore':
+        # the columns and the text are memory-mapped, and the text's characters are decoded as they're read
+        metadata, arrays = read_arrays(filename, "tree")
+        store = cls(text=MappedText(arrays["text"]),
+                    delimiters=set(metadata["delimiters"]),
+                    threshold=metadata["threshold"])
+        for name, typecode in CompactTreeStore.COLUMNS.items():
+            # viewed like the arrays they replace, so indexing them still gives plain ints
+            setattr(store, name, memoryview(arrays[name]).cast("B").cast(typecode))
+        store.num_nodes = metadata["num_nodes"]
+        store.root_index = {store.text[store.start[child]]: child for child in store.children(CompactTreeStore.ROOT)}
+        return store
+
+    def copy(self):
+        store = CompactTreeStore(text=str(self.text), delimiters=self.delimiters, threshold=self.threshold)
+        for name, typecode in CompactTreeStore.COLUMNS.items():
+            # through bytes, so memory-mapped columns are copied as fast as arrays
+            setattr(store, name, array(typecode, bytes(getattr(self, name))))
+        store.root_index = dict(self.root_index)
+        store.num_nodes = self.num_nodes
+        return store
+
+    def token(self, node_id):
+        if node_id == CompactTreeStore.ROOT:
+            return None
+        end = self.end[node_id]
+        return self.text[end - self.depth[node_id]:end]
+
+    def suffix(self, node_id):
+        if node_id == CompactTreeStore.ROOT:
+            return None
+        return self.text[self.start[node_id]:self.end[node_id]]
+
+    def children(self, node_id):
+        child = self.first_child[node_id]
+        while child != NO_NODE:
+            yield child
+            child = self.next_sibling[child]
+
+    def iter_nodes(self):
+        # every node reachable from the root, not counting the root itself
+        stack = list(self.children(CompactTreeStore.ROOT))
+        while stack:
+            node_id = stack.pop()
+            yield node_id
+            stack.extend(self.children(node_id))
+
+    def find_child(self, node_id, character):
+        if node_id == CompactTreeStore.ROOT:
+            return self.root_index.get(character, NO_NODE)
+        text, start = self.text, self.start
+        for child in self.children(node_id):
+            if text[start[child]] == character:
+                return child
+        return NO_NODE
+
+    def match(self, text, position, node_id):
+        """
+        Follow text from position down the tree, starting at node_id,
+        and return the deepest node whose whole token was matched.
+        """
+        matched = node_id
+        while position < len(text):
+            child = self.find_child(matched, text[position])
+            if child == NO_NODE:
+                break
+            start, end = self.start[child], self.end[child]
+            if not text.startswith(self.text[start:end], position):
+                break
+            position += end - start
+            matched = child
+        return matched
+
+    def find(self, token):
+        if not token:
+            return NO_NODE
+        node_id = self.match(token, 0, CompactTreeStore.ROOT)
+        if self.depth[node_id] != len(token):
+            return NO_NODE
+        return node_id
+
+    def get_tokens(self):
+        return {self.token(node_id) for node_id in self.iter_nodes()}
+
+    def remove_children(self, node_id, keep):
+        # unlink every child of node_id that keep() rejects
+        previous = NO_NODE
+        child = self.first_child[node_id]
+        while child != NO_NODE:
+            following = self.next_sibling[child]
+            if keep(child):
+                previous = child
+            else:
+                if previous == NO_NODE:
+                    self.first_child[node_id] = following
+                else:
+                    self.next_sibling[previous] = following
+                if node_id == CompactTreeStore.ROOT:
+                    del self.root_index[self.text[self.start[child]]]
+            child = following
+
+    def prune(self, threshold=2, node_id=ROOT):
+        """
+        Drop every branch below node_id that falls under threshold, always keeping
+        the alphabet. Pruning from the root then packs the surviving nodes into
+        fresh arrays, which frees the pruned ones and renumbers the rest.
+        """
+        if node_id == CompactTreeStore.ROOT:
+            stack = list(self.children(CompactTreeStore.ROOT))
+        else:
+            stack = [node_id]
+        while stack:
+            current = stack.pop()
+            self.remove_children(current, lambda child: self.frequency[child] >= threshold)
+            stack.extend(self.children(current))
+
+        if DEBUG_VERBOSITY["SuffixNode"]["pruning"] > 1:
+            print(self.get_tokens())
+        if node_id == CompactTreeStore.ROOT:
+            self.pack()
+
+    def pack(self):
+        # renumber the reachable nodes breadth-first, so unlinked ones and their text are freed
+        order = [CompactTreeStore.ROOT]
+        new_ids = {CompactTreeStore.ROOT: CompactTreeStore.ROOT}
+        for node_id in order:
+            for child in self.children(node_id):
+                new_ids[child] = len(order)
+                order.append(child)
+
+        old = (self.start, self.end, self.depth, self.frequency)
+        self.start, self.end, self.depth, self.frequency = (
+            array(column.typecode, (column[node_id] for node_id in order)) for column in old
+        )
+        parent = self.parent
+        self.parent = array("i", (new_ids.get(parent[node_id], NO_NODE) for node_id in order))
+        self.first_child = array("i", [NO_NODE] * len(order))
+        self.next_sibling = array("i", [NO_NODE] * len(order))
+        self.num_nodes = len(order)
+
+        # rebuild the sibling lists in the new numbering
+        for node_id in range(len(order) - 1, 0, -1):
+            parent_id = self.parent[node_id]
+            self.next_sibling[node_id] = self.first_child[parent_id]
+            self.first_child[parent_id] = node_id
+        self.root_index = {self.text[self.start[child]]: child for child in self.children(CompactTreeStore.ROOT)}
+        self.compact_text()
+
+    def add_delimiters(self, delimiters):
+        # like SuffixNode's, each delimiter gets a node with a frequency of 1 on its own path,
+        #   splitting an edge or adding a leaf where pruning left no node for it
+        for delimiter in sorted(delimiters, key=len):
+            node_id = CompactTreeStore.ROOT
+            while self.depth[node_id] < len(delimiter):
+                depth = self.depth[node_id]
+                child = self.find_child(node_id, delimiter[depth])
+                if child == NO_NODE:
+                    position = len(self.text)
+                    self.text += delimiter
+                    node_id = self.new_node(position + depth, position + len(delimiter), len(delimiter),
+                                            node_id, 1)
+                    break
+                matched = common_prefix_length(delimiter[depth:], self.suffix(child))
+                if matched < self.end[child] - self.start[child]:
+                    child = self.split_child(child, matched)
+                node_id = child
+            self.frequency[node_id] = 1
+
+    def tokenize_many(self, texts, max_token_len, min_frequency=None):
+        """
+        FlatTreeStore.tokenize_many over node ids instead of token-keyed lookups.
+        """
+        # looked up once for the whole batch
+        store_text, start, end, depth, frequency = self.text, self.start, self.end, self.depth, self.frequency
+        find_child = self.find_child
+        tokenizations = []
+        for text in texts:
+            if DEBUG_VERBOSITY["FlatTreeStore"] > 1:
+                print(f"Tokenizing {text}")
+
+            if max_token_len < 1:
+                tokenizations.append([text])
+                continue
+
+            tokenization = []
+            position = 0
+            while position < len(text):
+                node_id = CompactTreeStore.ROOT
+                matched = 0
+                while position + matched < len(text):
+                    child = find_child(node_id, text[position + matched])
+                    if child == NO_NODE or depth[child] > max_token_len:
+                        break
+                    if min_frequency is not None and matched > 0 and frequency[child] < min_frequency:
+                        break
+                    if not text.startswith(store_text[start[child]:end[child]], position + matched):
+                        break
+                    node_id = child
+                    matched = depth[child]
+
+                if matched == 0:
+                    tokenization.append(text[position])
+                    position += 1
+                else:
+                    tokenization.append(self.token(node_id))
+                    position += matched
+
+            if DEBUG_VERBOSITY["FlatTreeStore"] > 1:
+                print(tokenization)
+                print()
+
+            tokenizations.append(tokenization)
+        return tokenizations
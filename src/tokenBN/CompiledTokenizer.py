@@ -0,0 +1,114 @@
+import re
+from typing import Dict, Iterable, List, Tuple
+
+import numpy as np
+
+# how deeply tree nodes are nested as optional groups, which re.compile parses recursively
+MAX_NESTING = 200
+
+
+class CompiledTokenizer:
+    """
+    A frozen, picklable tokenizer compiled from a pruned suffix tree, giving
+    the same output as FlatTreeStore.tokenize with no tree kept alive.
+
+    The tree is turned into one regular expression, which re compiles into a
+    flat automaton. Every node becomes its edge label followed by an optional
+    group of its children, so a match follows the tree down for as long as
+    whole edges match, just like the tree walk. Children start with distinct
+    characters, so at most one of them can ever match. Subtrees nested deeper
+    than MAX_NESTING are written out as their tokens, longest first, which
+    picks the same deepest match. Characters outside the alphabet match on
+    their own.
+
+    Tokens can also be encoded as integer ids, taken from token_index_map,
+    such as a DAGStore's, so they line up with its adjacency matrix. Without
+    one, the tokens are numbered in sorted order.
+    """
+    __slots__ = ("tokens", "token_index_map", "max_token_len", "pattern")
+
+    def __init__(self, tree, max_token_len: int = None, token_index_map: Dict[str, int] = None):
+        self.max_token_len = max_token_len
+        child_dict = tree.flat_tree_store.child_dict
+
+        def children(node):
+            for child_token in node.keys_to_my_children:
+                if max_token_len is None or len(child_token) <= max_token_len:
+                    yield child_dict[child_token]
+
+        tokens = []
+        root_patterns = []
+        # [node, nesting, the parent's list of child patterns, the node's own list once expanded]
+        stack = [[node, 1, root_patterns, None] for node in children(tree)]
+        while stack:
+            entry = stack[-1]
+            node, nesting, parent_patterns, patterns = entry
+            if patterns is None and nesting < MAX_NESTING:
+                # come back to the node once its children's patterns are done
+                entry[3] = patterns = []
+                stack.extend([child, nesting + 1, patterns, None] for child in children(node))
+                continue
+            stack.pop()
+
+            if patterns is None:
+                # too deep to nest any further, so list the rest of the subtree instead
+                subtree = [node]
+                for descendant in subtree:
+                    subtree.extend(children(descendant))
+                tokens.extend(descendant.token for descendant in subtree)
+                rests = sorted((descendant.token[len(node.token):] for descendant in subtree[1:]),
+                               key=len, reverse=True)
+                patterns = [re.escape(rest) for rest in rests]
+            else:
+                tokens.append(node.token)
+            parent_patterns.append(CompiledTokenizer.optional(node.suffix, patterns))
+
+        if token_index_map is None:
+            token_index_map = {token: i for i, token in enumerate(sorted(tokens))}
+        self.token_index_map = token_index_map
+        # indexed by id, for decoding
+        self.tokens = tuple(sorted(token_index_map, key=token_index_map.__getitem__))
+        # anything the tree can't match becomes a one-character token
+        self.pattern = re.compile("|".join(root_patterns + ["."]), re.DOTALL)
+
+    @staticmethod
+    def optional(suffix, patterns):
+        if not patterns:
+            return re.escape(suffix)
+        return f"{re.escape(suffix)}(?:{'|'.join(patterns)})?"
+
+    def tokenize(self, text: str) -> List[str]:
+        return self.pattern.findall(text)
+
+    def tokenize_many(self, texts: Iterable[str]) -> List[List[str]]:
+        findall = self.pattern.findall
+        return [findall(text) for text in texts]
+
+    def encode(self, text: str) -> np.ndarray:
+        # tokens without an id, like characters outside the alphabet, raise a KeyError
+        tokenization = self.pattern.findall(text)
+        return np.fromiter(map(self.token_index_map.__getitem__, tokenization),
+                           dtype=np.int32, count=len(tokenization))
+
+    def encode_many(self, texts: Iterable[str]) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Encode every text into one flat array of ids, along with the offsets
+        where each text's ids start, so text i is ids[offsets[i]:offsets[i + 1]].
+        """
+        findall, index = self.pattern.findall, self.token_index_map.__getitem__
+        ids = []
+        offsets = [0]
+        for text in texts:
+            ids.extend(map(index, findall(text)))
+            offsets.append(len(ids))
+        return np.array(ids, dtype=np.int32), np.array(offsets, dtype=np.int64)
+
+    def decode(self, ids: Iterable[int]) -> str:
+        if isinstance(ids, np.ndarray):
+            ids = ids.tolist()
+        return "".join(map(self.tokens.__getitem__, ids))
+
+    def decode_many(self, ids: np.ndarray, offsets: np.ndarray) -> List[str]:
+        tokens = list(map(self.tokens.__getitem__, ids.tolist()))
+        offsets = offsets.tolist()
+        return ["".join(tokens[start:end]) for start, end in zip(offsets, offsets[1:])]
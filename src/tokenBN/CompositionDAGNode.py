@@ -1,13 +1,16 @@
-from collections import deque
-import scipy.sparse as sp
+from sys import intern
 
 from tokenBN.config import DEBUG_VERBOSITY
 
 from .FlatTreeStore import *
 from .DAGStore import *
+from tokenBN.DAGExporter import DAGExporter
+from tokenBN.utils.util import tokenization_pattern
 
 
 class CompositionDAGNode:
+    __slots__ = ("token", "frequency", "pattern", "parents", "flat_tree_store", "dag_store")
+
     def __init__(self,
                  token=None,
                  frequency=0,
@@ -15,6 +18,9 @@ class CompositionDAGNode:
                  flat_tree_store=None,
                  dag_store=None,
                  pattern=None):
+        # share the interned token string with the suffix tree it came from
+        if token is not None:
+            token = intern(token)
         self.token = token
         self.frequency = frequency
         self.pattern = pattern
@@ -47,54 +53,54 @@ class CompositionDAGNode:
         self.dag_store.add_edge(self, child)
 
     def get_pattern(self, tokenization):
-        # map each token to a value based on its order of occurrence
-        component_tokens = dict()
-        i = 0
-        for token in tokenization:
-            if token not in component_tokens:
-                component_tokens[token] = str(i)
-                i += 1
-
         # add the pattern to the current node and the pattern store
-        self.pattern = " ".join([component_tokens[token] for token in tokenization])
+        self.pattern = tokenization_pattern(tokenization)
         self.dag_store.add_pattern(self.pattern, self.token)
 
-    # since this is recursively saving smaller tokens, it's basically depth-first
     def build_subgraph(self, suffix_node=None, suffix_tokenization=[]):
+        """
+        Add an edge into this vertex from each token of its decomposition,
+        first adding a vertex for every token missing from the DAG, along with
+        the edges from its own decomposition. Missing tokens are gathered with
+        an explicit work list and built shortest first, since a decomposition
+        only holds shorter tokens, so every vertex and edge is added just once.
+        """
         vertices = self.dag_store.vertices
+        decomposition_cache = self.dag_store.decomposition_cache
+
+        # gather every token missing from the vertex store, with its decomposition
+        missing = dict()
+        work_list = [token for token in suffix_tokenization if token not in vertices]
+        while work_list:
+            token = work_list.pop()
+            if token in missing or token in vertices:
+                continue
+            # break the missing token into even smaller tokens using the largest available smaller tokens
+            missing[token] = decomposition_cache.tokenize(suffix_node.flat_tree_store, token, len(token) - 1)
+            work_list.extend(part for part in missing[token] if part not in vertices)
+
+        for token in sorted(missing, key=len):
+            # create a new dag node for the missing token and put it in the vertex store
+            vert = CompositionDAGNode(token=token,
+                                      frequency=suffix_node.flat_tree_store.child_dict[token].frequency,
+                                      dag_store=self.dag_store)
+            vertices[token] = vert
+            for part in missing[token]:
+                vertices[part].add_edge(vert)
 
+        # add an edge from each of the current node's predecessors to it
         for token in suffix_tokenization:
-
-            # if the predecessor token is not in the vertex store,
-            #   recursively build a sub-graph of suffix tokens
-            if token not in vertices.keys():
-                # create a new dag node for the current token
-                #   and put it in the vertex store
-                vertices[token] = CompositionDAGNode(token=token,
-                                                     frequency=suffix_node \
-                                                     .flat_tree_store \
-                                                     .child_dict[token] \
-                                                     .frequency,
-                                                     dag_store=self.dag_store)
-
-                # break the missing token into even smaller tokens using the largest available smaller tokens
-                curr_suffix_tokenization = suffix_node.flat_tree_store.tokenize(text=token,
-                                                                                max_token_len=len(token) - 1)
-                # build a subgraph from the smaller tokens
-                temp_vert = vertices[token]
-                temp_vert, additional_vertices = temp_vert.build_subgraph(suffix_node, curr_suffix_tokenization)
-                vertices.update(additional_vertices)
-
-                vertices[token] = temp_vert
-
-            # base case: if the predecessor is in the vertex store
-            #   add an edge from the current node's predecessor to it
             vertices[token].add_edge(self)
 
         return self, vertices
 
-    # do breadth-first accumulation of the suffix tree into the dag
     def suffix_tree_to_dag(self, suffix_tree):
+        """
+        Build the DAG from every token of the suffix tree, in order of increasing
+        length. A token's decomposition only holds shorter tokens, so their
+        vertices always exist by the time it's reached, and each vertex and
+        edge is added exactly once.
+        """
         if DEBUG_VERBOSITY["DAGNode"] > -1:
             print("Building DAG from modified suffix tree...")
 
@@ -106,84 +112,193 @@ class CompositionDAGNode:
         token_list = list(all_tokens)
         self.dag_store.token_index_map = {token_list[i]: i for i in range(len(token_list))}
         self.dag_store.reversed_token_map = {v: k for k, v in self.dag_store.token_index_map.items()}
-        # initialize the adjacency matrix in LIL format
-        #   for more efficient memory usage during composition and later modifications
-        self.dag_store.adjacency_matrix = sp.lil_matrix((len(all_tokens), len(all_tokens)))
-
-        # print("lil adjacency matrix:\n", self.dag_store.adjacency_matrix)
 
         vertices = self.dag_store.vertices
         vertices[self.token] = self
+        self.get_pattern([self.token])
 
-        suffix_node_queue = deque()
-        suffix_node_queue.append(suffix_tree)
+        # bucket the tokens by length, rather than sorting them
+        tokens_by_length = dict()
+        for token in token_list:
+            tokens_by_length.setdefault(len(token), []).append(token)
 
-        while 0 < len(suffix_node_queue):
+        child_dict = suffix_tree.flat_tree_store.child_dict
+        for length in sorted(tokens_by_length):
             if DEBUG_VERBOSITY["DAGNode"] > 1:
-                print(f"SuffixNode DAG Queue state: {[node.token for node in suffix_node_queue]}")
+                print(f"Adding tokens of length {length}: {tokens_by_length[length]}")
+
+            for token in tokens_by_length[length]:
+                suffix_node = child_dict[token]
+
+                # create a dag vertex and add it to the set of vertices
+                vert = CompositionDAGNode(token=token,
+                                          frequency=suffix_node.frequency,
+                                          dag_store=self.dag_store)
+                vertices[token] = vert
+
+                # if it's one of the top-level tokens, add an edge from the base graph's root to it
+                if suffix_node.parent is None or suffix_node.parent.token is None:
+                    vert.get_pattern([token])
+                    self.add_edge(vert)
+                # otherwise, add edges from the largest available smaller tokens that compose it,
+                #   tokenizing directly, since no token comes up here a second time
+                else:
+                    current_tokenization = suffix_node.flat_tree_store.tokenize(token, len(token) - 1)
+                    vert.build_subgraph(suffix_node, current_tokenization)
+                    vert.get_pattern(current_tokenization)
 
-            # get the next suffix node from the queue
-            current_suffix_node = suffix_node_queue.popleft()
-            if current_suffix_node.token is not None and current_suffix_node.token not in all_tokens:
-                raise KeyError(f"{current_suffix_node.token} not in token set {all_tokens}")
+        # assemble the collected edges into a CSR matrix in one go
+        self.dag_store.assemble_adjacency_matrix()
+        if DEBUG_VERBOSITY["DAGNode"] > 1:
+            print("Sparse adjacency matrix:\n", self.dag_store.adjacency_matrix)
 
-            # create a dag vertex and add it to the set of vertices
-            vert = CompositionDAGNode(token=current_suffix_node.token,
-                                      frequency=current_suffix_node.frequency,
-                                      dag_store=self.dag_store)
-            vertices[vert.token] = vert
+        self.dag_store.edge_set = {(pre, cum, pos) for pre, cum, pos in self.dag_store.edge_set if pre is not None}
 
-            # if it's the root of the base dag or one of the top-level tokens, just add it to the vertex dict
-            if current_suffix_node.parent is None or current_suffix_node.parent.token is None:
-                vert.get_pattern([vert.token])
-                vertices[current_suffix_node.token] = vert
-                # add an edge from the base graph's root to the top-level token
+    def update_dag(self, suffix_tree):
+        """
+        Bring a DAG built by suffix_tree_to_dag up to date with the text added
+        to its suffix tree since, touching only the vertices and edges affected.
+
+        The DAG has to have been built from a pruned copy of an unpruned tree,
+        which started tracking its changes right after (SuffixNode.track_changes)
+        and has had text added since (SuffixNode.add_text). Changed tokens that
+        now reach the tree's threshold become new vertices, and the ones that
+        fell under it, when a split moved suffixes off their edge, are removed.
+        An existing token can only decompose differently if a removed token was
+        part of it, or if a new token now extends one of its parts, which is
+        then the new token's closest ancestor that was already a vertex. So
+        only the DAG children of those vertices are decomposed again, and only
+        the ones whose decomposition did change are rewired. New
+        tokens fill the indices removed ones freed, then take the next ones,
+        so the adjacency matrix grows without renumbering anything.
+        """
+        flat_tree_store = suffix_tree.flat_tree_store
+        changed_tokens = flat_tree_store.changed_tokens
+        if changed_tokens is None:
+            raise ValueError("The suffix tree isn't tracking its changes, call track_changes() before adding text")
+
+        threshold = flat_tree_store.threshold
+        dag_store = self.dag_store
+        vertices = dag_store.vertices
+        child_dict = flat_tree_store.child_dict
+
+        def is_top_level(suffix_node):
+            return suffix_node.parent is None or suffix_node.parent.token is None
+
+        # sort the changed tokens into new, removed and recounted ones
+        new_tokens, removed_tokens = [], []
+        for token in changed_tokens:
+            suffix_node = child_dict.get(token)
+            if suffix_node is None or not (is_top_level(suffix_node) or suffix_node.frequency >= threshold):
+                if token in vertices:
+                    removed_tokens.append(token)
+            elif token not in vertices:
+                new_tokens.append(token)
+            # clean() gives the delimiters a fixed frequency
+            elif token not in flat_tree_store.delimiters:
+                vertices[token].frequency = suffix_node.frequency
+        changed_tokens.clear()
+        if DEBUG_VERBOSITY["DAGNode"] > -1:
+            print(f"Adding {len(new_tokens)} tokens to the DAG and removing {len(removed_tokens)}...")
+        if not new_tokens and not removed_tokens:
+            return self
+
+        def decompose(token):
+            return flat_tree_store.tokenize(token, len(token) - 1, min_frequency=threshold)
+
+        # existing tokens a removed token was part of might decompose differently
+        removed_token_set = set(removed_tokens)
+        candidates = {child.token for token in removed_tokens
+                      for child in vertices[token].flat_tree_store.child_dict.values()} - removed_token_set
+        # and so might the ones where a new token extends a part, at that part's offset
+        extended_parts = dict()
+        for token in new_tokens:
+            suffix_node = child_dict[token]
+            if is_top_level(suffix_node):
+                continue
+            ancestor = suffix_node.parent
+            while ancestor.token not in vertices:
+                ancestor = ancestor.parent
+            if ancestor.token is not None and ancestor.token not in removed_token_set:
+                extended_parts.setdefault(ancestor.token, []).append(token)
+        for part, extensions in extended_parts.items():
+            for child in vertices[part].flat_tree_store.child_dict.values():
+                if child.token in removed_token_set:
+                    continue
+                offset = 0
+                for parent in child.parents:
+                    if parent.token == part and any(child.token.startswith(extension, offset)
+                                                    for extension in extensions):
+                        candidates.add(child.token)
+                        break
+                    offset += len(parent.token)
+        rewired = dict()
+        for token in candidates:
+            tokenization = decompose(token)
+            if tokenization != [parent.token for parent in vertices[token].parents]:
+                rewired[token] = tokenization
+
+        # drop the edges into rewired and removed tokens before any are added
+        token_index_map, reversed_token_map = dag_store.token_index_map, dag_store.reversed_token_map
+        for token in (*rewired, *removed_tokens):
+            vert = vertices[token]
+            for position, parent in enumerate(vert.parents):
+                parent.flat_tree_store.child_dict.pop(token, None)
+                dag_store.edge_set.discard((parent.token, token, position))
+            vert.parents = list()
+            dag_store.pattern_map[vert.pattern].discard(token)
+        removed_sources, removed_targets = dag_store.remove_edges_into(
+            [token_index_map[token] for token in (*rewired, *removed_tokens)]
+        )
+        first_new_edge = len(dag_store.edge_sources)
+
+        # removed tokens free their indices for the new ones, and there are always enough new ones
+        #   to fill them, since every split that drops a token under the threshold adds the split node above it
+        num_tokens = dag_store.num_tokens()
+        free_indices = []
+        for token in removed_tokens:
+            del vertices[token]
+            free_indices.append(token_index_map.pop(token))
+            del reversed_token_map[free_indices[-1]]
+        free_indices.sort(reverse=True)
+        for token in new_tokens:
+            if free_indices:
+                index = free_indices.pop()
+            else:
+                index = num_tokens
+                num_tokens += 1
+            reversed_token_map[index] = token
+            token_index_map[token] = index
+
+        # decompositions cached before the tree changed no longer hold
+        dag_store.decomposition_cache.clear()
+
+        # new tokens are built shortest first, so their parts always exist already
+        for token in sorted(new_tokens, key=len):
+            suffix_node = child_dict[token]
+            vert = CompositionDAGNode(token=token,
+                                      frequency=1 if token in flat_tree_store.delimiters else suffix_node.frequency,
+                                      dag_store=dag_store)
+            vertices[token] = vert
+            if is_top_level(suffix_node):
+                vert.get_pattern([token])
                 self.add_edge(vert)
-            # otherwise, add edges
             else:
-                # tokenize the current token using the largest available smaller tokens
-                current_tokenization = current_suffix_node.flat_tree_store.tokenize(current_suffix_node.token,
-                                                                                    len(current_suffix_node.token) - 1)
-
-                temp_vert = vert
-                temp_vert, additional_vertices = temp_vert.build_subgraph(current_suffix_node, current_tokenization)
-                temp_vert.get_pattern(current_tokenization)
-
-                vertices[vert.token] = temp_vert
-                vertices.update(additional_vertices)
+                rewired[token] = decompose(token)
 
-            # add all the current node's children to the queue
-            for child_token in current_suffix_node.keys_to_my_children:
-                if DEBUG_VERBOSITY["DAGNode"] > 1:
-                    print(f"SuffixNode DAG Queue state: {[node.token for node in suffix_node_queue]}")
-                suffix_node_queue.append(current_suffix_node.flat_tree_store.child_dict[child_token])
+        for token, tokenization in rewired.items():
+            vert = vertices[token]
+            for part in tokenization:
+                vertices[part].add_edge(vert)
+            vert.get_pattern(tokenization)
 
-        if DEBUG_VERBOSITY["DAGNode"] > 1:
-            print("lil adjacency matrix after processing: ", self.dag_store.adjacency_matrix)
-        # convert the LIL adjacency matrix to CSR format for more efficient modification
-        self.dag_store.adjacency_matrix = sp.csr_matrix(self.dag_store.adjacency_matrix)
-        if DEBUG_VERBOSITY["DAGNode"] > 1:
-            print("Sparse adjacency matrix:\n", self.dag_store.adjacency_matrix)
+        dag_store.update_adjacency_matrix(num_tokens, first_new_edge, removed_sources, removed_targets)
+        return self
 
-        self.dag_store.edge_set = {(pre, cum, pos) for pre, cum, pos in self.dag_store.edge_set if pre is not None}
-
-    # converts the edge set and vertex set to a file format for Gephi
-    def export_dag(self, filename, output):
-        path = "graphs/" + filename
-        # clear the file
-        with open(path, 'w') as f:
-            f.write("")
-
-        vertices = self.dag_store.vertices
-        lines = set()
-        with open(path, 'a') as f:
-            for edge in self.dag_store.edge_set:
-                if output == "tokens":
-                    lines.add("{edge[0]};{edge[1]}")
-                else:
-                    vert0 = vertices[edge[0]]
-                    vert1 = vertices[edge[1]]
-                    if output == "patterns":
-                        lines.add(f"{vert0.pattern};{vert1.pattern}")
+    def save(self, filename: str):
+        # loads back as a ColumnarDAGStore, with no vertex objects to rebuild
+        self.dag_store.save(filename)
 
-            f.write("\n".join(lines))
+    # writes the DAG to a file for Gephi or other graph tools, a chunk of edges at a time
+    def export_dag(self, path, output="tokens", format=None):
+        DAGExporter(self.dag_store).export(path, output, format)
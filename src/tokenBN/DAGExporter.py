@@ -0,0 +1,175 @@
+import csv
+import os
+import re
+import zipfile
+from typing import Iterator, Tuple
+from xml.sax.saxutils import escape, quoteattr
+
+import numpy as np
+import scipy.sparse as sp
+
+from tokenBN.config import EXPORT_CHUNK_SIZE
+from tokenBN.utils.binary_format import encode_strings
+
+# characters XML 1.0 can't hold at all, even as character references
+INVALID_XML = re.compile("[\x00-\x08\x0b\x0c\x0e-\x1f\ufffe\uffff]")
+
+
+class DAGExporter:
+    """
+    Writes a DAGStore to a file, a chunk of edges at a time, straight from its
+    edge arrays or adjacency matrix, so the edges are never gathered into
+    Python objects all at once.
+
+    Formats, picked by the file's extension unless given:
+    - "csv": Gephi's headerless source;target edge list, like the files in
+      graphs/, with every pair of tokens (or of patterns) written once
+    - "graphml" and "gexf": every edge, with its position in the token it
+      leads to, and every token, with its frequency and pattern
+    - "npz": the same as a compressed NumPy archive, with the edge columns,
+      the frequencies and pattern ids, and the tokens and patterns as
+      UTF-8 string tables
+    """
+    FORMATS = ("csv", "graphml", "gexf", "npz")
+    OUTPUTS = ("tokens", "patterns")
+
+    def __init__(self, dag_store, chunk_size: int = EXPORT_CHUNK_SIZE):
+        self.dag_store = dag_store
+        self.chunk_size = chunk_size
+        if dag_store.adjacency_matrix is None:
+            dag_store.assemble_adjacency_matrix()
+        self.tokens, self.frequency, self.pattern_ids, self.patterns = dag_store.columns()
+
+    def export(self, path: str, output: str = "tokens", format: str = None):
+        if format is None:
+            format = os.path.splitext(path)[1].lstrip(".").lower()
+        if format not in DAGExporter.FORMATS:
+            raise ValueError(f"Unknown export format '{format}', expected one of {DAGExporter.FORMATS}")
+        if output not in DAGExporter.OUTPUTS:
+            raise ValueError(f"Unknown output '{output}', expected one of {DAGExporter.OUTPUTS}")
+        if output == "patterns" and format != "csv":
+            raise ValueError("Only the csv format can export the patterns' graph")
+
+        if format == "npz":
+            self.write_npz(path)
+            return
+        with open(path, "w", encoding="utf-8", newline="") as file:
+            if format == "csv":
+                self.write_csv(file, output)
+            elif format == "graphml":
+                self.write_graphml(file)
+            else:
+                self.write_gexf(file)
+
+    def edge_chunks(self) -> Iterator[Tuple[np.ndarray, np.ndarray, np.ndarray]]:
+        # every edge, repeats included, as (sources, targets, positions) chunks
+        dag_store = self.dag_store
+        for start in range(0, len(dag_store.edge_sources), self.chunk_size):
+            end = start + self.chunk_size
+            yield tuple(np.asarray(column[start:end], dtype=np.int32)
+                        for column in (dag_store.edge_sources, dag_store.edge_targets, dag_store.edge_positions))
+
+    def pair_chunks(self, matrix) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+        # each nonzero of a CSR matrix once, as (rows, columns) chunks
+        for start in range(0, matrix.nnz, self.chunk_size):
+            end = min(start + self.chunk_size, matrix.nnz)
+            rows = np.searchsorted(matrix.indptr, np.arange(start, end), side="right") - 1
+            yield rows, matrix.indices[start:end]
+
+    def write_csv(self, file, output: str = "tokens"):
+        if output == "tokens":
+            names = self.tokens
+            pairs = sp.csr_matrix(self.dag_store.adjacency_matrix)
+        else:
+            names = self.patterns
+            # each chunk of edges gives its distinct pattern pairs, and they're all combined
+            #   into one sparse matrix at the end, rather than adding up a matrix per chunk
+            pattern_ids = np.asarray(self.pattern_ids, dtype=np.int64)
+            num_patterns = len(names)
+            pair_keys = [np.unique(pattern_ids[sources] * num_patterns + pattern_ids[targets])
+                         for sources, targets, _ in self.edge_chunks()]
+            pair_keys = np.concatenate(pair_keys) if pair_keys else np.zeros(0, dtype=np.int64)
+            pairs = sp.csr_matrix((np.ones(len(pair_keys), dtype=np.int64),
+                                   (pair_keys // num_patterns, pair_keys % num_patterns)),
+                                  shape=(num_patterns, num_patterns))
+        pairs.sort_indices()
+
+        # the same lines as before, only quoting names holding a ; or a line break
+        writer = csv.writer(file, delimiter=";", lineterminator="\n", quoting=csv.QUOTE_MINIMAL)
+        for rows, columns in self.pair_chunks(pairs):
+            writer.writerows((names[row], names[column]) for row, column in zip(rows.tolist(), columns.tolist()))
+
+    @staticmethod
+    def xml_safe(text) -> str:
+        # written out as an escape sequence instead
+        return INVALID_XML.sub(lambda match: f"\\x{ord(match.group()):02x}", text)
+
+    def write_graphml(self, file):
+        file.write('<?xml version="1.0" encoding="UTF-8"?>\n'
+                   '<graphml xmlns="http://graphml.graphdrawing.org/xmlns">\n'
+                   '  <key id="token" for="node" attr.name="token" attr.type="string"/>\n'
+                   '  <key id="frequency" for="node" attr.name="frequency" attr.type="int"/>\n'
+                   '  <key id="pattern" for="node" attr.name="pattern" attr.type="string"/>\n'
+                   '  <key id="position" for="edge" attr.name="position" attr.type="int"/>\n'
+                   '  <graph id="dag" edgedefault="directed">\n')
+        for token_id, (token, frequency, pattern_id) in enumerate(zip(self.tokens, self.frequency.tolist(),
+                                                                      self.pattern_ids.tolist())):
+            file.write(f'    <node id="n{token_id}"><data key="token">{escape(self.xml_safe(token))}</data>'
+                       f'<data key="frequency">{frequency}</data>'
+                       f'<data key="pattern">{escape(self.patterns[pattern_id])}</data></node>\n')
+        for sources, targets, positions in self.edge_chunks():
+            file.writelines(f'    <edge source="n{source}" target="n{target}"><data key="position">{position}</data></edge>\n'
+                            for source, target, position in zip(sources.tolist(), targets.tolist(), positions.tolist()))
+        file.write('  </graph>\n</graphml>\n')
+
+    def write_gexf(self, file):
+        file.write('<?xml version="1.0" encoding="UTF-8"?>\n'
+                   '<gexf xmlns="http://gexf.net/1.3" version="1.3">\n'
+                   '  <graph mode="static" defaultedgetype="directed">\n'
+                   '    <attributes class="node">\n'
+                   '      <attribute id="frequency" title="frequency" type="integer"/>\n'
+                   '      <attribute id="pattern" title="pattern" type="string"/>\n'
+                   '    </attributes>\n'
+                   '    <attributes class="edge">\n'
+                   '      <attribute id="position" title="position" type="integer"/>\n'
+                   '    </attributes>\n'
+                   '    <nodes>\n')
+        for token_id, (token, frequency, pattern_id) in enumerate(zip(self.tokens, self.frequency.tolist(),
+                                                                      self.pattern_ids.tolist())):
+            file.write(f'      <node id="{token_id}" label={quoteattr(self.xml_safe(token))}><attvalues>'
+                       f'<attvalue for="frequency" value="{frequency}"/>'
+                       f'<attvalue for="pattern" value="{self.patterns[pattern_id]}"/>'
+                       f'</attvalues></node>\n')
+        file.write('    </nodes>\n    <edges>\n')
+        edge_id = 0
+        for sources, targets, positions in self.edge_chunks():
+            file.writelines(f'      <edge id="{edge_id + i}" source="{source}" target="{target}"><attvalues>'
+                            f'<attvalue for="position" value="{position}"/></attvalues></edge>\n'
+                            for i, (source, target, position)
+                            in enumerate(zip(sources.tolist(), targets.tolist(), positions.tolist())))
+            edge_id += len(sources)
+        file.write('    </edges>\n  </graph>\n</gexf>\n')
+
+    def write_npz(self, path: str):
+        """
+        Write a compressed archive np.load can read, streaming each edge column
+        into its own member chunk by chunk rather than building it in memory.
+        """
+        num_edges = len(self.dag_store.edge_sources)
+        with zipfile.ZipFile(path, "w", compression=zipfile.ZIP_DEFLATED, allowZip64=True) as archive:
+            for column, name in enumerate(("sources", "targets", "positions")):
+                with archive.open(f"{name}.npy", "w", force_zip64=True) as member:
+                    np.lib.format.write_array_header_2_0(member, {
+                        "descr": np.dtype(np.int32).str, "fortran_order": False, "shape": (num_edges,)
+                    })
+                    for chunk in self.edge_chunks():
+                        member.write(chunk[column].tobytes())
+
+            token_data, token_offsets = encode_strings(self.tokens)
+            pattern_data, pattern_offsets = encode_strings(self.patterns)
+            for name, array in (("frequency", np.asarray(self.frequency, dtype=np.int32)),
+                                ("pattern_ids", np.asarray(self.pattern_ids, dtype=np.int32)),
+                                ("token_data", token_data), ("token_offsets", token_offsets),
+                                ("pattern_data", pattern_data), ("pattern_offsets", pattern_offsets)):
+                with archive.open(f"{name}.npy", "w", force_zip64=True) as member:
+                    np.lib.format.write_array(member, array)
@@ -1,10 +1,20 @@
+from array import array
+
+import numpy as np
+import scipy.sparse as sp
+
+from tokenBN.DecompositionCache import DecompositionCache
+from tokenBN.utils.binary_format import encode_strings, write_arrays
+
+
 class DAGStore:
     def __init__(self,
                  vertices=None,
                  edge_set=None,
                  token_index_map=None,
                  adjacency_matrix=None,
-                 pattern_map=None):
+                 pattern_map=None,
+                 decomposition_cache=None):
 
         if vertices is None:
             vertices = dict()
@@ -15,24 +25,230 @@ class DAGStore:
         self.edge_set = edge_set
         self.token_index_map = token_index_map
         self.reversed_token_map = None
+
+        # edge changes update_adjacency_matrix has recorded since the matrix was last read,
+        #   as parallel arrays of sources, targets and counts, and the size they grow it to
+        self.changed_sources = array("i")
+        self.changed_targets = array("i")
+        self.changed_counts = array("i")
+        self.changed_num_tokens = None
         # first dimension = outgoing token node
         # second dimension = incoming token node
         self.adjacency_matrix = adjacency_matrix
 
+        # edges as parallel arrays of token indices, collected while the DAG is built
+        #   and assembled into the adjacency matrix in one go
+        self.edge_sources = array("i")
+        self.edge_targets = array("i")
+        # each edge's position in the incoming token, as recorded in the edge set
+        self.edge_positions = array("i")
+        # once edges are removed, each token's first edge row, and each row's next one
+        #   into the same token, so a token's edges are found without a scan
+        self.edge_heads = None
+        self.edge_next = None
+
         if pattern_map is None:
             pattern_map = dict()
         self.pattern_map = pattern_map
 
+        # token decompositions shared by the whole DAG build
+        if decomposition_cache is None:
+            decomposition_cache = DecompositionCache()
+        self.decomposition_cache = decomposition_cache
+
     def add_edge(self, node, child):
         # Add an edge to the edge list, using the current token's position
         #   in the child token as the edge weight
         if node.token is not None and child.token is not None:
-            self.edge_set.add((node.token, child.token, len(child.parents) - 1))
-            self.adjacency_matrix[
-                self.token_index_map[node.token], self.token_index_map[child.token]] = 1
+            position = len(child.parents) - 1
+            self.edge_set.add((node.token, child.token, position))
+            self.edge_sources.append(self.token_index_map[node.token])
+            self.edge_targets.append(self.token_index_map[child.token])
+            self.edge_positions.append(position)
+            if self.edge_heads is not None:
+                self.link_edge(len(self.edge_targets) - 1)
         # else:
         #     print(f"Originating token: {node.token}\n Destination token: {child.token}")
 
+    @property
+    def adjacency_matrix(self):
+        # changes recorded by update_adjacency_matrix are only folded in once the matrix is read
+        if self.changed_num_tokens is not None:
+            self.fold_adjacency_changes()
+        return self.csr_adjacency_matrix
+
+    @adjacency_matrix.setter
+    def adjacency_matrix(self, adjacency_matrix):
+        self.csr_adjacency_matrix = adjacency_matrix
+        self.clear_adjacency_changes()
+
+    def assemble_adjacency_matrix(self):
+        """
+        Build the CSR adjacency matrix from every edge added so far. An edge added
+        more than once, like a token appearing twice in a longer one, is counted
+        rather than overwritten.
+        """
+        num_tokens = len(self.token_index_map)
+        sources, targets, _ = self.edge_arrays()
+        self.adjacency_matrix = sp.csr_matrix(
+            (np.ones(len(sources), dtype=np.int32), (sources, targets)),
+            shape=(num_tokens, num_tokens)
+        )
+        return self.adjacency_matrix
+
+    def num_tokens(self):
+        # the size of the adjacency matrix, counting changes that haven't been folded in
+        if self.changed_num_tokens is not None:
+            return self.changed_num_tokens
+        return self.csr_adjacency_matrix.shape[0]
+
+    def index_edges(self):
+        # link each token's edge rows, in one pass over the targets
+        targets = np.array(self.edge_targets, dtype=np.int32)
+        order = np.argsort(targets, kind="stable")
+        next_rows = np.full(len(targets), -1, dtype=np.int32)
+        same_target = targets[order[1:]] == targets[order[:-1]]
+        next_rows[order[:-1][same_target]] = order[1:][same_target]
+        heads = np.full(self.num_tokens(), -1, dtype=np.int32)
+        heads[targets[order[::-1]]] = order[::-1]
+        self.edge_heads = array("i", heads.tobytes())
+        self.edge_next = array("i", next_rows.tobytes())
+
+    def link_edge(self, row):
+        # put a new edge row at the head of its target's list
+        target = self.edge_targets[row]
+        if target >= len(self.edge_heads):
+            self.edge_heads.extend([-1] * (target + 1 - len(self.edge_heads)))
+        self.edge_next.append(self.edge_heads[target])
+        self.edge_heads[target] = row
+
+    def remove_edges_into(self, token_ids):
+        """
+        Drop every edge into the given tokens from the edge arrays, returning the
+        sources and targets of the edges dropped. Each token's rows are followed
+        from its head, and kept rows past the new end are moved down into the
+        gaps, so the cost tracks the edges removed rather than the edges kept.
+        """
+        if self.edge_heads is None:
+            self.index_edges()
+        heads, next_rows = self.edge_heads, self.edge_next
+        columns = (self.edge_sources, self.edge_targets, self.edge_positions)
+
+        removed_rows = []
+        for token_id in token_ids:
+            row = heads[token_id]
+            while row != -1:
+                removed_rows.append(row)
+                row = next_rows[row]
+            heads[token_id] = -1
+        removed_sources = np.array([self.edge_sources[row] for row in removed_rows], dtype=np.int32)
+        removed_targets = np.array([self.edge_targets[row] for row in removed_rows], dtype=np.int32)
+
+        num_edges = len(self.edge_sources) - len(removed_rows)
+        removed_row_set = set(removed_rows)
+        gaps = [row for row in removed_rows if row < num_edges]
+        kept_rows = [row for row in range(num_edges, len(self.edge_sources)) if row not in removed_row_set]
+        for gap, row in zip(gaps, kept_rows):
+            # whatever pointed at the moved row points at its new place
+            target = self.edge_targets[row]
+            if heads[target] == row:
+                heads[target] = gap
+            else:
+                previous = heads[target]
+                while next_rows[previous] != row:
+                    previous = next_rows[previous]
+                next_rows[previous] = gap
+            next_rows[gap] = next_rows[row]
+            for column in columns:
+                column[gap] = column[row]
+        for column in (*columns, next_rows):
+            del column[num_edges:]
+        return removed_sources, removed_targets
+
+    def update_adjacency_matrix(self, num_tokens, first_new_edge, removed_sources, removed_targets):
+        """
+        Record that edges were dropped and the edges from first_new_edge on were
+        added, growing the matrix to num_tokens. The changes pile up until the
+        matrix is next read, and are then folded into it in one go.
+        """
+        new_sources, new_targets = self.edge_sources[first_new_edge:], self.edge_targets[first_new_edge:]
+        self.changed_sources.extend(new_sources)
+        self.changed_targets.extend(new_targets)
+        self.changed_counts.extend([1] * len(new_sources))
+        self.changed_sources.extend(removed_sources.tolist())
+        self.changed_targets.extend(removed_targets.tolist())
+        self.changed_counts.extend([-1] * len(removed_sources))
+        self.changed_num_tokens = num_tokens
+
+    def fold_adjacency_changes(self):
+        num_tokens = self.changed_num_tokens
+        adjacency_matrix = self.csr_adjacency_matrix
+        adjacency_matrix.resize((num_tokens, num_tokens))
+        change = sp.csr_matrix(
+            (np.array(self.changed_counts, dtype=np.int32),
+             (np.array(self.changed_sources, dtype=np.int32), np.array(self.changed_targets, dtype=np.int32))),
+            shape=(num_tokens, num_tokens)
+        )
+        adjacency_matrix = adjacency_matrix + change
+        adjacency_matrix.eliminate_zeros()
+        self.adjacency_matrix = adjacency_matrix
+
+    def clear_adjacency_changes(self):
+        for column in (self.changed_sources, self.changed_targets, self.changed_counts):
+            del column[:]
+        self.changed_num_tokens = None
+
+    def columns(self):
+        """
+        The DAG's vertices as columns in index order: the tokens,
+        their frequencies, the id of each one's pattern, and the patterns.
+        """
+        tokens = [self.reversed_token_map[token_id] for token_id in range(len(self.token_index_map))]
+        frequency = np.array([self.vertices[token].frequency for token in tokens], dtype=np.int32)
+        pattern_index = dict()
+        pattern_ids = np.array([pattern_index.setdefault(self.vertices[token].pattern, len(pattern_index))
+                                for token in tokens], dtype=np.int32)
+        return tokens, frequency, pattern_ids, list(pattern_index)
+
+    def save(self, filename: str):
+        """
+        Write the DAG to a binary file: its string tables, vertex columns, edges
+        grouped by target in position order, and CSR adjacency matrix, each laid
+        out to be memory-mapped. ColumnarDAGStore.load maps it back into memory.
+        """
+        if self.adjacency_matrix is None:
+            self.assemble_adjacency_matrix()
+        tokens, frequency, pattern_ids, patterns = self.columns()
+        sources, targets, positions = self.edge_arrays()
+        order = np.lexsort((positions, targets))
+        parent_starts = np.zeros(len(tokens) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(targets, minlength=len(tokens)), out=parent_starts[1:])
+
+        token_data, token_offsets = encode_strings(tokens)
+        pattern_data, pattern_offsets = encode_strings(patterns)
+        adjacency_matrix = sp.csr_matrix(self.adjacency_matrix)
+        write_arrays(filename, "dag", {"num_tokens": len(tokens)}, {
+            "token_data": token_data,
+            "token_offsets": token_offsets,
+            "frequency": frequency,
+            "pattern_ids": pattern_ids,
+            "pattern_data": pattern_data,
+            "pattern_offsets": pattern_offsets,
+            "edge_sources": sources[order],
+            "edge_targets": targets[order],
+            "edge_positions": positions[order],
+            "parent_starts": parent_starts,
+            "adjacency_data": adjacency_matrix.data,
+            "adjacency_indices": adjacency_matrix.indices,
+            "adjacency_indptr": adjacency_matrix.indptr,
+        })
+
+    def edge_arrays(self):
+        # copies rather than views, since the arrays can't grow while a view is held,
+        #   with the positions as a weight channel alongside the edges
+        return tuple(np.array(column, dtype=np.int32)
+                     for column in (self.edge_sources, self.edge_targets, self.edge_positions))
+
     def add_pattern(self, pattern, token):
         if pattern in self.pattern_map:
             self.pattern_map[pattern].add(token)
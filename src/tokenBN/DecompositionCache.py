@@ -0,0 +1,57 @@
+from collections import OrderedDict
+
+from tokenBN.config import DECOMPOSITION_CACHE_SIZE
+
+
+class DecompositionCache:
+    """
+    A bounded, least-recently-used cache of token decompositions, keyed by
+    (token, max_token_len), shared by every vertex of a DAG while it's built.
+    It holds decompositions from one tree's store at a time: asking with a
+    different store drops the entries from the last one, so they can't go
+    stale. A tree changed in place, like by update_dag, still needs clear().
+
+    build_subgraph breaks each missing token into its largest smaller tokens,
+    and DAGs built over the same tree can share one cache, so each sub-token
+    is only decomposed once between them. suffix_tree_to_dag decomposes
+    every token just once anyway, so it doesn't use the cache.
+    The hit and miss counts show how well max_size fits.
+    Decompositions are returned as tuples, since every caller shares them.
+    """
+    def __init__(self, max_size: int = DECOMPOSITION_CACHE_SIZE):
+        self.max_size = max_size
+        # the store the entries were decomposed with
+        self.flat_tree_store = None
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def tokenize(self, flat_tree_store, token, max_token_len):
+        if flat_tree_store is not self.flat_tree_store:
+            self.entries.clear()
+            self.flat_tree_store = flat_tree_store
+
+        key = (token, max_token_len)
+        tokenization = self.entries.get(key)
+        if tokenization is not None:
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return tokenization
+
+        self.misses += 1
+        tokenization = tuple(flat_tree_store.tokenize(token, max_token_len))
+        self.entries[key] = tokenization
+        if len(self.entries) > self.max_size:
+            # evict the least recently used decomposition
+            self.entries.popitem(last=False)
+        return tokenization
+
+    def clear(self):
+        # decompositions only hold for the tree they came from
+        self.flat_tree_store = None
+        self.entries.clear()
+        self.hits = 0
+        self.misses = 0
@@ -0,0 +1,67 @@
+from typing import Iterable
+
+import numpy as np
+
+from tokenBN.SparseCOOTensor import SparseCOOTensor
+
+
+class EmbeddingTensor:
+    """
+    A 3-D sparse embedding tensor grouped by its first coordinate, the seed
+    token, like a CSR matrix with a third dimension.
+
+    Each seed's entries sit together in the rows, cols and values arrays,
+    between seed_starts[seed] and seed_starts[seed + 1], so a token's slice
+    is found with two offset lookups instead of a scan over every entry.
+    """
+    __slots__ = ("num_tokens", "seed_starts", "rows", "cols", "values")
+
+    def __init__(self, indices: np.ndarray, values: np.ndarray, num_tokens: int):
+        indices = np.asarray(indices, dtype=np.int64).reshape(-1, 3)
+        # stable, so each seed's entries keep their order
+        order = np.argsort(indices[:, 0], kind="stable")
+        self.num_tokens = num_tokens
+        self.rows = indices[order, 1]
+        self.cols = indices[order, 2]
+        self.values = np.asarray(values)[order]
+
+        self.seed_starts = np.zeros(num_tokens + 1, dtype=np.int64)
+        np.cumsum(np.bincount(indices[:, 0], minlength=num_tokens), out=self.seed_starts[1:])
+
+    @classmethod
+    def from_sparse_tensor(cls, tensor) -> 'EmbeddingTensor':
+        # a TensorFlow tensor is converted once, rather than once for every slice
+        if not isinstance(tensor, SparseCOOTensor):
+            tensor = SparseCOOTensor.from_tf(tensor)
+        return cls(tensor.indices, tensor.values, tensor.dense_shape[0])
+
+    def __len__(self):
+        return self.num_tokens
+
+    def nnz(self, token_id: int) -> int:
+        return int(self.seed_starts[token_id + 1] - self.seed_starts[token_id])
+
+    def slice(self, token_id: int) -> SparseCOOTensor:
+        """
+        The [num_tokens, num_tokens] embedding of one token,
+        the same as get_tensor_slice gives for it.
+        """
+        start, end = self.seed_starts[token_id], self.seed_starts[token_id + 1]
+        return SparseCOOTensor(np.stack([self.rows[start:end], self.cols[start:end]], axis=1),
+                               self.values[start:end],
+                               (self.num_tokens, self.num_tokens))
+
+    def slices(self, token_ids: Iterable[int]) -> SparseCOOTensor:
+        """
+        The embeddings of a batch of tokens, stacked into one
+        [len(token_ids), num_tokens, num_tokens] tensor in the order given.
+        """
+        token_ids = np.asarray(token_ids, dtype=np.int64).reshape(-1)
+        starts, ends = self.seed_starts[token_ids], self.seed_starts[token_ids + 1]
+        counts = ends - starts
+        # the position of every entry of the batch in the grouped arrays
+        positions = np.repeat(starts - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())
+        batch = np.repeat(np.arange(len(token_ids), dtype=np.int64), counts)
+        return SparseCOOTensor(np.stack([batch, self.rows[positions], self.cols[positions]], axis=1),
+                               self.values[positions],
+                               (len(token_ids), self.num_tokens, self.num_tokens))
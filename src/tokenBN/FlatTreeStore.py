@@ -1,7 +1,13 @@
 from tokenBN.config import DEBUG_VERBOSITY
 
+# shared by every store that has no delimiters of its own, such as the DAG vertices'
+NO_DELIMITERS = frozenset()
+
+
 class FlatTreeStore:
-    def __init__(self, child_dict=None, root=None):
+    __slots__ = ("child_dict", "root", "delimiters", "threshold", "substring_counts", "changed_tokens")
+
+    def __init__(self, child_dict=None, root=None, delimiters=None, threshold=2):
 
         # a flattened tree of nodes,
         #   so that a node's tree membership can be checked more easily
@@ -10,50 +16,77 @@ class FlatTreeStore:
         self.child_dict = child_dict
         self.root = root
 
-    def tokenize(self, text, max_token_len):
+        # settings shared by every node in the tree
+        if delimiters is None:
+            delimiters = NO_DELIMITERS
+        self.delimiters = delimiters
+        self.threshold = threshold
+        # set while a tree is built with method="threshold"
+        self.substring_counts = None
+        # tokens created or recounted since the last DAG update, once the tree tracks its changes
+        self.changed_tokens = None
+
+    def tokenize(self, text, max_token_len, min_frequency=None):
+        return self.tokenize_many((text,), max_token_len, min_frequency)[0]
+
+    def tokenize_many(self, texts, max_token_len, min_frequency=None):
+        """
+        Greedily tokenize each text: from every position, follow the tree down
+        for as long as whole tokens of at most max_token_len characters match,
+        and emit the deepest one. Only an offset moves through the text, so no
+        part of it is ever copied. Characters outside the tree's alphabet
+        become tokens of their own.
+        min_frequency, if given, tokenizes an unpruned tree as if it were pruned
+        at that threshold, by never following an edge below it past the alphabet.
+        """
         if self.root is None:
             raise ValueError("No root node provided to FlatTreeStore object")
 
-        if DEBUG_VERBOSITY["FlatTreeStore"] > 1:
-            print(f"Tokenizing {text}")
-
-        if max_token_len < 1:
+        # looked up once for the whole batch
+        root, child_dict = self.root, self.child_dict
+        tokenizations = []
+        for text in texts:
             if DEBUG_VERBOSITY["FlatTreeStore"] > 1:
-                print(f"Text was too short")
-            return [text]
-
-        tokenization = []
-        current_node = self.root
-
-        # add the token to the tokenization list
-        def add_token(token):
-            nonlocal text, current_node, tokenization
-            tokenization.append(token)
-            text = text[len(token):]
-            current_node = self.root
-
-        prev_token = None
-        while len(text) > 0:
-            split_index, child_token = current_node.longest_common_prefix(text, doSuffix=False)
+                print(f"Tokenizing {text}")
+
+            if max_token_len < 1:
+                if DEBUG_VERBOSITY["FlatTreeStore"] > 1:
+                    print(f"Text was too short")
+                tokenizations.append([text])
+                continue
+
+            tokenization = []
+            position = 0
+            while position < len(text):
+                current_node = root
+                depth = 0
+                while position + depth < len(text):
+                    # the next character picks the only child edge that can match
+                    child_index = current_node.child_index
+                    if child_index is None:
+                        break
+                    child_token = child_index.get(text[position + depth])
+                    if child_token is None or len(child_token) > max_token_len:
+                        break
+                    child = child_dict[child_token]
+                    if min_frequency is not None and depth > 0 and child.frequency < min_frequency:
+                        break
+                    # a partly matched edge can't be emitted, so stop above it
+                    if not text.startswith(child.suffix, position + depth):
+                        break
+                    current_node = child
+                    depth = len(child_token)
+
+                if depth == 0:
+                    tokenization.append(text[position])
+                    position += 1
+                else:
+                    tokenization.append(current_node.token)
+                    position += depth
+
             if DEBUG_VERBOSITY["FlatTreeStore"] > 1:
-                print(split_index, child_token)
-
-            # if the max token length has been exceeded
-            if split_index > max_token_len:
-                # add the second-longest token
-                add_token(prev_token)
-            # if there's a child of the current node with a shared prefix
-            elif split_index > 0:
-                # move to the next child
-                prev_token = child_token
-                current_node = self.child_dict[child_token]
-            # if there's no common prefix
-            else:
-                # add a token and reset the token pointers
-                add_token(current_node.token)
-
-        if DEBUG_VERBOSITY["FlatTreeStore"] > 1:
-            print(tokenization)
-            print()
-
-        return tokenization
+                print(tokenization)
+                print()
+
+            tokenizations.append(tokenization)
+        return tokenizations
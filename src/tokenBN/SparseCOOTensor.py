@@ -0,0 +1,57 @@
+from typing import Sequence
+
+import numpy as np
+
+
+class SparseCOOTensor:
+    """
+    A sparse tensor of any rank in coordinate format, held in NumPy arrays.
+
+    It has the indices, values and dense_shape of a tf.sparse.SparseTensor,
+    with the indices always in row-major order, so everything the embeddings
+    need can be done without loading TensorFlow. to_tf() and from_tf()
+    convert to and from TensorFlow's tensors for code that wants them.
+    """
+    __slots__ = ("indices", "values", "dense_shape")
+
+    def __init__(self, indices, values, dense_shape: Sequence[int], is_sorted: bool = False):
+        self.dense_shape = tuple(int(dim) for dim in dense_shape)
+        indices = np.asarray(indices, dtype=np.int64).reshape(-1, len(self.dense_shape))
+        values = np.asarray(values)
+        if not is_sorted and len(indices) > 1:
+            # lexsort takes its most significant key last
+            order = np.lexsort(indices.T[::-1])
+            indices, values = indices[order], values[order]
+        self.indices = indices
+        self.values = values
+
+    def __repr__(self):
+        return f"SparseCOOTensor(nnz={len(self.values)}, dense_shape={self.dense_shape})"
+
+    @property
+    def nnz(self) -> int:
+        return len(self.values)
+
+    def to_dense(self) -> np.ndarray:
+        dense = np.zeros(self.dense_shape, dtype=self.values.dtype)
+        dense[tuple(self.indices.T)] = self.values
+        return dense
+
+    def to_tf(self):
+        # TensorFlow is only loaded by the code that asks for its tensors
+        import tensorflow as tf
+        return tf.sparse.SparseTensor(indices=self.indices, values=self.values, dense_shape=self.dense_shape)
+
+    @classmethod
+    def from_tf(cls, tensor) -> 'SparseCOOTensor':
+        return cls(tensor.indices.numpy(), tensor.values.numpy(), tensor.dense_shape.numpy())
+
+    def slice(self, index: int) -> 'SparseCOOTensor':
+        """
+        The sub-tensor at index along the first dimension. The indices are
+        sorted, so its entries are one run, found by binary search.
+        """
+        seeds = self.indices[:, 0]
+        start, end = np.searchsorted(seeds, index, side="left"), np.searchsorted(seeds, index, side="right")
+        return SparseCOOTensor(self.indices[start:end, 1:], self.values[start:end], self.dense_shape[1:],
+                               is_sorted=True)
@@ -0,0 +1,55 @@
+from collections import Counter
+from typing import Iterable, List
+
+from tokenBN.config import SUBSTRING_COUNT_LEN
+
+
+class SubstringCounts:
+    """
+    Occurrence counts for every substring of up to max_len characters in a set
+    of clauses, taken in one cheap pass before a suffix tree is built.
+
+    A string's occurrences are the suffixes it's a prefix of, which is the
+    frequency of the suffix tree node whose edge it starts. Longer strings
+    can't occur more often than any of their max_len-character windows, so
+    a string with a window below the threshold can never reach it either.
+    """
+    def __init__(self, clauses: Iterable[str], threshold: int, max_len: int = SUBSTRING_COUNT_LEN):
+        self.threshold = threshold
+        self.max_len = max_len
+
+        counts = Counter()
+        for clause in clauses:
+            for length in range(1, min(max_len, len(clause)) + 1):
+                counts.update(clause[i:i + length] for i in range(len(clause) - length + 1))
+        self.counts = counts
+
+    def frequent_prefix_lengths(self, clause: str) -> List[int]:
+        """
+        For every start in the clause, the length of the longest prefix of the
+        suffix starting there that could still occur threshold times.
+        """
+        counts, threshold, max_len = self.counts, self.threshold, self.max_len
+
+        # the first window at or after each start that falls below the threshold
+        num_windows = max(len(clause) - max_len + 1, 0)
+        next_rare = [num_windows] * (num_windows + 1)
+        for start in range(num_windows - 1, -1, -1):
+            if counts[clause[start:start + max_len]] < threshold:
+                next_rare[start] = start
+            else:
+                next_rare[start] = next_rare[start + 1]
+
+        lengths = []
+        for start in range(len(clause)):
+            # prefixes up to max_len characters long are counted exactly
+            short_len = min(max_len, len(clause) - start)
+            length = 0
+            while length < short_len and counts[clause[start:start + length + 1]] >= threshold:
+                length += 1
+
+            # longer ones last until their window runs into a rare one
+            if length == max_len and start < num_windows:
+                length = next_rare[start] - start + max_len - 1
+            lengths.append(length)
+        return lengths
@@ -1,109 +1,403 @@
-import re
-from typing import List
-
-from tokenBN.config import DEBUG_VERBOSITY
-
-from tokenBN.FlatTreeStore import FlatTreeStore
+from functools import partial
+from itertools import islice
+from multiprocessing import Pool
+from sys import intern
+from typing import Iterable, List, TextIO, Union
+
+from tokenBN.config import DEBUG_VERBOSITY, PARALLEL_SHARD_SIZE, STREAM_CHUNK_SIZE, UKKONEN_BATCH_SIZE
+
+from tokenBN.CompiledTokenizer import CompiledTokenizer
+from tokenBN.FlatTreeStore import FlatTreeStore, NO_DELIMITERS
+from tokenBN.SubstringCounts import SubstringCounts
+from tokenBN.ThresholdIndex import ThresholdIndex
+from tokenBN.UkkonenTree import UkkonenTree
+from tokenBN.CompactTreeStore import CompactTreeStore
+from tokenBN.CompactSuffixNode import CompactSuffixNode
 from tokenBN.utils.util import *
 
 
 class SuffixNode:
+    BUILD_METHODS = ("insert", "ukkonen", "threshold")
+    BACKENDS = ("objects", "compact")
+
+    __slots__ = (
+        "suffix",
+        "token",
+        "frequency",
+        "parent",
+        "edge_ends",
+        "child_index",
+        "flat_tree_store",
+    )
+
     def __init__(self,
             suffix=None,
             token=None,
             frequency:int=0,
             parent=None,
-            keys_to_my_children=None,
+            child_index=None,
             flat_tree_store=None,
-            delimiters: Set[str] = set(),
-            threshold: int = 2,
+            delimiters: Set[str] = None,
+            threshold: int = None,
         ):
         self.suffix = suffix
         self.token = token
         self.frequency = frequency
-        self.delimiters = delimiters
-        self.threshold = threshold
 
         self.parent = parent
 
-        # store tokens representing keys to children in the child_dict
-        if keys_to_my_children is None:
-            keys_to_my_children = set()
-        self.keys_to_my_children = keys_to_my_children
+        # offsets into this node's edge at which shorter suffixes stopped,
+        #   so that splitting the edge later doesn't overcount the lower half
+        self.edge_ends = None
+
+        # map the first character of each child's edge to the child's token, a key to it in the child_dict,
+        #   so the next edge can be picked without scanning every child;
+        #   leaves have none until they get their first child
+        self.child_index = child_index
 
         # store the child_dict separately
         if flat_tree_store is None:
             flat_tree_store = FlatTreeStore()
         self.flat_tree_store = flat_tree_store
 
+        # the delimiters and threshold are shared by the whole tree, so they live on the store
+        if delimiters is not None:
+            flat_tree_store.delimiters = delimiters
+        if threshold is not None:
+            flat_tree_store.threshold = threshold
+
     def __str__(self):
         return f"SuffixNode: {self.token}"
 
+    @property
+    def delimiters(self):
+        return self.flat_tree_store.delimiters
+
+    @property
+    def threshold(self):
+        return self.flat_tree_store.threshold
+
+    @property
+    def keys_to_my_children(self):
+        # the children's tokens are only kept once, in the child_index
+        if self.child_index is None:
+            return ()
+        return self.child_index.values()
+
     @classmethod
     def from_text(cls,
             text: str,
             threshold: int,
-            delimiters: List[str]
+            delimiters: List[str],
+            method: str = "insert",
+            backend: str = "objects",
+            processes: int = 1,
+            max_token_len: int = None,
+            vocab_size: int = None
         ) -> 'SuffixNode':
+        # vocab_size, if given, replaces threshold with the lowest one giving at most that many tokens
+        SuffixNode.check_vocab_size(vocab_size, method)
         if DEBUG_VERBOSITY["SuffixNode"]["general"] > -1:
             print("Running suffix_tree.build_tree()...")
         tree = SuffixNode.build_tree(
             text=text,
             delimiters=delimiters,
-            threshold=threshold
+            threshold=threshold,
+            method=method,
+            backend=backend,
+            processes=processes,
+            max_token_len=max_token_len
+        )
+
+        if DEBUG_VERBOSITY["SuffixNode"]["general"] > 1:
+            tree.print_tree()
+
+        if vocab_size is not None:
+            tree.flat_tree_store.threshold = ThresholdIndex(tree).threshold_for_vocab_size(vocab_size)
+        tree.clean()
+        return tree
+
+    @classmethod
+    def from_stream(cls,
+            stream: Union[Iterable[str], TextIO],
+            threshold: int,
+            delimiters: List[str],
+            method: str = "insert",
+            backend: str = "objects",
+            chunk_size: int = STREAM_CHUNK_SIZE,
+            processes: int = 1,
+            max_token_len: int = None,
+            vocab_size: int = None
+        ) -> 'SuffixNode':
+        """
+        Like from_text, but reads the corpus from an open text file or any
+        iterable of string chunks, inserting each clause as soon as it's complete.
+        With the insertion method, only the clause being inserted is held in memory,
+        and with the Ukkonen method only a batch of clauses, so peak memory tracks
+        the size of the tree instead of the corpus.
+        The threshold method streams the corpus twice, once to count substrings and
+        once to build, so it needs a seekable file or a collection of chunks that
+        can be iterated again, like a list; a one-shot iterator raises a ValueError.
+        """
+        SuffixNode.check_vocab_size(vocab_size, method)
+        if DEBUG_VERBOSITY["SuffixNode"]["general"] > -1:
+            print("Running suffix_tree.build_tree_from_stream()...")
+        tree = SuffixNode.build_tree_from_stream(
+            stream=stream,
+            delimiters=delimiters,
+            threshold=threshold,
+            method=method,
+            backend=backend,
+            chunk_size=chunk_size,
+            processes=processes,
+            max_token_len=max_token_len
         )
 
         if DEBUG_VERBOSITY["SuffixNode"]["general"] > 1:
             tree.print_tree()
-        
+
+        if vocab_size is not None:
+            tree.flat_tree_store.threshold = ThresholdIndex(tree).threshold_for_vocab_size(vocab_size)
         tree.clean()
         return tree
-    
+
+    @staticmethod
+    def check_vocab_size(vocab_size, method):
+        # the threshold is only picked once the tree is built, too late for the counting pass
+        if vocab_size is not None and method == "threshold":
+            raise ValueError("vocab_size picks the threshold after the build, so it can't use method='threshold'")
+
     @classmethod
     def build_tree(cls,
             text: str,
             delimiters: Set[str],
             threshold: int,
+            method: str = "insert",
+            backend: str = "objects",
+            processes: int = 1,
+            max_token_len: int = None,
         ) -> 'SuffixNode':
+        # split the text into blocks lazily, where each block is an independent clause,
+        #   starting over whenever the clauses are read again
+        return SuffixNode.build_tree_from_clauses(
+            clauses=Reiterable(lambda: iter_clauses([text], delimiters)),
+            delimiters=delimiters,
+            threshold=threshold,
+            method=method,
+            backend=backend,
+            processes=processes,
+            max_token_len=max_token_len
+        )
 
-        # create a store for the tree nodes
-        flat_tree_store = FlatTreeStore()
-        # child_dict={
-        #     letter: SuffixNode(suffix=letter, token=letter) for letter in set(text)
-        # })
+    @classmethod
+    def build_tree_from_stream(cls,
+            stream: Union[Iterable[str], TextIO],
+            delimiters: Set[str],
+            threshold: int,
+            method: str = "insert",
+            backend: str = "objects",
+            chunk_size: int = STREAM_CHUNK_SIZE,
+            processes: int = 1,
+            max_token_len: int = None,
+        ) -> 'SuffixNode':
+        # read files in fixed-size chunks, so a file with no newlines still streams
+        if hasattr(stream, "read"):
+            file = stream
+            if method == "threshold" and file.seekable():
+                # each pass reads the file again from where the build started
+                start = file.tell()
+
+                def read_chunks():
+                    file.seek(start)
+                    return iter(partial(file.read, chunk_size), "")
+
+                stream = Reiterable(read_chunks)
+            else:
+                stream = iter(partial(file.read, chunk_size), "")
+        if method == "threshold" and iter(stream) is stream:
+            raise ValueError("method='threshold' reads the stream twice, so it needs a seekable file "
+                             "or a collection of chunks, not a one-shot iterator")
+
+        return SuffixNode.build_tree_from_clauses(
+            clauses=Reiterable(lambda: iter_clauses(stream, delimiters)),
+            delimiters=delimiters,
+            threshold=threshold,
+            method=method,
+            backend=backend,
+            processes=processes,
+            max_token_len=max_token_len
+        )
+
+    @classmethod
+    def build_tree_from_clauses(cls,
+            clauses: Iterable[str],
+            delimiters: Set[str],
+            threshold: int,
+            method: str = "insert",
+            backend: str = "objects",
+            processes: int = 1,
+            max_token_len: int = None,
+        ) -> 'SuffixNode':
+        # method="insert" adds every suffix of every clause from the root, O(L^2) per clause
+        # method="ukkonen" builds a generalized suffix tree in O(L) per clause,
+        #   then grafts it onto the root with the same tokens and frequencies;
+        #   the clauses are built in batches of about UKKONEN_BATCH_SIZE characters,
+        #   each merged in before the next, so the corpus is never held all at once
+        # method="threshold" inserts like "insert", but first counts short substrings
+        #   so that branches which could never survive pruning are never built;
+        #   the tree is the same as "insert"'s once it's cleaned
+        #   counting reads the clauses a first time, so they can't be a one-shot iterator
+        # backend="compact" stores the tree in a CompactTreeStore's arrays instead of
+        #   one SuffixNode per node, inserting each suffix straight into the arrays
+        # max_token_len cuts every suffix to at most that many characters before it's inserted,
+        #   so no token is longer and each clause costs O(L*k) instead of O(L^2)
+        if method not in SuffixNode.BUILD_METHODS:
+            raise ValueError(f"Unknown build method '{method}', expected one of {SuffixNode.BUILD_METHODS}")
+        if backend not in SuffixNode.BACKENDS:
+            raise ValueError(f"Unknown backend '{backend}', expected one of {SuffixNode.BACKENDS}")
+        if backend == "compact" and method != "insert":
+            raise ValueError("backend='compact' is only built with method='insert'")
+        if max_token_len is not None:
+            if max_token_len < 1:
+                raise ValueError(f"max_token_len must be at least 1, got {max_token_len}")
+            if method == "ukkonen" or backend == "compact":
+                raise ValueError("max_token_len needs one of the insertion build methods and backend='objects'")
+        # processes > 1 inserts shards of clauses in a process pool and merges the trees
+        if processes > 1:
+            # the shards are built by insertion in the workers
+            if method != "insert" or backend != "objects":
+                raise ValueError("Parallel builds need method='insert' and backend='objects'")
+            return SuffixNode.build_tree_parallel(
+                clauses=clauses,
+                delimiters=delimiters,
+                threshold=threshold,
+                processes=processes,
+                max_token_len=max_token_len
+            )
 
-        # point all the internal tree stores back at the main one
-        for key in flat_tree_store.child_dict.keys():
-            flat_tree_store.child_dict[key].flat_tree_store = flat_tree_store
+        if backend == "compact":
+            return CompactTreeStore.from_clauses(clauses, delimiters, threshold).root
 
+        # create a store for the tree nodes
+        flat_tree_store = FlatTreeStore()
         suffix_tree = SuffixNode(
             flat_tree_store=flat_tree_store,
-            keys_to_my_children=set(flat_tree_store.child_dict.keys()),
             delimiters=delimiters,
             threshold=threshold
         )
         # set the root of the flat tree store to the initial SuffixNode pointing to it
         suffix_tree.flat_tree_store.root = suffix_tree
 
-        # split the text into blocks, where each block is an independent clause
-        clauses = re.split(compile_regex(delimiters), text)
-        # print(set(clauses))
+        if method == "threshold":
+            # the counting pass reads the clauses once and the build once more,
+            #   so rather than holding a one-shot iterator's, ask for clauses that can be read again
+            if iter(clauses) is clauses:
+                raise ValueError("method='threshold' reads the clauses twice, so they can't be a one-shot iterator")
+            # clean() prunes at the tree's threshold, so only branches that can't reach it are left out
+            flat_tree_store.substring_counts = SubstringCounts(clauses, threshold=threshold)
 
-        if DEBUG_VERBOSITY["SuffixNode"]["general"] > 1:
-            print("Initial suffix tree (just alphabet):")
-            suffix_tree.print_tree()
-
-        for string in clauses:
-            if DEBUG_VERBOSITY["SuffixNode"]["general"] > 0:
-                print(f"Building suffix tree for '{string}'...")
+        if method == "ukkonen":
+            suffix_tree.graft_clauses(clauses)
+        else:
+            for string in clauses:
+                if DEBUG_VERBOSITY["SuffixNode"]["general"] > 0:
+                    print(f"Building suffix tree for '{string}'...")
 
-            suffix_tree.add_all_suffixes(string)
+                suffix_tree.add_all_suffixes(string, max_token_len)
+        # later insertions don't know about these counts, so they build every branch
+        flat_tree_store.substring_counts = None
 
         if DEBUG_VERBOSITY["SuffixNode"]["general"] > 1:
             print(suffix_tree.get_tokens())
 
         return suffix_tree
 
+    @classmethod
+    def build_tree_parallel(cls,
+            clauses: Iterable[str],
+            delimiters: Set[str],
+            threshold: int,
+            processes: int = None,
+            shard_size: int = PARALLEL_SHARD_SIZE,
+            max_token_len: int = None,
+        ) -> 'SuffixNode':
+        """
+        Insert consecutive shards of shard_size clauses into separate trees in a
+        process pool, and merge each shard's tree into the result in clause order
+        as it arrives. The merged tree is the same as a serial insertion build.
+        """
+        clauses = iter(clauses)
+        shards = iter(lambda: list(islice(clauses, shard_size)), [])
+
+        suffix_tree = None
+        with Pool(processes) as pool:
+            for records in pool.imap(partial(_build_shard, max_token_len=max_token_len), shards):
+                shard_tree = SuffixNode.from_records(records, delimiters, threshold)
+                if suffix_tree is None:
+                    suffix_tree = shard_tree
+                else:
+                    suffix_tree.merge_tree(shard_tree)
+
+        if suffix_tree is None:
+            suffix_tree = SuffixNode.build_tree_from_clauses((), delimiters, threshold)
+        return suffix_tree
+
+    def graft_clauses(self, clauses: Iterable[str], batch_size: int = UKKONEN_BATCH_SIZE):
+        """
+        Add clauses to this unpruned tree with Ukkonen's algorithm, one batch of
+        about batch_size characters at a time. Each batch's generalized suffix tree
+        is grafted onto a tree of its own and merged into this one, so only the
+        batch, never the whole corpus, is held in a UkkonenTree.
+        """
+        for batch in iter_batches(clauses, batch_size):
+            batch_tree = SuffixNode.build_tree_from_clauses((), self.delimiters, self.threshold)
+            self.merge_tree(UkkonenTree(batch).graft(batch_tree))
+        return self
+
+    def pruned_copy(self, threshold:int=None) -> 'SuffixNode':
+        """
+        What clean() would leave of this unpruned tree at threshold, as a new tree.
+        Only the nodes that survive are copied, and this tree is left as it is,
+        so it can be pruned again at any other threshold.
+        """
+        if threshold is None:
+            threshold = self.threshold
+
+        pruned_tree = SuffixNode.build_tree_from_clauses((), self.delimiters, threshold)
+        child_dict = self.flat_tree_store.child_dict
+        # the alphabet is always kept, and frequencies only shrink going down the tree
+        stack = [(pruned_tree, child_dict[token]) for token in self.keys_to_my_children]
+        while stack:
+            parent, node = stack.pop()
+            child = parent.add_child(node.suffix, frequency=node.frequency)
+            for token in node.keys_to_my_children:
+                grandchild = child_dict[token]
+                if grandchild.frequency >= threshold:
+                    stack.append((child, grandchild))
+
+        pruned_tree.add_delimiters_to_tree(pruned_tree.delimiters)
+        return pruned_tree
+
+    def save(self, filename: str):
+        """
+        Write the tree below this node to a binary file, in CompactTreeStore's
+        layout, so it loads back with its arrays memory-mapped. What's saved is
+        a snapshot to tokenize with or build a DAG from: it loads back as a
+        read-only CompactSuffixNode, and can't be added to.
+        """
+        CompactTreeStore.from_tree(self).write(filename)
+
+    @staticmethod
+    def load(filename: str) -> CompactSuffixNode:
+        return CompactTreeStore.load(filename).root
+
+    def threshold_index(self) -> ThresholdIndex:
+        return ThresholdIndex(self)
+
+    def compile(self, max_token_len:int=None, token_index_map:dict=None) -> CompiledTokenizer:
+        # freeze the tree's tokenizer, so the tree itself can be let go
+        return CompiledTokenizer(self, max_token_len, token_index_map)
+
     def clean(self):
         if DEBUG_VERBOSITY["SuffixNode"]["general"] > -1:
             print("Pruning modified suffix tree...")
@@ -135,19 +429,20 @@ class SuffixNode:
                     print(f"{' ' * (indent + 4)} '{child.suffix}': {child.frequency}")
 
     def set_token(self):
+        # intern tokens so the suffix tree, child_dict keys and DAG vertices share one copy
         if self.parent.token:
-            self.token = self.parent.token + self.suffix
+            self.token = intern(self.parent.token + self.suffix)
         else:
-            self.token = self.suffix
+            self.token = intern(self.suffix)
 
-    def add_child(self, suffix):
+    def add_child(self, suffix, frequency:int=1):
         if DEBUG_VERBOSITY["SuffixNode"]["general"] > 1:
             print(f"Creating a new child with suffix '{suffix}'")
 
         child = SuffixNode(
             suffix=suffix,
             token=suffix,
-            frequency=1,
+            frequency=frequency,
             parent=self,
             flat_tree_store=self.flat_tree_store
         )
@@ -155,52 +450,61 @@ class SuffixNode:
         child.set_token()
 
         # Add the new child to the current node's children
-        self.keys_to_my_children.add(child.token)
+        self.index_child(child)
         self.flat_tree_store.child_dict[child.token] = child
+        if self.flat_tree_store.changed_tokens is not None:
+            self.flat_tree_store.changed_tokens.add(child.token)
+        return child
+
+    def index_child(self, child):
+        if self.child_index is None:
+            self.child_index = dict()
+        self.child_index[child.suffix[0]] = child.token
+
+    def add_leaf(self, suffix, max_depth:int=None):
+        # a new branch that would start deeper than max_depth is left out,
+        #   along with everything that would have grown below it
+        if max_depth is not None and len(self.token or "") >= max_depth:
+            return None
+        return self.add_child(suffix)
+
+    def trim_edge(self, split_index):
+        # drop the first split_index characters of this node's edge,
+        #   returning the suffixes that stopped on them, which no longer reach this node
+        ended = None
+        if self.edge_ends is not None:
+            remaining = None
+            for offset, count in self.edge_ends.items():
+                if offset <= split_index:
+                    self.frequency -= count
+                    if offset < split_index:
+                        if ended is None:
+                            ended = dict()
+                        ended[offset] = count
+                else:
+                    if remaining is None:
+                        remaining = dict()
+                    remaining[offset - split_index] = count
+            self.edge_ends = remaining
+        self.suffix = self.suffix[split_index:]
+        return ended
+
+    def add_edge_ends(self, edge_ends):
+        if not edge_ends:
+            return
+        if self.edge_ends is None:
+            self.edge_ends = dict()
+        for offset, count in edge_ends.items():
+            self.edge_ends[offset] = self.edge_ends.get(offset, 0) + count
 
-    def create_split_nodes(self,
-            child,
-            old_suffix,
-            new_suffix,
-            split_node
-        ):
-        # Create the old child (original suffix) under the split node
-        old_child = SuffixNode(
-            suffix=old_suffix,
-            frequency=child.frequency - 1,
-            parent=split_node,
-            flat_tree_store=self.flat_tree_store,
-            keys_to_my_children=child.keys_to_my_children
-        )
-        old_child.set_token()
-
-        # Create the new child (new suffix) under the split node
-        new_child = SuffixNode(
-            suffix=new_suffix,
-            frequency=1,
-            parent=split_node,
-            flat_tree_store=self.flat_tree_store
-        )
-        new_child.set_token()
-
-        return old_child, new_child
-
-    def split_edge(self, child, split_index, suffix):
+    def split_child(self, child, split_index):
         if DEBUG_VERBOSITY["SuffixNode"]["general"] > 1:
             print(f"Splitting on {child.token}")
 
-        # Remove the previous/original child from current node's children
-        try:
-            self.keys_to_my_children.remove(child.token)
-        except:
+        # the split node takes the original child's place among the current node's children
+        if self.child_index is None or self.child_index.get(child.suffix[0]) != child.token:
             raise KeyError(
-                f"Couldn't remove '{child.token}' from '{self.token}''s children: {self.keys_to_my_children}")
-
-        del self.flat_tree_store.child_dict[child.token]
-
-        # Calculate suffixes for the split
-        old_suffix = child.suffix[split_index:]
-        new_suffix = suffix[split_index:]
+                f"Couldn't remove '{child.token}' from '{self.token}''s children: {set(self.keys_to_my_children)}")
 
         # Create the split node with the matching part of the suffix
         split_node = SuffixNode(
@@ -211,54 +515,61 @@ class SuffixNode:
         )
         split_node.set_token()
 
-        # Add the split node to the current node's children
-        self.keys_to_my_children.add(split_node.token)
+        # Add the split node to the current node's children,
+        #   in the child_index slot the original child held
+        self.index_child(split_node)
         self.flat_tree_store.child_dict[split_node.token] = split_node
+        if self.flat_tree_store.changed_tokens is not None:
+            # the original child loses any suffixes that ended partway along its edge
+            self.flat_tree_store.changed_tokens.update((split_node.token, child.token))
+
+        # Reuse the original child as the lower half of the edge;
+        #   its token, children and entry in the child_dict all stay the same
+        split_node.edge_ends = child.trim_edge(split_index)
+        child.parent = split_node
+        split_node.child_index = {child.suffix[0]: child.token}
 
-        old_child, new_child = self.create_split_nodes(child, old_suffix, new_suffix, split_node)
+        return split_node
 
-        # Update children of the old split node
-        for grandchild_key in child.keys_to_my_children:
-            grandchild = self.flat_tree_store.child_dict[grandchild_key]
-            grandchild.parent = old_child
-            old_child.keys_to_my_children.add(grandchild_key)
+    def split_edge(self, child, split_index, suffix, max_depth:int=None):
+        # the new suffix was already counted on the child, but it never reaches the old child
+        child.frequency -= 1
+        split_node = self.split_child(child, split_index)
+        split_node.frequency += 1
 
-        # Set up the split_node's children
-        split_node.keys_to_my_children = {new_child.token, old_child.token}
-        self.flat_tree_store.child_dict[new_child.token] = new_child
-        self.flat_tree_store.child_dict[old_child.token] = old_child
+        # Create the new child (new suffix) under the split node
+        split_node.add_leaf(suffix[split_index:], max_depth)
 
     def longest_common_prefix(self, suffix, doSuffix):
-        # Iterate over each child to find the longest common prefix
-        for child_token in self.keys_to_my_children:
-            child = self.flat_tree_store.child_dict[child_token]
+        # the character following this node's token picks the only child edge that can match
+        if doSuffix or self.token is None:
+            depth = 0
+        else:
+            depth = len(self.token)
+        if len(suffix) <= depth:
+            return -1, None
+
+        if self.child_index is None:
+            return -1, None
+        child_token = self.child_index.get(suffix[depth])
+        if child_token is None:
+            return -1, None
+
+        # match against the edge label when inserting, or the whole token when tokenizing
+        if doSuffix:
+            child_suffix = self.flat_tree_store.child_dict[child_token].suffix
+        else:
+            child_suffix = child_token
 
-            # Find the longest common prefix
-            if doSuffix:
-                child_suffix = child.suffix
-            else:
-                child_suffix = child.token
-
-            min_len = min(len(suffix), len(child_suffix))
-            i = 0
-            while i < min_len and suffix[i] == child_suffix[i]:
-                i += 1
-
-            # If there is a common prefix
-            if doSuffix and i > 0:
-                return i, child_token
-            elif self.token is None\
-                    and not doSuffix\
-                    and i > 0:
-                return i, child_token
-            elif self.token is not None\
-                    and not doSuffix\
-                    and i > len(self.token):
-                return i, child_token
-
-        return -1, None
-
-    def add_suffix(self, suffix):
+        i = common_prefix_length(suffix, child_suffix)
+        # when tokenizing, the match has to reach past this node's own token
+        if i <= depth:
+            return -1, None
+        return i, child_token
+
+    # max_depth, if given, is the deepest a new branch may start,
+    #   for leaving out branches that can't reach the threshold
+    def add_suffix(self, suffix, max_depth:int=None):
         if DEBUG_VERBOSITY["SuffixNode"]["general"] > 1:
             print(f"Current suffix: '{suffix}'")
             print(f"Children: {self.keys_to_my_children}")
@@ -272,21 +583,29 @@ class SuffixNode:
                 print(f"Child with shared suffix: '{child.token}'")
             # Update the frequency of the child node
             child.frequency += 1
+            if self.flat_tree_store.changed_tokens is not None:
+                self.flat_tree_store.changed_tokens.add(child_token)
 
             # If the common prefix matches the entire child suffix,
             #   and the new suffix would be non-empty,
             #   recurse on the remainder of the suffix
             if index == len(child.suffix) and len(suffix[index:]) > 0:
-                child.add_suffix(suffix[index:])
+                child.add_suffix(suffix[index:], max_depth)
             # Otherwise, split the edge
             elif index < len(suffix):
-                self.split_edge(child, index, suffix)
+                self.split_edge(child, index, suffix, max_depth)
+            # if the suffix stops partway along the child's edge, remember where
+            elif index < len(child.suffix):
+                if child.edge_ends is None:
+                    child.edge_ends = dict()
+                child.edge_ends[index] = child.edge_ends.get(index, 0) + 1
 
             return
 
         # if it's an unseen character
         #   (like in the case of a divide-and-conquer approach)
-        if suffix[0] not in self.flat_tree_store.root.keys_to_my_children:
+        root = self.flat_tree_store.root
+        if root.child_index is None or suffix[0] not in root.child_index:
             # No matching suffix, create a new child
             if DEBUG_VERBOSITY["SuffixNode"]["general"] > 1:
                 print("Unrecognized character, adding to alphabet...")
@@ -297,56 +616,202 @@ class SuffixNode:
                 suffix=suffix[0],
                 token=suffix[0],
                 frequency=1,
-                parent=self.flat_tree_store.root,
+                parent=root,
                 flat_tree_store=self.flat_tree_store
             )
-            self \
-                .flat_tree_store \
-                .root \
-                .keys_to_my_children \
-                .add(suffix[0])
+            root.index_child(self.flat_tree_store.child_dict[suffix[0]])
+            if self.flat_tree_store.changed_tokens is not None:
+                self.flat_tree_store.changed_tokens.add(suffix[0])
 
             # if there's still suffix left, add a child to the current node,
             #   consisting of the remainder
             if len(suffix) > 1:
                 child = self.flat_tree_store.child_dict[suffix[0]]
-                child.add_child(suffix[1:])
+                child.add_leaf(suffix[1:], max_depth)
 
                 if DEBUG_VERBOSITY["SuffixNode"]["general"] > 1:
                     print(self.get_tokens())
 
         else:
             # No matching suffix, create a new child
-            self.add_child(suffix)
+            self.add_leaf(suffix, max_depth)
 
             if DEBUG_VERBOSITY["SuffixNode"]["general"] > 1:
                 print(self.get_tokens())
 
         return
 
-    def add_all_suffixes(self, word):
+    def add_all_suffixes(self, word, max_token_len:int=None):
+        # when building against a threshold, each suffix only grows new branches
+        #   as deep as its prefixes could still reach the threshold
+        substring_counts = self.flat_tree_store.substring_counts
+        max_depths = None
+        if substring_counts is not None:
+            max_depths = substring_counts.frequent_prefix_lengths(word)
+
         # loop through the word, starting with the last character
         for i in range(0, len(word)):
-            suffix = word[len(word) - i - 1:]
+            start = len(word) - i - 1
+            # a k-bounded tree only ever sees the first k characters of each suffix
+            if max_token_len is None:
+                suffix = word[start:]
+            else:
+                suffix = word[start:start + max_token_len]
 
             # add the suffix to the tree
-            self.add_suffix(suffix)
+            if max_depths is None:
+                self.add_suffix(suffix)
+            else:
+                self.add_suffix(suffix, max_depths[start])
+
+    def track_changes(self):
+        """
+        Start recording every token this unpruned tree creates or recounts,
+        so CompositionDAGNode.update_dag can bring a DAG built from it up to date.
+        """
+        self.flat_tree_store.changed_tokens = set()
+
+    def add_text(self, text: str, max_token_len:int=None):
+        # insert more text into an unpruned tree built by insertion, clause by clause,
+        #   just as the build would have if the text had been part of the corpus
+        for clause in iter_clauses([text], self.delimiters):
+            self.add_all_suffixes(clause, max_token_len)
+
+    def adopt(self, child):
+        # move a subtree from another tree under this node, registering every node in this tree's store
+        stack = [child]
+        while stack:
+            node = stack.pop()
+            stack.extend(node.flat_tree_store.child_dict[token] for token in node.keys_to_my_children)
+            node.flat_tree_store = self.flat_tree_store
+            self.flat_tree_store.child_dict[node.token] = node
+
+        child.parent = self
+        self.index_child(child)
+
+    def merge_tree(self, other):
+        """
+        Merge another unpruned tree, built by insertion, into this one, as if its
+        clauses had been inserted after this tree's. Frequencies are summed, and edges
+        are only split where the two trees diverge, so the result has the same shape
+        and frequencies as a serial build. The other tree's nodes are moved, not copied.
+        """
+        other_dict = other.flat_tree_store.child_dict
+        stack = [(self, other_dict[token]) for token in other.keys_to_my_children]
+        while stack:
+            node, other_child = stack.pop()
+            child_token = None
+            if node.child_index is not None:
+                child_token = node.child_index.get(other_child.suffix[0])
+            if child_token is None:
+                node.adopt(other_child)
+                continue
+            child = self.flat_tree_store.child_dict[child_token]
+            split_index = common_prefix_length(child.suffix, other_child.suffix)
+            other_children = [other_dict[token] for token in other_child.keys_to_my_children]
+
+            # a node partway along child's edge that doesn't branch only exists because
+            #   a suffix ended there first, so it folds into the edge below it
+            if split_index == len(other_child.suffix) < len(child.suffix) and len(other_children) < 2:
+                ended = other_child.frequency - sum(grandchild.frequency for grandchild in other_children)
+                if other_child.edge_ends is not None:
+                    ended -= sum(other_child.edge_ends.values())
+
+                if other_children:
+                    grandchild = other_children[0]
+                    edge_ends = grandchild.edge_ends
+                    grandchild.edge_ends = other_child.edge_ends
+                    if edge_ends is not None:
+                        grandchild.add_edge_ends({offset + split_index: count
+                                                  for offset, count in edge_ends.items()})
+                    if ended > 0:
+                        grandchild.add_edge_ends({split_index: ended})
+                    grandchild.suffix = other_child.suffix + grandchild.suffix
+                    grandchild.frequency = other_child.frequency
+                    stack.append((node, grandchild))
+                else:
+                    child.frequency += other_child.frequency
+                    child.add_edge_ends(other_child.edge_ends)
+                    child.add_edge_ends({split_index: ended})
+                continue
+
+            if split_index < len(child.suffix):
+                child = node.split_child(child, split_index)
+
+            # child's edge now runs along the start of other_child's
+            child.frequency += other_child.frequency
+            child.add_edge_ends(other_child.trim_edge(split_index))
+            if other_child.suffix:
+                stack.append((child, other_child))
+            else:
+                stack.extend((child, grandchild) for grandchild in other_children)
+
+        return self
+
+    def to_records(self):
+        """
+        Flatten the tree below this node into preorder
+        (suffix, frequency, edge_ends, number of children) tuples,
+        which pickle cheaply and without recursing through the tree.
+        """
+        records = []
+        stack = [self]
+        while stack:
+            node = stack.pop()
+            records.append((node.suffix, node.frequency, node.edge_ends, len(node.keys_to_my_children)))
+            stack.extend(self.flat_tree_store.child_dict[token] for token in node.keys_to_my_children)
+        return records
+
+    @classmethod
+    def from_records(cls,
+            records: Iterable[tuple],
+            delimiters: Set[str],
+            threshold: int
+        ) -> 'SuffixNode':
+        # rebuild a tree from a root's to_records()
+        records = iter(records)
+        _, frequency, _, num_children = next(records)
+        suffix_tree = SuffixNode.build_tree_from_clauses((), delimiters, threshold)
+        suffix_tree.frequency = frequency
+
+        stack = [[suffix_tree, num_children]]
+        for suffix, frequency, edge_ends, num_children in records:
+            while stack[-1][1] == 0:
+                stack.pop()
+            stack[-1][1] -= 1
+            child = stack[-1][0].add_child(suffix, frequency=frequency)
+            child.edge_ends = edge_ends
+            if num_children:
+                stack.append([child, num_children])
+        return suffix_tree
 
     # add the delimiter frequencies back into the suffix tree's storage
     def add_delimiters_to_tree(self, delimiters:List[str]):
-        delimiter_counts = {delimiter: 1 for delimiter in delimiters}
-
-        self.keys_to_my_children.update(set(delimiter_counts.keys()))
-        self.flat_tree_store.child_dict.update({
-            key: SuffixNode(suffix=key,
-                            token=key,
-                            frequency=1,
-                            parent=self,
-                            flat_tree_store=self.flat_tree_store)
-            for key in delimiter_counts.keys()
-        })
-
-    def prune_tree(self, threshold=2, indent=0):
+        # each delimiter gets a node on its own path down the tree, like any other token,
+        #   so a multi-character one sits below the nodes for its prefixes;
+        #   where pruning left no node for it, an edge is split or a leaf added
+        child_dict = self.flat_tree_store.child_dict
+        for delimiter in sorted(delimiters, key=len):
+            node = self
+            depth = 0
+            while depth < len(delimiter):
+                child_token = None if node.child_index is None else node.child_index.get(delimiter[depth])
+                if child_token is None:
+                    node = node.add_child(delimiter[depth:])
+                    break
+                child = child_dict[child_token]
+                matched = common_prefix_length(delimiter[depth:], child.suffix)
+                if matched < len(child.suffix):
+                    child = node.split_child(child, matched)
+                node = child
+                depth += matched
+            node.frequency = 1
+
+    def prune_tree(self, threshold=None, indent=0):
+        # prune at the tree's own threshold unless told otherwise
+        if threshold is None:
+            threshold = self.threshold
+
         # If the node has no children (ie it's a leaf), return
         if not self.keys_to_my_children:
             if DEBUG_VERBOSITY["SuffixNode"]["pruning"] > 1:
@@ -372,7 +837,7 @@ class SuffixNode:
                 # if the child is above the threshold or it's a single character token node
                 if child.parent is None or ((child.frequency >= threshold
                                              or child.parent.token is None)
-                                            and (child.token in child.parent.keys_to_my_children)):
+                                            and child.parent is self):
                     # print("not removed")
                     child = child.prune_tree(threshold, indent=4)
                     self.flat_tree_store.child_dict[child_token] = child
@@ -382,9 +847,17 @@ class SuffixNode:
 
         for child_token in children_to_kill:
             # if the token's frequency falls below the threshold, prune it
-            self.keys_to_my_children.remove(child_token)
-            del self.flat_tree_store.child_dict[child_token]
+            del self.child_index[self.flat_tree_store.child_dict[child_token].suffix[0]]
+            # along with everything below it, which can only be rarer
+            dead_tokens = [child_token]
+            while dead_tokens:
+                dead_token = dead_tokens.pop()
+                dead_tokens.extend(self.flat_tree_store.child_dict[dead_token].keys_to_my_children)
+                del self.flat_tree_store.child_dict[dead_token]
             dead_children.add(child_token)
+        # a node that lost all its children is a leaf again
+        if not self.child_index:
+            self.child_index = None
 
         if DEBUG_VERBOSITY["SuffixNode"]["pruning"] > 1:
             print(self.get_tokens())
@@ -397,3 +870,13 @@ class SuffixNode:
                    .flat_tree_store
                    .child_dict
                    .keys())
+
+
+# runs in the pool's worker processes, for SuffixNode.build_tree_parallel
+def _build_shard(clauses, max_token_len=None):
+    return SuffixNode.build_tree_from_clauses(
+        clauses,
+        delimiters=NO_DELIMITERS,
+        threshold=2,
+        max_token_len=max_token_len
+    ).to_records()
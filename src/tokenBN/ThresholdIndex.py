@@ -0,0 +1,56 @@
+from bisect import bisect_right
+from typing import Set
+
+
+class ThresholdIndex:
+    """
+    The frequencies of every node in an unpruned suffix tree, sorted once, so
+    the tokens that pruning would keep at any threshold can be read off
+    without pruning the tree.
+
+    A node's frequency never exceeds its parent's, so pruning at a threshold
+    keeps exactly the alphabet, the delimiters clean() adds back, and the
+    nodes whose own frequency reaches the threshold. Trees built with
+    method="threshold" never grew the branches below their own threshold,
+    so they only give the right answer at or above it.
+    """
+    def __init__(self, tree):
+        self.tree = tree
+        store = tree.flat_tree_store
+
+        # the alphabet is never pruned, and the delimiters are always added back
+        self.kept_tokens = frozenset(tree.keys_to_my_children) | frozenset(store.delimiters)
+        ranked = sorted(((node.frequency, token) for token, node in store.child_dict.items()
+                         if token not in self.kept_tokens),
+                        key=lambda ranked_token: -ranked_token[0])
+        # negated, so bisect can search the descending frequencies
+        self.negated_frequencies = [-frequency for frequency, _ in ranked]
+        self.ranked_tokens = [token for _, token in ranked]
+
+    def num_kept(self, threshold: int) -> int:
+        # how many of the ranked tokens have a frequency of at least threshold
+        return bisect_right(self.negated_frequencies, -threshold)
+
+    def tokens(self, threshold: int) -> Set[str]:
+        return self.kept_tokens.union(self.ranked_tokens[:self.num_kept(threshold)])
+
+    def vocab_size(self, threshold: int) -> int:
+        return len(self.kept_tokens) + self.num_kept(threshold)
+
+    def threshold_for_vocab_size(self, vocab_size: int) -> int:
+        """
+        The lowest threshold whose vocabulary has at most vocab_size tokens.
+        Tokens with the same frequency are kept or dropped together,
+        so the vocabulary can come out smaller than asked for.
+        """
+        num_ranked = vocab_size - len(self.kept_tokens)
+        if num_ranked < 0:
+            raise ValueError(f"The alphabet and delimiters alone are {len(self.kept_tokens)} tokens, "
+                             f"more than the {vocab_size} asked for")
+        if num_ranked >= len(self.ranked_tokens):
+            return 1
+        # just above the first frequency that would have to be dropped
+        return 1 - self.negated_frequencies[num_ranked]
+
+    def pruned_tree(self, threshold: int):
+        return self.tree.pruned_copy(threshold)
@@ -0,0 +1,236 @@
+from typing import Iterable
+
+from tokenBN.config import DEBUG_VERBOSITY
+
+
+class UkkonenTree:
+    """
+    Generalized suffix tree over a sequence of clauses, built in linear time
+    with Ukkonen's algorithm (suffix links + an active point).
+
+    Every clause is followed by its own unique terminator, so no suffix can run
+    from one clause into the next. Nodes are kept as parallel lists indexed by
+    node id rather than as objects, and edge labels are (start, end) offsets
+    into the shared symbol buffer. That buffer holds every character added,
+    so SuffixNode only builds one tree per bounded batch of clauses.
+    """
+    ROOT = 0
+
+    def __init__(self, clauses: Iterable[str] = ()):
+        # clause characters followed by a negative, per-clause terminator
+        self.symbols = []
+        self.num_clauses = 0
+        # the clauses joined into one string on demand, for slicing out edge labels
+        self.clause_text = []
+        self.text = None
+
+        self.start = []
+        self.end = []
+        self.link = []
+        self.children = []
+        self.count = None
+        self.first_clause = None
+        self._new_node(0, 0)
+
+        for clause in clauses:
+            self.add_clause(clause)
+
+    def _new_node(self, start, end):
+        self.start.append(start)
+        self.end.append(end)
+        self.link.append(UkkonenTree.ROOT)
+        self.children.append(dict())
+        return len(self.start) - 1
+
+    def add_clause(self, clause: str):
+        if not clause:
+            return
+        if DEBUG_VERBOSITY["SuffixNode"]["general"] > 0:
+            print(f"Building suffix tree for '{clause}'...")
+
+        self.num_clauses += 1
+        offset = len(self.symbols)
+        symbols = self.symbols
+        symbols.extend(clause)
+        symbols.append(-self.num_clauses)
+        # labels never include a terminator, so any placeholder will do
+        self.clause_text.append(clause + "\0")
+
+        # leaves never grow past their clause's terminator,
+        #   so they can be given their final end straight away
+        leaf_end = len(symbols)
+
+        start, end, link, children = self.start, self.end, self.link, self.children
+        root = UkkonenTree.ROOT
+        active_node = root
+        active_edge = offset
+        active_length = 0
+        remainder = 0
+
+        for i in range(offset, leaf_end):
+            c = symbols[i]
+            remainder += 1
+            last_new = None
+
+            while remainder > 0:
+                if active_length == 0:
+                    active_edge = i
+                next_node = children[active_node].get(symbols[active_edge])
+
+                if next_node is None:
+                    # rule 2: hang a new leaf off the active node
+                    children[active_node][symbols[active_edge]] = self._new_node(i, leaf_end)
+                    if last_new is not None:
+                        link[last_new] = active_node
+                        last_new = None
+                else:
+                    # walk down if the active point lies past the end of this edge
+                    edge_length = min(end[next_node], i + 1) - start[next_node]
+                    if active_length >= edge_length:
+                        active_edge += edge_length
+                        active_length -= edge_length
+                        active_node = next_node
+                        continue
+
+                    # rule 3: the character is already on the edge, so stop this phase
+                    if symbols[start[next_node] + active_length] == c:
+                        if last_new is not None and active_node != root:
+                            link[last_new] = active_node
+                            last_new = None
+                        active_length += 1
+                        break
+
+                    # rule 2: split the edge and hang a new leaf off the split
+                    split = self._new_node(start[next_node], start[next_node] + active_length)
+                    children[active_node][symbols[active_edge]] = split
+                    children[split][c] = self._new_node(i, leaf_end)
+                    start[next_node] += active_length
+                    children[split][symbols[start[next_node]]] = next_node
+
+                    if last_new is not None:
+                        link[last_new] = split
+                    last_new = split
+
+                remainder -= 1
+                if active_node == root and active_length > 0:
+                    active_length -= 1
+                    active_edge = i - remainder + 1
+                elif active_node != root:
+                    active_node = link[active_node]
+
+        # the tree changed, so any previous counts are stale
+        self.count = None
+        self.first_clause = None
+        self.text = None
+
+    def label_end(self, node):
+        # leaf labels stop just before their clause's terminator
+        if self.children[node]:
+            return self.end[node]
+        return self.end[node] - 1
+
+    def get_text(self):
+        if self.text is None:
+            self.text = "".join(self.clause_text)
+        return self.text
+
+    def label(self, node):
+        return self.get_text()[self.start[node]:self.label_end(node)]
+
+    def visible_children(self, node):
+        # skip leaves whose label is nothing but a terminator
+        return [child for child in self.children[node].values()
+                if self.label_end(child) > self.start[child]]
+
+    def count_occurrences(self):
+        """
+        Count the suffixes passing through every node, which is the number of
+        leaves below it. Only the root sees the terminator-only leaves of empty
+        suffixes, and the root's own count is never used.
+        Also records the earliest clause with a suffix below every node.
+        """
+        count = [0] * len(self.start)
+        first_clause = [0] * len(self.start)
+        stack = [(child, False) for child in self.children[UkkonenTree.ROOT].values()]
+        while stack:
+            node, expanded = stack.pop()
+            children = self.children[node].values()
+            if expanded:
+                count[node] = sum(count[child] for child in children)
+                first_clause[node] = min(first_clause[child] for child in children)
+            elif not children:
+                count[node] = 1
+                # a leaf's label runs up to its clause's terminator
+                first_clause[node] = -self.symbols[self.end[node] - 1]
+            else:
+                stack.append((node, True))
+                stack.extend((child, False) for child in children)
+        self.count = count
+        self.first_clause = first_clause
+        return count
+
+    def ends_first(self, node):
+        """
+        Whether a suffix ended at this node before any longer suffix ran through it.
+        Suffixes are inserted clause by clause, shortest first, and the insertion
+        path leaves an explicit node wherever that happens.
+        """
+        ended = None
+        passed = None
+        for child in self.children[node].values():
+            clause = self.first_clause[child]
+            if self.label_end(child) == self.start[child]:
+                ended = clause if ended is None else min(ended, clause)
+            else:
+                passed = clause if passed is None else min(passed, clause)
+        return ended is not None and ended <= passed
+
+    def graft(self, root):
+        """
+        Copy the tree into a SuffixNode tree under root, in the same shape the
+        insertion path builds: single characters always get their own node,
+        nodes exist where suffixes diverge or where a suffix ended first, a
+        node's frequency is the number of suffixes that entered its edge, and
+        its edge_ends hold the suffixes that stopped partway along it, so the
+        grafted tree can be merged with SuffixNode.merge_tree.
+        """
+        if self.count is None:
+            self.count_occurrences()
+        count = self.count
+
+        stack = []
+        for node in self.visible_children(UkkonenTree.ROOT):
+            label = self.label(node)
+            # the alphabet always gets its own level in the tree
+            char_node = root.add_child(label[0], frequency=count[node])
+            if len(label) > 1:
+                stack.append((char_node, label[1:], node))
+            else:
+                stack.extend((char_node, None, child) for child in self.visible_children(node))
+
+        while stack:
+            parent, label, node = stack.pop()
+            # the suffixes entering this edge are the ones passing through its top node
+            frequency = count[node]
+            parts = [self.label(node) if label is None else label]
+
+            # fold away nodes that only exist because a suffix ended there,
+            #   unless the insertion path would have created them first,
+            #   recording where those suffixes stopped as the insertion path does
+            edge_ends = None
+            length = len(parts[0])
+            visible = self.visible_children(node)
+            while len(visible) == 1 and not self.ends_first(node):
+                if edge_ends is None:
+                    edge_ends = dict()
+                edge_ends[length] = count[node] - count[visible[0]]
+                node = visible[0]
+                parts.append(self.label(node))
+                length += len(parts[-1])
+                visible = self.visible_children(node)
+
+            child = parent.add_child("".join(parts), frequency=frequency)
+            child.edge_ends = edge_ends
+            stack.extend((child, None, grandchild) for grandchild in visible)
+
+        return root
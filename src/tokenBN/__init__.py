@@ -3,24 +3,39 @@ from tokenBN.config import DEBUG_VERBOSITY
 # Storage classes
 from tokenBN.FlatTreeStore import FlatTreeStore
 from tokenBN.DAGStore import DAGStore
+from tokenBN.ColumnarDAGStore import ColumnarDAGStore
+from tokenBN.DecompositionCache import DecompositionCache
+from tokenBN.CompactTreeStore import CompactTreeStore
+from tokenBN.SparseCOOTensor import SparseCOOTensor
+from tokenBN.EmbeddingTensor import EmbeddingTensor
+from tokenBN.DAGExporter import DAGExporter
 
 # Core classes
+from tokenBN.UkkonenTree import UkkonenTree
+from tokenBN.SubstringCounts import SubstringCounts
+from tokenBN.ThresholdIndex import ThresholdIndex
+from tokenBN.CompiledTokenizer import CompiledTokenizer
 from tokenBN.SuffixNode import SuffixNode
+from tokenBN.CompactSuffixNode import CompactSuffixNode
 from tokenBN.CompositionDAGNode import CompositionDAGNode
 
 # Utility functions
-from tokenBN.utils.figures import (
-    plot_embeddings,
-    plot_dag
-)
+from tokenBN import utils
 from tokenBN.utils.util import (
     count_occurrences,
     compile_regex
 )
-from tokenBN.utils.vector_embedding import (
-    calculate_distances_for_subgraph,
-    vectorize_adjacency_matrix,
-    tensor_to_array,
-    get_tensor_slice,
-    vectorize
-)
\ No newline at end of file
+
+# the plotting and embedding helpers are looked up in tokenBN.utils, which imports them
+#   the first time they're used
+def __getattr__(name):
+    if name not in utils.LAZY_ATTRIBUTES:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(utils, name)
+    # cached, so this only runs once per name
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(utils.LAZY_ATTRIBUTES))
@@ -5,4 +5,34 @@ DEBUG_VERBOSITY = {
     },
     "DAGNode": -1,
     "FlatTreeStore": 0
-}
\ No newline at end of file
+}
+
+# characters read at a time when streaming a corpus from a file
+STREAM_CHUNK_SIZE = 1 << 20
+
+# clause characters built into each generalized suffix tree with method="ukkonen"
+UKKONEN_BATCH_SIZE = 1 << 14
+
+# fewest clause characters added to a compact suffix tree's text at a time
+COMPACT_BATCH_SIZE = 1 << 16
+
+# clauses given to each worker in a parallel suffix tree build
+PARALLEL_SHARD_SIZE = 10000
+
+# longest substrings counted up front when building with method="threshold"
+SUBSTRING_COUNT_LEN = 6
+
+# token decompositions remembered while building a DAG
+DECOMPOSITION_CACHE_SIZE = 1 << 16
+
+# subgraph vertices given to each worker at a time in a parallel vectorization
+PARALLEL_SUBGRAPH_BATCH_SIZE = 1000
+
+# length of the dense token embeddings the n x n distance slices are projected to
+EMBEDDING_DIMENSIONS = 256
+
+# tokens projected at a time when reducing the embeddings
+EMBEDDING_BATCH_SIZE = 1024
+
+# edges written at a time when exporting a DAG
+EXPORT_CHUNK_SIZE = 1 << 16
@@ -1,9 +1,30 @@
-from tokenBN.utils.figures import plot_embeddings, plot_dag
+from importlib import import_module
+
 from tokenBN.utils.util import count_occurrences, compile_regex
-from tokenBN.utils.vector_embedding import (
-    calculate_distances_for_subgraph,
-    vectorize_adjacency_matrix,
-    tensor_to_array,
-    get_tensor_slice,
-    vectorize
-)
\ No newline at end of file
+
+# the plotting and embedding helpers are imported the first time they're used,
+#   so importing the package doesn't load matplotlib, seaborn or networkx
+LAZY_ATTRIBUTES = {
+    "plot_embeddings": "tokenBN.utils.figures",
+    "plot_dag": "tokenBN.utils.figures",
+    "calculate_distances_for_subgraph": "tokenBN.utils.vector_embedding",
+    "vectorize_adjacency_matrix": "tokenBN.utils.vector_embedding",
+    "tensor_to_array": "tokenBN.utils.vector_embedding",
+    "get_tensor_slice": "tokenBN.utils.vector_embedding",
+    "vectorize": "tokenBN.utils.vector_embedding",
+    "reduce_embeddings": "tokenBN.utils.vector_embedding",
+    "load_embeddings": "tokenBN.utils.vector_embedding",
+}
+
+
+def __getattr__(name):
+    if name not in LAZY_ATTRIBUTES:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(import_module(LAZY_ATTRIBUTES[name]), name)
+    # cached, so this only runs once per name
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(LAZY_ATTRIBUTES))
@@ -0,0 +1,168 @@
+import json
+import struct
+from collections.abc import Mapping, Sequence
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+# the first bytes of every file saved by tokenBN
+MAGIC = b"TOKENBN\0"
+# bumped whenever the layout of a saved file changes
+FORMAT_VERSION = 2
+# arrays start on cache-line boundaries, so they can be memory-mapped as they are
+ALIGNMENT = 64
+
+HEADER = struct.Struct("<8sII")
+
+
+def write_arrays(filename: str, kind: str, metadata: dict, arrays: Dict[str, np.ndarray]):
+    """
+    Write named arrays to one versioned binary file. A JSON header holds the
+    metadata and where each array starts, and every array is written raw,
+    aligned, so read_arrays can memory-map it rather than read it.
+    """
+    arrays = {name: np.ascontiguousarray(array) for name, array in arrays.items()}
+
+    # the arrays start after the header, whose length depends on their offsets,
+    #   so lay them out again until the header stops growing past an alignment
+    layout = dict()
+    data_start, header = 0, None
+    while header is None or align(HEADER.size + len(header)) != data_start:
+        if header is not None:
+            data_start = align(HEADER.size + len(header))
+        offset = data_start
+        for name, array in arrays.items():
+            layout[name] = {"dtype": array.dtype.str, "shape": list(array.shape), "offset": offset}
+            offset = align(offset + array.nbytes)
+        header = json.dumps({"kind": kind, "metadata": metadata, "arrays": layout}).encode("utf-8")
+
+    with open(filename, "wb") as file:
+        file.write(HEADER.pack(MAGIC, FORMAT_VERSION, len(header)))
+        file.write(header)
+        for name, array in arrays.items():
+            file.seek(layout[name]["offset"])
+            file.write(memoryview(array).cast("B"))
+
+
+def read_arrays(filename: str, kind: str) -> Tuple[dict, Dict[str, np.ndarray]]:
+    """
+    Read back a file written by write_arrays, memory-mapping every array
+    read-only, so processes loading the same file share its pages.
+    """
+    with open(filename, "rb") as file:
+        magic, version, header_length = HEADER.unpack(file.read(HEADER.size))
+        if magic != MAGIC:
+            raise ValueError(f"{filename} isn't a tokenBN file")
+        if version != FORMAT_VERSION:
+            raise ValueError(f"{filename} was saved in format version {version}, "
+                             f"but this version of tokenBN reads version {FORMAT_VERSION}")
+        header = json.loads(file.read(header_length).decode("utf-8"))
+    if header["kind"] != kind:
+        raise ValueError(f"{filename} holds a {header['kind']}, not a {kind}")
+
+    arrays = dict()
+    for name, layout in header["arrays"].items():
+        dtype, shape = np.dtype(layout["dtype"]), tuple(layout["shape"])
+        if 0 in shape:
+            # an empty array can't be mapped
+            arrays[name] = np.zeros(shape, dtype=dtype)
+        else:
+            arrays[name] = np.memmap(filename, dtype=dtype, mode="r", offset=layout["offset"], shape=shape)
+    return header["metadata"], arrays
+
+
+def align(offset: int) -> int:
+    return -(-offset // ALIGNMENT) * ALIGNMENT
+
+
+def encode_strings(strings: List[str]) -> Tuple[np.ndarray, np.ndarray]:
+    # a string table: every string's UTF-8 bytes back to back, and where each one starts
+    encoded = [string.encode("utf-8") for string in strings]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(string) for string in encoded], out=offsets[1:])
+    return np.frombuffer(b"".join(encoded), dtype=np.uint8), offsets
+
+
+def decode_strings(data: np.ndarray, offsets: np.ndarray) -> List[str]:
+    data = data.tobytes()
+    offsets = offsets.tolist()
+    return [data[start:end].decode("utf-8") for start, end in zip(offsets, offsets[1:])]
+
+
+class StringTable(Sequence):
+    """
+    Read-only view of a string table as a list of strings, decoding each one
+    from the (memory-mapped) bytes only when it's looked up.
+    """
+    def __init__(self, data: np.ndarray, offsets: np.ndarray):
+        self.data = data
+        self.offsets = offsets
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        return self.data[self.offsets[index]:self.offsets[index + 1]].tobytes().decode("utf-8")
+
+    def __iter__(self):
+        # decoded in one go, since every string is wanted
+        return iter(decode_strings(self.data, self.offsets))
+
+
+class StringIndex(Mapping):
+    """
+    Read-only string -> index view of a StringTable. The dict behind it is only
+    built the first time a string is looked up, so loading stays cheap.
+    """
+    def __init__(self, table: StringTable):
+        self.table = table
+        self.index = None
+
+    def indices(self):
+        if self.index is None:
+            self.index = {string: i for i, string in enumerate(self.table)}
+        return self.index
+
+    def __getitem__(self, string):
+        return self.indices()[string]
+
+    def __contains__(self, string):
+        return string in self.indices()
+
+    def __iter__(self):
+        return iter(self.table)
+
+    def __len__(self):
+        return len(self.table)
+
+
+class MappedText:
+    """
+    Read-only view of a text saved as UTF-32 code points, which indexes and
+    slices by character like the string it stands in for, decoding only the
+    characters asked for. str() decodes the whole text.
+    """
+    def __init__(self, code_points: np.ndarray):
+        self.code_points = code_points
+
+    def __len__(self):
+        return len(self.code_points)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return self.code_points[index].tobytes().decode("utf-32-le")
+        return chr(self.code_points[index])
+
+    def __str__(self):
+        return self.code_points.tobytes().decode("utf-32-le")
+
+
+def encode_text(text: str) -> np.ndarray:
+    # one code point per character, so character offsets into the text are array offsets too
+    return np.frombuffer(text.encode("utf-32-le"), dtype=np.uint32)
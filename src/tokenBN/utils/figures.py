@@ -1,6 +1,5 @@
 from scipy.sparse.csgraph import connected_components
 import scipy.sparse as sp
-import tensorflow as tf
 import math
 import networkx as nx
 import matplotlib.pyplot as plt
@@ -1,4 +1,4 @@
-from typing import Set
+from typing import Callable, Iterable, Iterator, List, Set
 import re
 
 def count_occurrences(text, delimiters: Set[str]):
@@ -19,3 +19,93 @@ def compile_regex(delimiters:Set[str]) -> str:
 
     # Enclose the pattern in parentheses to group it
     return f"({regex_pattern})"
+
+
+def iter_clauses(chunks: Iterable[str], delimiters: Set[str]) -> Iterator[str]:
+    """
+    Lazily yield the same pieces as re.split(compile_regex(delimiters), text)
+    would for the concatenated chunks, without ever holding the whole text.
+
+    Clauses that run across a chunk boundary are carried over to the next chunk.
+    A delimiter match is only trusted once the longest delimiter would fit after
+    its start, so a delimiter split across two chunks is still found.
+    """
+    delimiters = {delimiter for delimiter in delimiters if delimiter}
+    if not delimiters:
+        # nothing to split on, so the whole stream is one clause
+        yield "".join(chunks)
+        return
+
+    pattern = re.compile(compile_regex(delimiters))
+    max_len = max(len(delimiter) for delimiter in delimiters)
+
+    # pieces of the current clause carried over from earlier chunks
+    parts = []
+    # the end of the last chunk, which might be the start of a delimiter
+    tail = ""
+    for chunk in chunks:
+        buffer = tail + chunk
+        position = 0
+        for match in pattern.finditer(buffer):
+            if match.start() + max_len > len(buffer):
+                break
+            parts.append(buffer[position:match.start()])
+            yield "".join(parts)
+            parts = []
+            yield match.group()
+            position = match.end()
+
+        keep = max(position, len(buffer) - max_len + 1)
+        if keep > position:
+            parts.append(buffer[position:keep])
+        tail = buffer[keep:]
+
+    parts.append(tail)
+    yield from pattern.split("".join(parts))
+
+
+class Reiterable:
+    # an iterable that starts over from make_iterator() each time it's iterated,
+    #   for reading a source more than once without holding it
+    def __init__(self, make_iterator: Callable[[], Iterator]):
+        self.make_iterator = make_iterator
+
+    def __iter__(self):
+        return self.make_iterator()
+
+
+def iter_batches(clauses: Iterable[str], batch_size: int) -> Iterator[List[str]]:
+    # group consecutive clauses into lists of about batch_size characters,
+    #   though a clause longer than that still comes whole, in a batch of its own
+    batch = []
+    length = 0
+    for clause in clauses:
+        batch.append(clause)
+        length += len(clause)
+        if length >= batch_size:
+            yield batch
+            batch = []
+            length = 0
+    if batch:
+        yield batch
+
+
+def common_prefix_length(a: str, b: str) -> int:
+    # compare the overlap in one go, since most edges match in full
+    min_len = min(len(a), len(b))
+    if a[:min_len] == b[:min_len]:
+        return min_len
+
+    i = 0
+    while a[i] == b[i]:
+        i += 1
+    return i
+
+
+def tokenization_pattern(tokenization) -> str:
+    # map each token to a value based on its order of occurrence
+    component_tokens = dict()
+    for token in tokenization:
+        if token not in component_tokens:
+            component_tokens[token] = str(len(component_tokens))
+    return " ".join([component_tokens[token] for token in tokenization])
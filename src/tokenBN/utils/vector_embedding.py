@@ -1,145 +1,218 @@
+from multiprocessing import Pool
+from multiprocessing.shared_memory import SharedMemory
+
 import numpy as np
-import tensorflow as tf
+import scipy.sparse as sp
 from scipy.sparse.csgraph import connected_components
 
+from tokenBN.config import EMBEDDING_BATCH_SIZE, EMBEDDING_DIMENSIONS, PARALLEL_SUBGRAPH_BATCH_SIZE
+from tokenBN.EmbeddingTensor import EmbeddingTensor
+from tokenBN.SparseCOOTensor import SparseCOOTensor
+
+# the adjacency matrix a pool worker reads from shared memory, with the blocks it sits in
+_shared_adjacency_matrix = None
+_shared_blocks = []
+
 
-def calculate_distances_for_subgraph(labels, adjacency_matrix, subgraph_id):
+def calculate_distances_for_subgraph(labels, adjacency_matrix, subgraph_id, subgraph_vertices=None):
     """
     Calculate Manhattan distances for nodes in a specific subgraph and update the distance matrix.
 
+    Every vertex of the subgraph is a seed, and each seed gets an entry for each
+    nonzero entry of the adjacency matrix within the subgraph, plus one for itself,
+    all worked out at once from the matrix's nonzero structure.
+
     Parameters:
     labels (numpy array): Array of subgraph labels for each node.
     adjacency_matrix (CSR matrix): A sparse adjacency matrix of the graph.
     subgraph_id (int): ID of the subgraph to process.
+    subgraph_vertices (numpy array): The subgraph's vertices in ascending order, if already known.
+
+    Returns:
+    tuple: An (m, 3) array of [seed, outgoing, incoming] indices and an array of their m values,
+        in ascending order of index.
     """
     # extract a list of all the subgraph vertices in the current subgraph
-    subgraph_vertices = np.where(labels == subgraph_id)[0]
-
-    n = adjacency_matrix.shape[0]
-
-    indices = []
-    values = []
-    # for each seed node
-    for i in subgraph_vertices:
-        # for each outgoing node in the subgraph
-        for x in subgraph_vertices:
-            # for each incoming node in the subgraph
-            for y in subgraph_vertices:
-                # if the entry, when double-checked, is found to be nonzero
-                if adjacency_matrix[x, y] != 0 or i == x and x == y:
-                    # calculate inverted Manhattan distance, kind of
-                    #   since a node in the same row or column as the seed
-                    #   must have a distance of 1 from the seed,
-                    #   determine the shortest distance to either the row or column
-                    #   this is a heuristic since it would take too long to re-traverse the dag from scratch
-
-                    # if the entry represents the seed node
-                    if i == x and x == y:
-                        inverse_manhattan_distance = 1
-                    else:
-                        #   numerator is 0.75 to discount weight of non-self nodes
-                        inverse_manhattan_distance = 0.75 / np.maximum(min(np.abs(x - i), np.abs(y - i)), 1)
-
-                    # Store indices and values in lists
-                    indices.append([i, x, y])
-                    values.append(inverse_manhattan_distance)
-
-    if not indices:
+    if subgraph_vertices is None:
+        subgraph_vertices = np.flatnonzero(labels == subgraph_id)
+    if len(subgraph_vertices) == 0:
         print("Error, the entry for the seed node was not created in the tensor")
         return None
 
+    # the nonzero entries in the subgraph's rows, which a connected subgraph keeps to itself
+    rows = adjacency_matrix[subgraph_vertices].tocoo()
+    nonzero = rows.data != 0
+    outgoing = subgraph_vertices[rows.row[nonzero]].astype(np.int64)
+    incoming = rows.col[nonzero].astype(np.int64)
+
+    # pair every seed with every entry, then add each seed's own entry,
+    #   unless the seed's diagonal entry already stands for it
+    seeds = np.repeat(subgraph_vertices.astype(np.int64), len(outgoing))
+    outgoing = np.tile(outgoing, len(subgraph_vertices))
+    incoming = np.tile(incoming, len(subgraph_vertices))
+    not_seed = (outgoing != seeds) | (incoming != seeds)
+    seeds = np.concatenate([seeds[not_seed], subgraph_vertices])
+    outgoing = np.concatenate([outgoing[not_seed], subgraph_vertices])
+    incoming = np.concatenate([incoming[not_seed], subgraph_vertices])
+    order = np.lexsort((incoming, outgoing, seeds))
+    indices = np.stack([seeds[order], outgoing[order], incoming[order]], axis=1)
+
+    # calculate inverted Manhattan distance, kind of
+    #   since a node in the same row or column as the seed
+    #   must have a distance of 1 from the seed,
+    #   determine the shortest distance to either the row or column
+    #   this is a heuristic since it would take too long to re-traverse the dag from scratch
+    #   numerator is 0.75 to discount weight of non-self nodes, and the seed node itself gets 1
+    seed, x, y = indices.T
+    distance = np.maximum(np.minimum(np.abs(x - seed), np.abs(y - seed)), 1)
+    values = np.where((x == seed) & (y == seed), 1.0, 0.75 / distance)
+
     # return for recombination with the entire graph's tensor
     return indices, values
 
 
-def vectorize_adjacency_matrix(adjacency_matrix, low_mem=True):
+def vectorize_adjacency_matrix(adjacency_matrix, low_mem=True, processes=None,
+                               batch_size=PARALLEL_SUBGRAPH_BATCH_SIZE, as_tf=False):
     """
     Vectorize the adjacency matrix by calculating Manhattan distances for each subgraph.
 
     Parameters:
     adjacency_matrix (CSR matrix): Adjacency matrix of the graph.
+    low_mem (bool): Whether to work through the subgraphs in series, rather than in a process pool.
+    processes (int): How many worker processes to use, by default one per core.
+    batch_size (int): Roughly how many subgraph vertices to give a worker at a time.
+    as_tf (bool): Whether to return a tf.sparse.SparseTensor, which loads TensorFlow.
 
     Returns:
-    sparse CSR matrix: 3D distance matrix.
+    SparseCOOTensor: 3D distance tensor, with its indices sorted.
     """
     n = adjacency_matrix.shape[0]
+    adjacency_matrix = sp.csr_matrix(adjacency_matrix)
 
     # Identify subgraphs and their labels
     num_subgraphs, labels = connected_components(adjacency_matrix, directed=False, return_labels=True)
     indices = []
     values = []
 
+    # group the vertices by subgraph once, rather than scanning the labels for every subgraph
+    by_subgraph = np.argsort(labels, kind="stable")
+    bounds = np.searchsorted(labels[by_subgraph], np.arange(num_subgraphs + 1))
+    subgraphs = [by_subgraph[bounds[subgraph_id]:bounds[subgraph_id + 1]] for subgraph_id in range(num_subgraphs)]
+
     if low_mem:
         # Calculate distances for each subgraph in series
-        for subgraph_id in range(num_subgraphs):
-            subgraph_distance_tensor = calculate_distances_for_subgraph(labels, \
-                                                                        adjacency_matrix, \
-                                                                        subgraph_id)
-
-            # if there's a subgraph distance tensor to combine the original with...
-            if subgraph_distance_tensor is not None:
-                # Recombine the partial vectorizations given by the subgraphs into
-                #   a single vectorization for the entire graph
-                subgraph_indices, subgraph_values = calculate_distances_for_subgraph(labels,
-                                                                                     adjacency_matrix,
-                                                                                     subgraph_id)
-                indices = indices + subgraph_indices
-                values = values + subgraph_values
+        subgraph_distance_tensors = (
+            calculate_distances_for_subgraph(labels, adjacency_matrix, subgraph_id, subgraph_vertices)
+            for subgraph_id, subgraph_vertices in enumerate(subgraphs)
+        )
     else:
-        # Calculate distances for each subgraph in parallel
-        # Create and start threads for each subgraph
-        threads = []
-        # for subgraph_id in range(num_subgraphs):
-        #     thread = Thread(target=calculate_distances_for_subgraph,
-        #                     args=(labels,
-        #                           adjacency_matrix,
-        #                           subgraph_id))
-        #     thread.start()
-        #     threads.append(thread)
-
-        # # Wait for all threads to complete
-        # for thread in threads:
-        #     thread.join()
-        pass
-
-    # print(indices, values)
+        # Calculate distances for batches of subgraphs in parallel
+        subgraph_distance_tensors = vectorize_subgraphs_in_parallel(adjacency_matrix, subgraphs,
+                                                                    processes, batch_size)
+
+    for subgraph_distance_tensor in subgraph_distance_tensors:
+        # if there's a subgraph distance tensor to combine the original with...
+        if subgraph_distance_tensor is not None:
+            subgraph_indices, subgraph_values = subgraph_distance_tensor
+            indices.append(subgraph_indices)
+            values.append(subgraph_values)
+
+    # Recombine the partial vectorizations given by the subgraphs into
+    #   a single vectorization for the entire graph
+    indices = np.concatenate(indices) if indices else np.zeros((0, 3), dtype=np.int64)
+    values = np.concatenate(values).astype(np.float32) if values else np.zeros(0, dtype=np.float32)
+
+    # each subgraph's entries are already sorted and every seed is in just one subgraph,
+    #   so ordering the seeds sorts the whole tensor
+    order = np.argsort(indices[:, 0], kind="stable")
 
     # Return a sparse tensor for storing the tokens' distance tensors/embeddings
-    return tf.sparse.SparseTensor(indices=indices,
-                                  values=values,
-                                  dense_shape=[n, n, n])
+    tensor = SparseCOOTensor(indices[order], values[order], (n, n, n), is_sorted=True)
+    return tensor.to_tf() if as_tf else tensor
 
 
-def tensor_to_array(tensor):
-    return tf.sparse.to_dense(tensor).numpy()
+def vectorize_subgraphs_in_parallel(adjacency_matrix, subgraphs, processes=None,
+                                    batch_size=PARALLEL_SUBGRAPH_BATCH_SIZE):
+    """
+    Calculate the distances for every subgraph in a process pool, yielding them in
+    subgraph order. The subgraphs are independent, so consecutive ones are batched
+    up to about batch_size vertices, and each worker reads the adjacency matrix's
+    CSR arrays from shared memory rather than being sent its own copy.
+    """
+    batches = []
+    batch = []
+    batch_vertices = 0
+    for subgraph_vertices in subgraphs:
+        batch.append(subgraph_vertices)
+        batch_vertices += len(subgraph_vertices)
+        if batch_vertices >= batch_size:
+            batches.append(batch)
+            batch = []
+            batch_vertices = 0
+    if batch:
+        batches.append(batch)
 
+    blocks = []
+    try:
+        layout = []
+        for array in (adjacency_matrix.data, adjacency_matrix.indices, adjacency_matrix.indptr):
+            # SharedMemory can't be empty
+            block = SharedMemory(create=True, size=max(array.nbytes, 1))
+            blocks.append(block)
+            np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)[:] = array
+            layout.append((block.name, array.dtype.str, array.shape))
+
+        with Pool(processes, initializer=_attach_adjacency_matrix,
+                  initargs=(layout, adjacency_matrix.shape)) as pool:
+            for batch_distance_tensors in pool.imap(_calculate_distances_for_subgraphs, batches):
+                yield from batch_distance_tensors
+    finally:
+        for block in blocks:
+            block.close()
+            block.unlink()
 
-def get_tensor_slice(tensor, slice_index):
-    # print("Getting slice for token ", slice_index)
-    indices = tensor.indices.numpy()
-    values = tensor.values.numpy()
-    n = tensor.dense_shape.numpy()[0]
-    new_indices = []
-    new_values = []
 
-    for i, index in enumerate(indices):
-        if index[0] == slice_index:
-            new_indices.append([index[1], index[2]])
-            new_values.append(values[i])
+# runs in each of the pool's worker processes as it starts, for vectorize_subgraphs_in_parallel
+def _attach_adjacency_matrix(layout, shape):
+    global _shared_adjacency_matrix
+    arrays = []
+    for name, dtype, array_shape in layout:
+        block = SharedMemory(name=name)
+        # the blocks have to stay open for as long as the matrix is read
+        _shared_blocks.append(block)
+        arrays.append(np.ndarray(array_shape, dtype=np.dtype(dtype), buffer=block.buf))
+    _shared_adjacency_matrix = sp.csr_matrix(tuple(arrays), shape=shape, copy=False)
 
-    # print(new_indices, new_values)
-    return tf.sparse.SparseTensor(indices=new_indices,
-                                  values=new_values,
-                                  dense_shape=[n, n])
 
+# runs in the pool's worker processes, for vectorize_subgraphs_in_parallel
+def _calculate_distances_for_subgraphs(batch):
+    return [calculate_distances_for_subgraph(None, _shared_adjacency_matrix, None, subgraph_vertices)
+            for subgraph_vertices in batch]
 
-def vectorize(adjacency_matrix, reversed_token_map, token_set):
+
+def tensor_to_array(tensor):
+    if not isinstance(tensor, SparseCOOTensor):
+        tensor = SparseCOOTensor.from_tf(tensor)
+    return tensor.to_dense()
+
+
+def get_tensor_slice(tensor, slice_index):
+    # the slice comes back as the same kind of tensor it was taken from
+    if isinstance(tensor, SparseCOOTensor):
+        return tensor.slice(slice_index)
+    return SparseCOOTensor.from_tf(tensor).slice(slice_index).to_tf()
+
+
+def vectorize(adjacency_matrix, reversed_token_map, token_set, as_tf=False):
     n = len(token_set)
-    token_tensor = vectorize_adjacency_matrix(adjacency_matrix)
+    # grouped by token, so each token's slice is an offset lookup rather than a scan of the whole tensor
+    token_tensor = EmbeddingTensor.from_sparse_tensor(vectorize_adjacency_matrix(adjacency_matrix))
 
     # create a dictionary of all the tokens and their respective tensor embedding slices
     # print(token_tensor)
-    token_vector_mappings = {reversed_token_map[i]: get_tensor_slice(token_tensor, i) for i in range(n)}
+    token_vector_mappings = {reversed_token_map[i]: token_tensor.slice(i) for i in range(n)}
+    if as_tf:
+        token_vector_mappings = {token: vector.to_tf() for token, vector in token_vector_mappings.items()}
 
     for token in token_set:
         tok_vect_tensor = token_vector_mappings[token]
@@ -147,3 +220,64 @@ def vectorize(adjacency_matrix, reversed_token_map, token_set):
     # print(token_vector_mappings)
 
     return token_vector_mappings
+
+
+def hash_features(features, salt):
+    # splitmix64, spreading each feature index over all 64 bits
+    hashed = features ^ np.uint64(salt)
+    hashed = (hashed ^ (hashed >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    hashed = (hashed ^ (hashed >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return hashed ^ (hashed >> np.uint64(31))
+
+
+def reduce_embeddings(embedding_tensor, filename, dimensions=EMBEDDING_DIMENSIONS,
+                      batch_size=EMBEDDING_BATCH_SIZE, nonzeros=4, seed=0):
+    """
+    Project every token's n x n distance slice to a dense vector of a fixed
+    length, writing them to a memory-mapped .npy matrix whose row i is the
+    token with index i in the DAG's token_index_map.
+
+    The projection is a sparse random one: each entry (x, y) of a slice is
+    added, with a random sign, into nonzeros of the vector's dimensions, all
+    picked by hashing x * n + y. The projection matrix is never built, so it
+    takes no memory however large n gets, and distances between slices are
+    kept close to what they were. Tokens are projected batch_size at a time.
+
+    Parameters:
+    embedding_tensor (EmbeddingTensor): The distance slices, grouped by token.
+    filename (str): Where to write the .npy matrix.
+    dimensions (int): The length of each token's vector.
+    batch_size (int): How many tokens to project at a time.
+    nonzeros (int): How many dimensions each slice entry is added into.
+    seed (int): Picks the projection, so embeddings built with the same seed are comparable.
+
+    Returns:
+    numpy memmap: The [n, dimensions] embedding matrix.
+    """
+    n = len(embedding_tensor)
+    embeddings = np.lib.format.open_memmap(filename, mode="w+", dtype=np.float32, shape=(n, dimensions))
+    salts = np.random.default_rng(seed).integers(0, 2 ** 63, size=nonzeros, dtype=np.uint64)
+
+    for start in range(0, n, batch_size):
+        end = min(start + batch_size, n)
+        batch = embedding_tensor.slices(range(start, end))
+        tokens, rows, cols = batch.indices.T
+        features = (rows * n + cols).astype(np.uint64)
+
+        projected = np.zeros((end - start) * dimensions)
+        for salt in salts:
+            hashed = hash_features(features, salt)
+            # the top bit picks the sign, and the rest the dimension
+            signs = 1.0 - 2.0 * (hashed >> np.uint64(63)).astype(np.float64)
+            buckets = ((hashed & np.uint64(2 ** 63 - 1)) % np.uint64(dimensions)).astype(np.int64)
+            projected += np.bincount(tokens * dimensions + buckets, weights=signs * batch.values,
+                                     minlength=(end - start) * dimensions)
+        embeddings[start:end] = (projected / np.sqrt(nonzeros)).reshape(end - start, dimensions)
+
+    embeddings.flush()
+    return embeddings
+
+
+def load_embeddings(filename):
+    # each token's vector is one row read, straight from the file
+    return np.load(filename, mmap_mode="r")
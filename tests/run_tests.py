@@ -2,6 +2,17 @@ import unittest
 from test_SuffixNode import TestSuffixNode
 from test_FlatTreeNode import TestFlatTreeNode
 from test_CompositionDAGNode import TestCompositionDAGNode
+from test_UkkonenTree import TestUkkonenTree
+from test_CompactTreeStore import TestCompactTreeStore
+from test_SubstringCounts import TestSubstringCounts
+from test_ThresholdIndex import TestThresholdIndex
+from test_CompiledTokenizer import TestCompiledTokenizer
+from test_DecompositionCache import TestDecompositionCache
+from test_ColumnarDAGStore import TestColumnarDAGStore
+from test_SparseCOOTensor import TestSparseCOOTensor
+from test_DAGExporter import TestDAGExporter
+from test_vector_embedding import TestVectorEmbedding
+from test_imports import TestImports
 
 if __name__ == "__main__":
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,88 @@
+import os
+import tempfile
+import unittest
+
+from tokenBN.SuffixNode import SuffixNode
+from tokenBN.CompositionDAGNode import CompositionDAGNode
+from tokenBN.ColumnarDAGStore import ColumnarDAGStore
+
+class TestColumnarDAGStore(unittest.TestCase):
+    def setUp(self):
+        self.test_text = "abbabababba yogabbagabba\nthe then they\nthe other"
+        self.delimiters = {" ", "\n"}
+        self.suffix_tree = SuffixNode.from_text(
+            text=self.test_text,
+            threshold=2,
+            delimiters=self.delimiters
+        )
+
+    def test_from_suffix_tree(self):
+        dag = CompositionDAGNode()
+        dag.suffix_tree_to_dag(self.suffix_tree)
+        dag_store = dag.dag_store
+        columnar = ColumnarDAGStore.from_suffix_tree(self.suffix_tree)
+
+        self.assertEqual(set(columnar.edge_set), dag_store.edge_set)
+        self.assertEqual(len(columnar.edge_set), len(dag_store.edge_set))
+        self.assertEqual(set(columnar.vertices), self.suffix_tree.get_tokens())
+        # the object DAG's root shares the top-level tokens' pattern
+        self.assertEqual(dict(columnar.pattern_map),
+                         {pattern: tokens - {None} for pattern, tokens in dag_store.pattern_map.items()})
+
+        for token in self.suffix_tree.get_tokens():
+            vertex, columnar_vertex = dag_store.vertices[token], columnar.vertices[token]
+            self.assertEqual(columnar_vertex.frequency, vertex.frequency)
+            self.assertEqual(columnar_vertex.pattern, vertex.pattern)
+            parents = [parent.token for parent in vertex.parents if parent.token is not None]
+            self.assertEqual(columnar.parents(token), parents)
+            self.assertEqual([parent.token for parent in columnar_vertex.parents], parents)
+            self.assertEqual(sorted(columnar.children(token)),
+                             sorted(child.token for child in vertex.flat_tree_store.child_dict.values()))
+
+            # repeated edges are counted the same way in both
+            child_ids, counts = columnar.child_ids(columnar.token_index_map[token])
+            for child_id, count in zip(child_ids, counts):
+                child = columnar.reversed_token_map[child_id]
+                self.assertEqual(count, dag_store.adjacency_matrix[dag_store.token_index_map[token],
+                                                                   dag_store.token_index_map[child]])
+
+    def test_edge_set(self):
+        columnar = ColumnarDAGStore.from_suffix_tree(self.suffix_tree)
+        for edge in columnar.edge_set:
+            self.assertIn(edge, columnar.edge_set)
+        self.assertNotIn(("a", "abba", 3), columnar.edge_set)
+        self.assertNotIn(("z", "abba", 0), columnar.edge_set)
+
+    def test_save_load(self):
+        dag = CompositionDAGNode()
+        dag.suffix_tree_to_dag(self.suffix_tree)
+        columnar = ColumnarDAGStore.from_suffix_tree(self.suffix_tree)
+
+        with tempfile.TemporaryDirectory() as directory:
+            filename = os.path.join(directory, "dag.bin")
+            for saved in (dag, columnar):
+                saved.save(filename)
+                loaded = ColumnarDAGStore.load(filename)
+                # the string tables stay mapped, with no dict of them built until one is looked up
+                self.assertIsNone(loaded.token_index_map.index)
+                self.assertEqual(sorted(loaded.tokens), sorted(columnar.tokens))
+
+                self.assertEqual(set(loaded.edge_set), set(columnar.edge_set))
+                self.assertEqual(dict(loaded.pattern_map), dict(columnar.pattern_map))
+                for token in self.suffix_tree.get_tokens():
+                    self.assertEqual(loaded.vertices[token].frequency, columnar.vertices[token].frequency)
+                    self.assertEqual(loaded.parents(token), columnar.parents(token))
+                    self.assertEqual(sorted(loaded.children(token)), sorted(columnar.children(token)))
+                # the object DAG's indices are kept, so its adjacency matrix comes back as it was
+                saved_store = saved.dag_store if isinstance(saved, CompositionDAGNode) else saved
+                self.assertEqual((loaded.adjacency_matrix != saved_store.adjacency_matrix).nnz, 0)
+                del loaded
+
+            # the file is checked before anything is read from it
+            with self.assertRaises(ValueError):
+                SuffixNode.load(filename)
+            with open(filename, "r+b") as file:
+                file.seek(8)
+                file.write((99).to_bytes(4, "little"))
+            with self.assertRaises(ValueError):
+                ColumnarDAGStore.load(filename)
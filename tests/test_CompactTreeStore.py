@@ -0,0 +1,126 @@
+import os
+import tempfile
+import unittest
+
+from tokenBN.SuffixNode import SuffixNode
+from tokenBN.CompactTreeStore import CompactTreeStore
+
+class TestCompactTreeStore(unittest.TestCase):
+    def setUp(self):
+        self.test_text = "abbabababba yogabbagabba"
+        self.delimiters = {" ", "\n"}
+        self.threshold = 2
+
+    def build_both(self, text):
+        tree = SuffixNode.build_tree(
+            text=text,
+            threshold=self.threshold,
+            delimiters=self.delimiters,
+        )
+        compact_tree = SuffixNode.build_tree(
+            text=text,
+            threshold=self.threshold,
+            delimiters=self.delimiters,
+            backend="compact"
+        )
+        return tree, compact_tree
+
+    def test_from_clauses(self):
+        tree, compact_tree = self.build_both(self.test_text)
+
+        self.assertIsInstance(compact_tree.flat_tree_store, CompactTreeStore)
+        self.assertEqual(compact_tree.get_tokens(), tree.get_tokens())
+        for token, node in tree.flat_tree_store.child_dict.items():
+            compact_node = compact_tree.flat_tree_store.child_dict[token]
+            self.assertEqual(compact_node.token, token)
+            self.assertEqual(compact_node.suffix, node.suffix)
+            self.assertEqual(compact_node.frequency, node.frequency)
+            self.assertEqual(set(compact_node.keys_to_my_children), set(node.keys_to_my_children))
+            self.assertEqual(compact_node.parent.token, node.parent.token)
+
+    def test_text_is_compacted(self):
+        # the same clauses over and over only keep the text of the tokens they first added
+        text = " ".join([self.test_text] * 50 + ["bayogaboy"])
+        tree, compact_tree = self.build_both(text)
+        store = compact_tree.flat_tree_store
+        self.assertEqual(compact_tree.get_tokens(), tree.get_tokens())
+        self.assertLess(len(store.text), len(self.test_text) * 2)
+
+        # and pruning frees the text only the last clause's rare tokens used
+        text_length = len(store.text)
+        compact_tree.clean()
+        self.assertLess(len(store.text), text_length)
+        for token in compact_tree.get_tokens():
+            self.assertEqual(store.child_dict[token].token, token)
+
+    def test_long_delimiters(self):
+        compact_tree = SuffixNode.from_text(
+            text="then the\n\nthey the",
+            threshold=self.threshold,
+            delimiters={" ", "\n\n"},
+            backend="compact"
+        )
+        store = compact_tree.flat_tree_store
+
+        # a delimiter starting with a character of the alphabet doesn't displace it
+        self.assertEqual(store.child_dict["\n"].token, "\n")
+        self.assertEqual(store.child_dict["\n\n"].frequency, 1)
+        compact_tree.compile()
+
+    def test_find(self):
+        _, compact_tree = self.build_both(self.test_text)
+        store = compact_tree.flat_tree_store
+
+        self.assertIn("babab", store.child_dict)
+        self.assertNotIn("bab ", store.child_dict)
+        self.assertNotIn("", store.child_dict)
+        with self.assertRaises(KeyError):
+            store.child_dict["zz"]
+
+    def test_prune(self):
+        tree, compact_tree = self.build_both(self.test_text)
+        num_nodes = compact_tree.flat_tree_store.num_nodes
+
+        tree.clean()
+        compact_tree.clean()
+
+        self.assertEqual(compact_tree.get_tokens(), tree.get_tokens())
+        # pruned nodes are packed away
+        self.assertLess(compact_tree.flat_tree_store.num_nodes, num_nodes)
+        self.assertEqual(compact_tree.flat_tree_store.child_dict[" "].frequency, 1)
+
+    def test_tokenize(self):
+        tree, compact_tree = self.build_both(self.test_text)
+        tree.clean()
+        compact_tree.clean()
+
+        for max_token_len in [1, 3, len(self.test_text) - 1]:
+            self.assertEqual(
+                compact_tree.flat_tree_store.tokenize(self.test_text, max_token_len),
+                tree.flat_tree_store.tokenize(self.test_text, max_token_len)
+            )
+
+    def test_save_load(self):
+        tree, compact_tree = self.build_both(self.test_text + "\nthe then they")
+        tree.clean()
+        compact_tree.clean()
+
+        with tempfile.TemporaryDirectory() as directory:
+            for saved in (tree, compact_tree):
+                filename = os.path.join(directory, "tree.bin")
+                saved.save(filename)
+                loaded = SuffixNode.load(filename)
+
+                store = loaded.flat_tree_store
+                self.assertEqual(loaded.get_tokens(), tree.get_tokens())
+                for token in tree.get_tokens():
+                    self.assertEqual(store.child_dict[token].frequency, tree.flat_tree_store.child_dict[token].frequency)
+                self.assertEqual((store.delimiters, store.threshold), (self.delimiters, self.threshold))
+                # only the leaves' tokens are kept as text
+                self.assertLess(len(store.text), sum(len(token) for token in tree.get_tokens()))
+                self.assertEqual(store.tokenize(self.test_text, 5), tree.flat_tree_store.tokenize(self.test_text, 5))
+                self.assertEqual(loaded.compile().tokenize(self.test_text), tree.compile().tokenize(self.test_text))
+
+                # the loaded tree is read-only, but can still be copied and pruned
+                self.assertEqual(loaded.pruned_copy(3).get_tokens(), tree.pruned_copy(3).get_tokens())
+                del loaded, store
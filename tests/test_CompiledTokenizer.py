@@ -0,0 +1,85 @@
+import pickle
+import unittest
+
+import numpy as np
+
+from tokenBN.SuffixNode import SuffixNode
+from tokenBN.CompositionDAGNode import CompositionDAGNode
+from tokenBN.CompiledTokenizer import MAX_NESTING
+
+class TestCompiledTokenizer(unittest.TestCase):
+    def setUp(self):
+        self.test_text = "abbabababba yogabbagabba\nthe then they\nthe other"
+        self.delimiters = {" ", "\n"}
+        self.texts = [self.test_text, "abbazthey\t", "yoga", ""]
+
+    def test_tokenize(self):
+        for backend in SuffixNode.BACKENDS:
+            tree = SuffixNode.from_text(
+                text=self.test_text,
+                threshold=2,
+                delimiters=self.delimiters,
+                backend=backend
+            )
+            self.assertEqual(set(tree.compile().tokens), tree.get_tokens())
+
+            for max_token_len in [None, 1, 3, 5]:
+                compiled = tree.compile(max_token_len)
+                tree_max_token_len = len(self.test_text) if max_token_len is None else max_token_len
+                self.assertEqual(
+                    compiled.tokenize_many(self.texts),
+                    tree.flat_tree_store.tokenize_many(self.texts, tree_max_token_len)
+                )
+
+    def test_multi_character_delimiters(self):
+        text = "the then. they\n\nthe other. then\nthey\n\nthe"
+        texts = [text, "they\n\n\nthe. .", "\n\n", ""]
+        for backend in SuffixNode.BACKENDS:
+            tree = SuffixNode.from_text(text=text, threshold=2, delimiters={"\n\n", ". "}, backend=backend)
+            self.assertEqual(tree.compile().tokenize_many(texts),
+                             tree.flat_tree_store.tokenize_many(texts, len(text)))
+            self.assertEqual(tree.compile().tokenize("they\n\nthe"), ["they", "\n\n", "the"])
+
+    def test_deep_tree(self):
+        # every run of a's is a token, nesting far deeper than MAX_NESTING
+        text = "a" * (2 * MAX_NESTING) + "b\n" + "a" * (3 * MAX_NESTING)
+        tree = SuffixNode.from_text(text=text, threshold=2, delimiters={"\n"})
+        compiled = tree.compile()
+        self.assertEqual(compiled.tokenize(text), tree.flat_tree_store.tokenize(text, len(text)))
+
+    def test_pickle(self):
+        tree = SuffixNode.from_text(text=self.test_text, threshold=2, delimiters=self.delimiters)
+        compiled = pickle.loads(pickle.dumps(tree.compile(4)))
+        self.assertEqual(compiled.max_token_len, 4)
+        self.assertEqual(compiled.tokenize_many(self.texts), tree.flat_tree_store.tokenize_many(self.texts, 4))
+
+    def test_encode(self):
+        tree = SuffixNode.from_text(text=self.test_text, threshold=2, delimiters=self.delimiters)
+        compiled = tree.compile()
+        texts = [self.test_text, "yoga", "", "the other then"]
+
+        ids = compiled.encode(self.test_text)
+        self.assertEqual(ids.dtype, np.int32)
+        self.assertEqual([compiled.tokens[i] for i in ids], compiled.tokenize(self.test_text))
+        self.assertEqual(compiled.decode(ids), self.test_text)
+
+        flat_ids, offsets = compiled.encode_many(texts)
+        self.assertEqual(len(offsets), len(texts) + 1)
+        for i, text in enumerate(texts):
+            np.testing.assert_array_equal(flat_ids[offsets[i]:offsets[i + 1]], compiled.encode(text))
+        self.assertEqual(compiled.decode_many(flat_ids, offsets), texts)
+
+        # characters outside the alphabet have no id
+        with self.assertRaises(KeyError):
+            compiled.encode("z")
+
+    def test_encode_dag_ids(self):
+        tree = SuffixNode.from_text(text=self.test_text, threshold=2, delimiters=self.delimiters)
+        dag = CompositionDAGNode()
+        dag.suffix_tree_to_dag(tree)
+        token_index_map = dag.dag_store.token_index_map
+
+        compiled = tree.compile(token_index_map=token_index_map)
+        ids = compiled.encode(self.test_text)
+        self.assertEqual(ids.tolist(), [token_index_map[token] for token in compiled.tokenize(self.test_text)])
+        self.assertEqual(compiled.decode(ids), self.test_text)
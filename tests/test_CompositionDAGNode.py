@@ -1,3 +1,5 @@
+import random
+import sys
 import unittest
 import urllib.request as url
 
@@ -22,10 +24,80 @@ class TestCompositionDAGNode(unittest.TestCase):
         pass
 
     def test_build_subgraph(self):
-        pass
+        # each run of a's is a token made of the run one shorter and an "a",
+        #   so the missing tokens nest deeper than the recursion limit allows
+        text = "a" * (sys.getrecursionlimit() + 500)
+        # built without pruning, since that recurses down the tree too
+        suffix_tree = SuffixNode.build_tree(text=text, threshold=2, delimiters={"\n"}, method="ukkonen")
+        tokens = suffix_tree.get_tokens()
+
+        dag = CompositionDAGNode()
+        dag.dag_store.token_index_map = {token: i for i, token in enumerate(tokens)}
+        dag.dag_store.vertices["a"] = CompositionDAGNode(token="a", dag_store=dag.dag_store)
+        longest = max(tokens, key=len)
+        vert = CompositionDAGNode(token=longest, dag_store=dag.dag_store)
+        tokenization = suffix_tree.flat_tree_store.tokenize(longest, len(longest) - 1)
+        vert, vertices = vert.build_subgraph(suffix_tree, tokenization)
+
+        self.assertEqual([parent.token for parent in vert.parents], tokenization)
+        for token, vertex in vertices.items():
+            if token != "a":
+                self.assertEqual("".join(parent.token for parent in vertex.parents), token)
+        # every edge is added once
+        self.assertEqual(len(dag.dag_store.edge_sources), sum(len(v.parents) for v in vertices.values()) + len(vert.parents))
 
     def test_suffix_tree_to_dag(self):
-        pass
+        dag = CompositionDAGNode()
+        dag.suffix_tree_to_dag(self.suffix_tree)
+        dag_store = dag.dag_store
+        token_index_map = dag_store.token_index_map
+
+        # every recorded edge is in the adjacency matrix, counted once per time it was added
+        sources, targets, positions = dag_store.edge_arrays()
+        self.assertEqual(
+            {(dag_store.reversed_token_map[source], dag_store.reversed_token_map[target], position)
+             for source, target, position in zip(sources, targets, positions)},
+            dag_store.edge_set
+        )
+        self.assertEqual(dag_store.adjacency_matrix.sum(), len(sources))
+        adjacency = dag_store.adjacency_matrix
+        for pre, cum, _ in dag_store.edge_set:
+            count = sum(1 for parent in dag_store.vertices[cum].parents if parent.token == pre)
+            self.assertEqual(adjacency[token_index_map[pre], token_index_map[cum]], count)
+
+    def test_update_dag(self):
+        rng = random.Random(0)
+        words = ["".join(rng.choice("abcde") for _ in range(rng.randint(2, 5))) for _ in range(30)]
+        lines = [" ".join(rng.choice(words) for _ in range(rng.randint(2, 6))) + "\n" for _ in range(120)]
+        base, batches = "".join(lines[:60]), ["".join(lines[i:i + 15]) for i in range(60, 120, 15)]
+
+        suffix_tree = SuffixNode.build_tree(text=base, threshold=3, delimiters={"\n"})
+        dag = CompositionDAGNode()
+        dag.suffix_tree_to_dag(suffix_tree.pruned_copy())
+        suffix_tree.track_changes()
+        for batch in batches:
+            suffix_tree.add_text(batch)
+            dag.update_dag(suffix_tree)
+
+        rebuilt = CompositionDAGNode()
+        rebuilt.suffix_tree_to_dag(SuffixNode.build_tree(text=base + "".join(batches), threshold=3,
+                                                         delimiters={"\n"}).pruned_copy())
+
+        def summary(dag):
+            dag_store = dag.dag_store
+            adjacency = dag_store.adjacency_matrix.tocoo()
+            reversed_token_map = dag_store.reversed_token_map
+            # the indices stay contiguous, whichever tokens came and went
+            self.assertEqual(set(reversed_token_map), set(range(adjacency.shape[0])))
+            return (
+                dag_store.edge_set,
+                {(reversed_token_map[source], reversed_token_map[target]): count
+                 for source, target, count in zip(adjacency.row, adjacency.col, adjacency.data)},
+                {token: (vert.frequency, vert.pattern, [parent.token for parent in vert.parents])
+                 for token, vert in dag_store.vertices.items() if token is not None}
+            )
+
+        self.assertEqual(summary(dag), summary(rebuilt))
 
     def test_dag_to_file(self):
         test_url = "https://gist.githubusercontent.com/Niximacco/6ae63abd1834485811200daefc319b40/raw/2411e31293a35f3e565f61e7490a806d4720ea7e/bee%2520movie%2520script"
@@ -46,7 +118,7 @@ class TestCompositionDAGNode(unittest.TestCase):
         dag.suffix_tree_to_dag(self.suffix_tree)
 
         # dag.export_dag(f"bee_movie min-freq={self.threshold}.csv")
-        dag.export_dag(f"bee-movie text-patterns min-freq={self.threshold}.csv",
+        dag.export_dag(f"graphs/bee-movie text-patterns min-freq={self.threshold}.csv",
                        "patterns")
 
         if len(dag.dag_store.vertices.keys()) < 50:
@@ -0,0 +1,96 @@
+import csv
+import os
+import tempfile
+import unittest
+import xml.etree.ElementTree as ET
+
+import numpy as np
+
+from tokenBN.SuffixNode import SuffixNode
+from tokenBN.CompositionDAGNode import CompositionDAGNode
+from tokenBN.ColumnarDAGStore import ColumnarDAGStore
+from tokenBN.DAGExporter import DAGExporter
+from tokenBN.utils.binary_format import decode_strings
+
+class TestDAGExporter(unittest.TestCase):
+    def setUp(self):
+        # the ; in a token has to be quoted in the csv
+        self.suffix_tree = SuffixNode.from_text(
+            text="abbabababba yogabbagabba\nthe then they\nthe; they;",
+            threshold=2,
+            delimiters={" ", "\n"}
+        )
+        self.dag = CompositionDAGNode()
+        self.dag.suffix_tree_to_dag(self.suffix_tree)
+        self.dag_store = self.dag.dag_store
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def path(self, filename):
+        return os.path.join(self.directory.name, filename)
+
+    def test_csv(self):
+        vertices = self.dag_store.vertices
+        for output, name in (("tokens", lambda token: token), ("patterns", lambda token: vertices[token].pattern)):
+            self.dag.export_dag(self.path("dag.csv"), output)
+            with open(self.path("dag.csv"), newline="") as file:
+                rows = [tuple(row) for row in csv.reader(file, delimiter=";")]
+            # every pair once, as export_dag always meant to write
+            self.assertEqual(len(rows), len(set(rows)))
+            self.assertEqual(set(rows), {(name(source), name(target)) for source, target, _ in self.dag_store.edge_set})
+
+            # pairs spread over many chunks of edges are still written once, in the same order
+            DAGExporter(self.dag_store, chunk_size=3).export(self.path("chunked.csv"), output)
+            with open(self.path("dag.csv")) as file, open(self.path("chunked.csv")) as chunked_file:
+                self.assertEqual(chunked_file.read(), file.read())
+
+    def test_xml(self):
+        edges = sorted(self.dag_store.edge_set)
+        exporter = DAGExporter(self.dag_store, chunk_size=3)
+
+        exporter.export(self.path("dag.graphml"))
+        namespace = {"g": "http://graphml.graphdrawing.org/xmlns"}
+        graph = ET.parse(self.path("dag.graphml")).getroot().find("g:graph", namespace)
+        tokens = {node.get("id"): {data.get("key"): data.text for data in node} for node in graph.findall("g:node", namespace)}
+        self.assertEqual({node["token"] for node in tokens.values()}, self.suffix_tree.get_tokens())
+        for node in tokens.values():
+            self.assertEqual(int(node["frequency"]), self.dag_store.vertices[node["token"]].frequency)
+            self.assertEqual(node["pattern"], self.dag_store.vertices[node["token"]].pattern)
+        self.assertEqual(sorted((tokens[edge.get("source")]["token"], tokens[edge.get("target")]["token"],
+                                 int(edge.find("g:data", namespace).text))
+                                for edge in graph.findall("g:edge", namespace)), edges)
+
+        exporter.export(self.path("dag.gexf"))
+        namespace = {"g": "http://gexf.net/1.3"}
+        graph = ET.parse(self.path("dag.gexf")).getroot().find("g:graph", namespace)
+        labels = {node.get("id"): node.get("label") for node in graph.iter("{http://gexf.net/1.3}node")}
+        self.assertEqual(set(labels.values()), self.suffix_tree.get_tokens())
+        self.assertEqual(sorted((labels[edge.get("source")], labels[edge.get("target")],
+                                 int(edge.find("g:attvalues/g:attvalue", namespace).get("value")))
+                                for edge in graph.iter("{http://gexf.net/1.3}edge")), edges)
+
+    def test_npz(self):
+        # from a loaded DAG too, whose columns are memory-mapped
+        self.dag.save(self.path("dag.bin"))
+        for dag_store in (self.dag_store, ColumnarDAGStore.load(self.path("dag.bin"))):
+            DAGExporter(dag_store, chunk_size=4).export(self.path("dag.npz"))
+            with np.load(self.path("dag.npz")) as archive:
+                tokens = decode_strings(archive["token_data"], archive["token_offsets"])
+                patterns = decode_strings(archive["pattern_data"], archive["pattern_offsets"])
+                self.assertEqual(sorted(zip((tokens[source] for source in archive["sources"]),
+                                            (tokens[target] for target in archive["targets"]),
+                                            archive["positions"].tolist())),
+                                 sorted(self.dag_store.edge_set))
+                for token, frequency, pattern_id in zip(tokens, archive["frequency"].tolist(),
+                                                        archive["pattern_ids"].tolist()):
+                    self.assertEqual(frequency, self.dag_store.vertices[token].frequency)
+                    self.assertEqual(patterns[pattern_id], self.dag_store.vertices[token].pattern)
+            del dag_store
+
+    def test_unknown_format(self):
+        with self.assertRaises(ValueError):
+            self.dag.export_dag(self.path("dag.txt"))
+        with self.assertRaises(ValueError):
+            self.dag.export_dag(self.path("dag.graphml"), "patterns")
@@ -0,0 +1,71 @@
+import unittest
+
+from tokenBN.SuffixNode import SuffixNode
+from tokenBN.CompositionDAGNode import CompositionDAGNode
+from tokenBN.DAGStore import DAGStore
+from tokenBN.DecompositionCache import DecompositionCache
+
+class TestDecompositionCache(unittest.TestCase):
+    def setUp(self):
+        self.test_text = "abbabababba yogabbagabba"
+        self.delimiters = {" ", "\n"}
+        self.suffix_tree = SuffixNode.from_text(
+            text=self.test_text,
+            threshold=2,
+            delimiters=self.delimiters
+        )
+
+    def test_tokenize(self):
+        store = self.suffix_tree.flat_tree_store
+        cache = DecompositionCache(max_size=2)
+
+        self.assertEqual(cache.tokenize(store, "gabba", 4), tuple(store.tokenize("gabba", 4)))
+        cache.tokenize(store, "abba", 3)
+        cache.tokenize(store, "gabba", 4)
+        self.assertEqual((cache.hits, cache.misses), (1, 2))
+
+        # "abba" is the least recently used, so it's the one evicted
+        cache.tokenize(store, "babab", 4)
+        self.assertEqual(len(cache), 2)
+        self.assertNotIn(("abba", 3), cache.entries)
+        self.assertIn(("gabba", 4), cache.entries)
+
+        # a different tree's store starts the entries over
+        other_store = SuffixNode.from_text(text="gab gab", threshold=2, delimiters=self.delimiters).flat_tree_store
+        self.assertEqual(cache.tokenize(other_store, "gabba", 4), tuple(other_store.tokenize("gabba", 4)))
+        self.assertEqual(list(cache.entries), [("gabba", 4)])
+        self.assertEqual((cache.hits, cache.misses), (1, 4))
+
+        cache.clear()
+        self.assertEqual((len(cache), cache.hits, cache.misses), (0, 0, 0))
+
+    def test_suffix_tree_to_dag(self):
+        dag = CompositionDAGNode()
+        dag.suffix_tree_to_dag(self.suffix_tree)
+
+        # every token is decomposed just once, shortest first, so none go through the cache
+        cache = dag.dag_store.decomposition_cache
+        self.assertEqual((len(cache), cache.hits, cache.misses), (0, 0, 0))
+
+    def test_build_subgraph(self):
+        full_dag = CompositionDAGNode()
+        full_dag.suffix_tree_to_dag(self.suffix_tree)
+        suffix_node = self.suffix_tree.flat_tree_store.child_dict["gabba"]
+
+        # two DAGs over the same tree share one cache
+        cache = DecompositionCache()
+        for expected_hits in [0, 3]:
+            dag = CompositionDAGNode(dag_store=DAGStore(decomposition_cache=cache))
+            dag.dag_store.token_index_map = full_dag.dag_store.token_index_map
+            vertices = dag.dag_store.vertices
+            for token in self.suffix_tree.keys_to_my_children:
+                vertices[token] = CompositionDAGNode(token=token, dag_store=dag.dag_store)
+
+            # "abba" is missing, and so are "ab" and "ba" that make it up
+            vert = CompositionDAGNode(token="gabba", dag_store=dag.dag_store)
+            vert.build_subgraph(suffix_node, ["g", "abba"])
+            self.assertEqual((cache.hits, cache.misses), (expected_hits, 3))
+            for token in ["gabba", "abba", "ab", "ba"]:
+                parents = vert if token == "gabba" else vertices[token]
+                self.assertEqual([parent.token for parent in parents.parents],
+                                 [parent.token for parent in full_dag.dag_store.vertices[token].parents])
@@ -18,4 +18,36 @@ class TestFlatTreeNode(unittest.TestCase):
             delimiters=self.delimiters
         )
         tokenization = suffix_tree.flat_tree_store.tokenize(self.test_text, len(self.test_text) - 1)
-        self.assertEqual(tokenization, actual_tokenization)
\ No newline at end of file
+        self.assertEqual(tokenization, actual_tokenization)
+    def test_tokenize_many(self):
+        for backend in SuffixNode.BACKENDS:
+            suffix_tree = SuffixNode.from_text(
+                text="abcab abcab",
+                threshold=self.threshold,
+                delimiters={" "},
+                backend=backend
+            )
+            texts = ["abcab abcab", "abcb", "zab", ""]
+            tokenizations = suffix_tree.flat_tree_store.tokenize_many(texts, 5)
+            self.assertEqual(tokenizations, [
+                ["abcab", " ", "abcab"],
+                # a partly matched token is never emitted
+                ["ab", "c", "b"],
+                # characters outside the alphabet are tokens of their own
+                ["z", "ab"],
+                [],
+            ])
+            for text, tokenization in zip(texts, tokenizations):
+                self.assertEqual(suffix_tree.flat_tree_store.tokenize(text, 5), tokenization)
+
+    def test_multi_character_delimiters(self):
+        for backend in SuffixNode.BACKENDS:
+            suffix_tree = SuffixNode.from_text(
+                text="ab\n\nab\n\nab",
+                threshold=self.threshold,
+                delimiters={"\n\n"},
+                backend=backend
+            )
+            # a delimiter is one token, even where its first character is a token too
+            self.assertEqual(suffix_tree.flat_tree_store.tokenize("ab\n\nab\nab", 10),
+                             ["ab", "\n\n", "ab", "\n", "ab"])
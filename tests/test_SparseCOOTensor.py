@@ -0,0 +1,46 @@
+import importlib.util
+import unittest
+
+import numpy as np
+
+from tokenBN.SparseCOOTensor import SparseCOOTensor
+from tokenBN.utils.vector_embedding import get_tensor_slice, tensor_to_array
+
+# TensorFlow is an optional extra, so its adapters are only tested where it's installed
+HAS_TENSORFLOW = importlib.util.find_spec("tensorflow") is not None
+if HAS_TENSORFLOW:
+    import tensorflow as tf
+
+
+class TestSparseCOOTensor(unittest.TestCase):
+    def setUp(self):
+        self.dense = np.zeros((3, 4, 5), dtype=np.float32)
+        self.dense[2, 0, 1] = 0.5
+        self.dense[0, 3, 4] = 1
+        self.dense[0, 1, 2] = 0.75
+        self.dense[2, 3, 0] = 0.25
+        indices = np.argwhere(self.dense)[::-1]
+        self.tensor = SparseCOOTensor(indices, self.dense[tuple(indices.T)], self.dense.shape)
+
+    def test_sorted(self):
+        self.assertEqual(self.tensor.indices.tolist(), np.argwhere(self.dense).tolist())
+        np.testing.assert_array_equal(self.tensor.to_dense(), self.dense)
+
+    def test_slice(self):
+        for index in range(3):
+            np.testing.assert_array_equal(self.tensor.slice(index).to_dense(), self.dense[index])
+        self.assertEqual(self.tensor.slice(1).nnz, 0)
+
+    @unittest.skipUnless(HAS_TENSORFLOW, "TensorFlow isn't installed")
+    def test_tf(self):
+        tf_tensor = self.tensor.to_tf()
+        np.testing.assert_array_equal(tf.sparse.to_dense(tf_tensor).numpy(), self.dense)
+        round_trip = SparseCOOTensor.from_tf(tf_tensor)
+        np.testing.assert_array_equal(round_trip.indices, self.tensor.indices)
+        np.testing.assert_array_equal(round_trip.values, self.tensor.values)
+
+        # the helpers take either kind of tensor, and slice into the same kind
+        np.testing.assert_array_equal(tensor_to_array(tf_tensor), self.dense)
+        tf_slice = get_tensor_slice(tf_tensor, 2)
+        self.assertIsInstance(tf_slice, tf.sparse.SparseTensor)
+        np.testing.assert_array_equal(tf.sparse.to_dense(tf_slice).numpy(), self.dense[2])
@@ -0,0 +1,30 @@
+import unittest
+
+from tokenBN.SubstringCounts import SubstringCounts
+
+class TestSubstringCounts(unittest.TestCase):
+    def setUp(self):
+        self.clauses = ["abcabd", "abcx", "zz"]
+
+    def test_counts(self):
+        substring_counts = SubstringCounts(self.clauses, threshold=2, max_len=2)
+        self.assertEqual(substring_counts.counts["ab"], 3)
+        self.assertEqual(substring_counts.counts["z"], 2)
+        self.assertEqual(substring_counts.counts["abc"], 0)
+
+    def test_frequent_prefix_lengths(self):
+        for max_len in range(1, 5):
+            substring_counts = SubstringCounts(self.clauses, threshold=2, max_len=max_len)
+            for clause in self.clauses:
+                lengths = substring_counts.frequent_prefix_lengths(clause)
+                self.assertEqual(len(lengths), len(clause))
+                for start, length in enumerate(lengths):
+                    # every prefix that occurs twice fits, so the bound never cuts a frequent one
+                    occurring = [n for n in range(1, len(clause) - start + 1)
+                                 if sum(other[i:].startswith(clause[start:start + n])
+                                        for other in self.clauses for i in range(len(other))) >= 2]
+                    self.assertGreaterEqual(length, max(occurring, default=0))
+
+        # with windows as long as the clauses, the bound is exact
+        substring_counts = SubstringCounts(self.clauses, threshold=2, max_len=6)
+        self.assertEqual(substring_counts.frequent_prefix_lengths("abcabd"), [3, 2, 1, 2, 1, 0])
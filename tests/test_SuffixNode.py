@@ -1,8 +1,10 @@
+import io
+import re
 import unittest
 
 from tokenBN.config import DEBUG_VERBOSITY
 
-from tokenBN.utils.util import compile_regex
+from tokenBN.utils.util import compile_regex, iter_clauses
 from tokenBN.SuffixNode import SuffixNode
 
 class TestSuffixNode(unittest.TestCase):
@@ -88,6 +90,38 @@ class TestSuffixNode(unittest.TestCase):
         for node in great_grandchildren:
             self.assertEqual(node.frequency, 1)
 
+    def test_split_edge_reuses_child(self):
+        root = SuffixNode(delimiters=self.delimiters, threshold=self.threshold)
+        root.flat_tree_store.root = root
+        root.add_suffix("test")
+        old_child = root.flat_tree_store.child_dict["test"]
+        self.assertEqual(old_child.suffix, "est")
+
+        # splitting the "est" edge for "team" keeps the same node for "test"
+        root.add_suffix("team")
+        self.assertIs(root.flat_tree_store.child_dict["test"], old_child)
+        self.assertEqual(old_child.suffix, "st")
+        self.assertEqual(old_child.parent.token, "te")
+
+        # nodes are slotted and share the tree-wide settings through the store
+        self.assertFalse(hasattr(old_child, "__dict__"))
+        self.assertEqual(old_child.delimiters, self.delimiters)
+        self.assertEqual(old_child.threshold, self.threshold)
+
+    def test_split_edge_after_suffix_ended(self):
+        root = SuffixNode()
+        root.flat_tree_store.root = root
+        root.add_all_suffixes("then")
+        # "the" stops partway along the "then" edge
+        root.add_all_suffixes("the")
+        root.add_all_suffixes("they")
+
+        child = root.flat_tree_store.child_dict["the"]
+        self.assertEqual(child.frequency, 3)
+        # only one suffix ever reached the "n"
+        self.assertEqual(root.flat_tree_store.child_dict["then"].frequency, 1)
+        self.assertEqual(root.flat_tree_store.child_dict["they"].frequency, 1)
+
     def test_prune_tree(self):
         root = SuffixNode()
         root.flat_tree_store.root = root
@@ -112,6 +146,46 @@ class TestSuffixNode(unittest.TestCase):
         for child_token in set("abc"):
             self.assertEqual(root.flat_tree_store.child_dict[child_token].frequency, 2)
 
+    def test_prune_tree_threshold(self):
+        root = SuffixNode(threshold=3)
+        root.flat_tree_store.root = root
+        for word in ["abcd", "abce", "abxy", "ab"]:
+            root.add_all_suffixes(word)
+        self.assertEqual(root.flat_tree_store.child_dict["abc"].frequency, 2)
+        self.assertIn("abcd", root.flat_tree_store.child_dict)
+
+        # the tree's own threshold is used, and a pruned node takes its subtree with it
+        root.prune_tree()
+        self.assertIn("ab", root.flat_tree_store.child_dict)
+        for token in ["abc", "abcd", "abce", "abxy"]:
+            self.assertNotIn(token, root.flat_tree_store.child_dict)
+
+    def check_child_index(self, root):
+        nodes = [root] + list(root.flat_tree_store.child_dict.values())
+        for node in nodes:
+            if node.child_index is None:
+                self.assertFalse(node.keys_to_my_children)
+                continue
+            self.assertEqual(set(node.child_index.values()), set(node.keys_to_my_children))
+            for character, child_token in node.child_index.items():
+                self.assertEqual(root.flat_tree_store.child_dict[child_token].suffix[0], character)
+
+    def test_child_index(self):
+        root = SuffixNode()
+        root.flat_tree_store.root = root
+        root.add_all_suffixes("abbabababba")
+        root.add_all_suffixes("gabbagabba")
+        self.check_child_index(root)
+
+        index, child_token = root.longest_common_prefix("abbx", doSuffix=True)
+        self.assertEqual((index, child_token), (1, "a"))
+        child = root.flat_tree_store.child_dict["a"]
+        self.assertEqual(child.longest_common_prefix("abbx", doSuffix=False), (2, "ab"))
+        self.assertEqual(child.longest_common_prefix("zz", doSuffix=False), (-1, None))
+
+        root.prune_tree(threshold=2)
+        self.check_child_index(root)
+
     # repeat, I know, but it should help with debugging
     def test_get_tokens(self):
         root = SuffixNode()
@@ -161,6 +235,222 @@ class TestSuffixNode(unittest.TestCase):
         self.assertIsInstance(tree, SuffixNode)
         self.check_built_tree(tree, self.test_text)
 
+    def test_build_trees_ukkonen(self):
+        texts = [
+            self.test_text,
+            "then the they\nthe then",
+            "abababab aba ba\nbabab",
+        ]
+        for text in texts:
+            inserted = SuffixNode.build_tree(
+                text=text,
+                threshold=self.threshold,
+                delimiters=self.delimiters,
+            )
+            tree = SuffixNode.build_tree(
+                text=text,
+                threshold=self.threshold,
+                delimiters=self.delimiters,
+                method="ukkonen"
+            )
+            frequencies = {token: node.frequency for token, node in tree.flat_tree_store.child_dict.items()}
+            inserted_frequencies = {token: node.frequency for token, node in inserted.flat_tree_store.child_dict.items()}
+            self.assertEqual(frequencies, inserted_frequencies)
+
+            inserted.clean()
+            tree.clean()
+            self.assertEqual(tree.get_tokens(), inserted.get_tokens())
+
+        tree = SuffixNode.build_tree(
+            text=self.test_text,
+            threshold=self.threshold,
+            delimiters=self.delimiters,
+            method="ukkonen"
+        )
+        self.check_built_tree(tree, self.test_text)
+
+        with self.assertRaises(ValueError):
+            SuffixNode.build_tree(
+                text=self.test_text,
+                threshold=self.threshold,
+                delimiters=self.delimiters,
+                method="quadratic"
+            )
+
+    def test_graft_clauses(self):
+        clauses = list(iter_clauses(["abbabababba yogabbagabba\nthen the they\nabababab aba ba babab"],
+                                    self.delimiters))
+        tree = SuffixNode.build_tree_from_clauses(clauses, self.delimiters, self.threshold)
+
+        # batches of a clause or two, each grafted and merged into the tree in turn
+        grafted_tree = SuffixNode.build_tree_from_clauses((), self.delimiters, self.threshold)
+        grafted_tree.graft_clauses(iter(clauses), batch_size=8)
+
+        self.assertEqual(grafted_tree.get_tokens(), tree.get_tokens())
+        for token, node in tree.flat_tree_store.child_dict.items():
+            grafted_node = grafted_tree.flat_tree_store.child_dict[token]
+            self.assertEqual(grafted_node.frequency, node.frequency)
+            self.assertEqual(grafted_node.suffix, node.suffix)
+            self.assertEqual(grafted_node.edge_ends, node.edge_ends)
+
+    def test_from_stream(self):
+        tree = SuffixNode.from_text(
+            text=self.test_text,
+            threshold=self.threshold,
+            delimiters=self.delimiters
+        )
+        frequencies = {token: node.frequency for token, node in tree.flat_tree_store.child_dict.items()}
+
+        # clauses and delimiters cut across chunk boundaries
+        chunks = [self.test_text[i:i + 5] for i in range(0, len(self.test_text), 5)]
+        streams = [iter(chunks), io.StringIO(self.test_text)]
+        for stream in streams:
+            streamed_tree = SuffixNode.from_stream(
+                stream=stream,
+                threshold=self.threshold,
+                delimiters=self.delimiters,
+                chunk_size=3
+            )
+            streamed_frequencies = {token: node.frequency
+                                    for token, node in streamed_tree.flat_tree_store.child_dict.items()}
+            self.assertEqual(streamed_frequencies, frequencies)
+
+    def test_from_stream_threshold(self):
+        tree = SuffixNode.from_text(
+            text=self.test_text,
+            threshold=self.threshold,
+            delimiters=self.delimiters
+        )
+        tokens = tree.get_tokens()
+
+        # the stream is read once to count and once to build, without being held
+        chunks = [self.test_text[i:i + 5] for i in range(0, len(self.test_text), 5)]
+        file = io.StringIO("skipped" + self.test_text)
+        file.seek(len("skipped"))
+        for stream in [chunks, file]:
+            streamed_tree = SuffixNode.from_stream(
+                stream=stream,
+                threshold=self.threshold,
+                delimiters=self.delimiters,
+                method="threshold",
+                chunk_size=3
+            )
+            self.assertEqual(streamed_tree.get_tokens(), tokens)
+
+        with self.assertRaises(ValueError):
+            SuffixNode.from_stream(stream=iter(chunks), threshold=self.threshold,
+                                   delimiters=self.delimiters, method="threshold")
+
+    def test_iter_clauses(self):
+        text = "ab  cd\n\nef gh"
+        delimiters = {" ", "\n\n"}
+        clauses = re.split(compile_regex(delimiters), text)
+        for chunk_size in range(1, len(text) + 1):
+            chunks = [text[i:i + chunk_size] for i in range(0, len(text), chunk_size)]
+            self.assertEqual(list(iter_clauses(chunks, delimiters)), clauses)
+
+    def test_build_trees_threshold(self):
+        texts = [
+            self.test_text,
+            "then the they\nthe then",
+            "abababab aba ba\nbabab",
+            "the quick brown fox\nthe lazy dog\nthe quick dog",
+        ]
+        for text in texts:
+            inserted = SuffixNode.build_tree(
+                text=text,
+                threshold=self.threshold,
+                delimiters={"\n"},
+            )
+            unpruned = SuffixNode.build_tree(
+                text=text,
+                threshold=self.threshold,
+                delimiters={"\n"},
+                method="threshold"
+            )
+            # branches that can't reach the threshold were never built
+            self.assertLessEqual(len(unpruned.flat_tree_store.child_dict), len(inserted.flat_tree_store.child_dict))
+            self.assertIsNone(unpruned.flat_tree_store.substring_counts)
+
+            inserted.clean()
+            unpruned.clean()
+            frequencies = {token: node.frequency for token, node in unpruned.flat_tree_store.child_dict.items()}
+            inserted_frequencies = {token: node.frequency for token, node in inserted.flat_tree_store.child_dict.items()}
+            self.assertEqual(frequencies, inserted_frequencies)
+
+    def test_max_token_len(self):
+        text = "abababab aba ba\nbabab"
+        clauses = list(iter_clauses([text], {"\n"}))
+        for max_token_len in range(1, 5):
+            tree = SuffixNode.build_tree(
+                text=text,
+                threshold=self.threshold,
+                delimiters={"\n"},
+                max_token_len=max_token_len
+            )
+            for token, node in tree.flat_tree_store.child_dict.items():
+                self.assertLessEqual(len(token), max_token_len)
+                # the frequency is still the number of times the edge's first prefix occurs
+                prefix = (node.parent.token or "") + node.suffix[0]
+                occurrences = sum(clause.startswith(prefix, i) for clause in clauses for i in range(len(clause)))
+                self.assertEqual(node.frequency, occurrences)
+
+        # a bound longer than any clause changes nothing
+        bounded = SuffixNode.from_text(text, self.threshold, {"\n"}, max_token_len=len(text))
+        unbounded = SuffixNode.from_text(text, self.threshold, {"\n"})
+        self.assertEqual(bounded.get_tokens(), unbounded.get_tokens())
+
+        for build_kwargs in [{"max_token_len": 0}, {"max_token_len": 2, "method": "ukkonen"}]:
+            with self.assertRaises(ValueError):
+                SuffixNode.build_tree(text, {"\n"}, self.threshold, **build_kwargs)
+
+    def test_merge_tree(self):
+        clauses = list(iter_clauses([self.test_text], self.delimiters))
+        tree = SuffixNode.build_tree_from_clauses(clauses, self.delimiters, self.threshold)
+
+        half = len(clauses) // 2
+        merged_tree = SuffixNode.build_tree_from_clauses(clauses[:half], self.delimiters, self.threshold)
+        merged_tree.merge_tree(
+            SuffixNode.build_tree_from_clauses(clauses[half:], self.delimiters, self.threshold)
+        )
+
+        for trie in [tree, merged_tree]:
+            self.assertEqual(trie.flat_tree_store.child_dict.keys(), tree.flat_tree_store.child_dict.keys())
+        for token, node in tree.flat_tree_store.child_dict.items():
+            merged_node = merged_tree.flat_tree_store.child_dict[token]
+            self.assertEqual(merged_node.frequency, node.frequency)
+            self.assertEqual(merged_node.suffix, node.suffix)
+
+    def test_build_tree_parallel(self):
+        # enough clauses that shards are merged over more than one round
+        text = " ".join([self.test_text] * 4)
+        tree = SuffixNode.from_text(text=text, threshold=self.threshold, delimiters=self.delimiters)
+        frequencies = {token: node.frequency for token, node in tree.flat_tree_store.child_dict.items()}
+
+        parallel_trees = [
+            SuffixNode.from_text(
+                text=text,
+                threshold=self.threshold,
+                delimiters=self.delimiters,
+                processes=2
+            ),
+            SuffixNode.build_tree_parallel(
+                clauses=iter_clauses([text], self.delimiters),
+                delimiters=self.delimiters,
+                threshold=self.threshold,
+                processes=2,
+                shard_size=1
+            )
+        ]
+        parallel_trees[1].clean()
+        for parallel_tree in parallel_trees:
+            parallel_frequencies = {token: node.frequency
+                                    for token, node in parallel_tree.flat_tree_store.child_dict.items()}
+            self.assertEqual(parallel_frequencies, frequencies)
+
+        with self.assertRaises(ValueError):
+            SuffixNode.build_tree(text, self.delimiters, self.threshold, method="ukkonen", processes=2)
+
     def test_get_suffix_tree(self):
         base_token_set = ({
             'a', 'b', 'ba', 'bba', 'ab', 'abba', 'bab',
@@ -0,0 +1,60 @@
+import unittest
+
+from tokenBN.SuffixNode import SuffixNode
+from tokenBN.ThresholdIndex import ThresholdIndex
+
+class TestThresholdIndex(unittest.TestCase):
+    def setUp(self):
+        self.test_text = "abbabababba yogabbagabba\nthe then they\nthe other"
+        self.delimiters = {" ", "\n"}
+
+    def build_tree(self, threshold=2, **build_kwargs):
+        return SuffixNode.build_tree(
+            text=self.test_text,
+            threshold=threshold,
+            delimiters=self.delimiters,
+            **build_kwargs
+        )
+
+    def test_tokens(self):
+        for backend in SuffixNode.BACKENDS:
+            tree = self.build_tree(backend=backend)
+            index = ThresholdIndex(tree)
+            for threshold in range(1, 8):
+                cleaned = self.build_tree(threshold=threshold, backend=backend)
+                cleaned.clean()
+                self.assertEqual(index.tokens(threshold), cleaned.get_tokens())
+                self.assertEqual(index.vocab_size(threshold), len(cleaned.get_tokens()))
+
+    def test_pruned_tree(self):
+        tree = self.build_tree()
+        index = tree.threshold_index()
+        num_nodes = len(tree.flat_tree_store.child_dict)
+        for threshold in [4, 2, 3]:
+            pruned_tree = index.pruned_tree(threshold)
+            cleaned = self.build_tree(threshold=threshold)
+            cleaned.clean()
+            for token, node in cleaned.flat_tree_store.child_dict.items():
+                pruned_node = pruned_tree.flat_tree_store.child_dict[token]
+                self.assertEqual(pruned_node.frequency, node.frequency)
+                self.assertEqual(pruned_node.suffix, node.suffix)
+            self.assertEqual(pruned_tree.get_tokens(), cleaned.get_tokens())
+            self.assertEqual(pruned_tree.threshold, threshold)
+
+        # the indexed tree itself is never pruned
+        self.assertEqual(len(tree.flat_tree_store.child_dict), num_nodes)
+
+    def test_threshold_for_vocab_size(self):
+        index = self.build_tree().threshold_index()
+        for vocab_size in range(len(index.kept_tokens), index.vocab_size(1) + 2):
+            threshold = index.threshold_for_vocab_size(vocab_size)
+            self.assertLessEqual(index.vocab_size(threshold), vocab_size)
+            if threshold > 1:
+                self.assertGreater(index.vocab_size(threshold - 1), vocab_size)
+
+        with self.assertRaises(ValueError):
+            index.threshold_for_vocab_size(len(index.kept_tokens) - 1)
+
+        tree = SuffixNode.from_text(self.test_text, 2, self.delimiters, vocab_size=20)
+        self.assertLessEqual(len(tree.get_tokens()), 20)
+        self.assertEqual(tree.get_tokens(), index.tokens(tree.threshold))
@@ -0,0 +1,42 @@
+import unittest
+
+from tokenBN.UkkonenTree import UkkonenTree
+from tokenBN.SuffixNode import SuffixNode
+
+class TestUkkonenTree(unittest.TestCase):
+    def setUp(self):
+        self.clauses = ["abbabababba", " ", "yogabbagabba"]
+
+    def test_add_clause(self):
+        tree = UkkonenTree(self.clauses)
+
+        # every suffix of every clause ends at its own leaf
+        leaves = [node for node in range(len(tree.start)) if not tree.children[node]]
+        self.assertEqual(len(leaves), sum(len(clause) + 1 for clause in self.clauses))
+        # and no edge label runs into the next clause
+        for node in range(1, len(tree.start)):
+            self.assertNotIn("\0", tree.label(node))
+
+        # empty clauses are skipped
+        tree.add_clause("")
+        self.assertEqual(tree.num_clauses, len(self.clauses))
+
+    def test_count_occurrences(self):
+        tree = UkkonenTree(self.clauses)
+        count = tree.count_occurrences()
+
+        for symbol, node in tree.children[UkkonenTree.ROOT].items():
+            if symbol in {"a", "b", "g"}:
+                expected = sum(clause.count(symbol) for clause in self.clauses)
+                self.assertEqual(count[node], expected)
+
+    def test_graft(self):
+        root = SuffixNode()
+        root.flat_tree_store.root = root
+        UkkonenTree(["abc", "def"]).graft(root)
+
+        tokens = root.get_tokens()
+        actual_tokens = {"a", "b", "c", "d", "e", "f", "bc", "ef", "abc", "def"}
+        self.assertEqual(tokens, actual_tokens)
+        for token in tokens:
+            self.assertEqual(root.flat_tree_store.child_dict[token].frequency, 1)
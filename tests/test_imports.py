@@ -0,0 +1,35 @@
+import os
+import subprocess
+import sys
+import unittest
+
+# too slow to load for short-lived tokenization jobs and pool workers
+HEAVY_MODULES = ("tensorflow", "matplotlib", "seaborn", "networkx", "pandas")
+
+
+def modules_loaded_by(statement):
+    # a fresh interpreter, since this one has likely loaded them already
+    script = f"import sys\n{statement}\nprint(' '.join(sorted(sys.modules)))"
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(path for path in sys.path if path))
+    result = subprocess.run([sys.executable, "-c", script], capture_output=True, text=True, env=env, check=True)
+    return set(result.stdout.split())
+
+
+class TestImports(unittest.TestCase):
+    def test_core_import_is_light(self):
+        for statement in ("import tokenBN",
+                          "from tokenBN.SuffixNode import SuffixNode",
+                          "from tokenBN.utils import count_occurrences"):
+            loaded = modules_loaded_by(statement)
+            self.assertEqual([module for module in HEAVY_MODULES if module in loaded], [], statement)
+
+    def test_lazy_attributes(self):
+        import tokenBN
+        from tokenBN.utils import figures, vector_embedding
+
+        self.assertIs(tokenBN.plot_dag, figures.plot_dag)
+        self.assertIs(tokenBN.vectorize, vector_embedding.vectorize)
+        self.assertIs(tokenBN.load_embeddings, tokenBN.utils.load_embeddings)
+        self.assertIn("plot_embeddings", dir(tokenBN))
+        with self.assertRaises(AttributeError):
+            tokenBN.not_an_attribute
@@ -0,0 +1,135 @@
+import importlib.util
+import os
+import tempfile
+import unittest
+
+import numpy as np
+from scipy.sparse.csgraph import connected_components
+
+from tokenBN.SuffixNode import SuffixNode
+from tokenBN.CompositionDAGNode import CompositionDAGNode
+from tokenBN.EmbeddingTensor import EmbeddingTensor
+from tokenBN.utils.vector_embedding import (
+    calculate_distances_for_subgraph,
+    vectorize_adjacency_matrix,
+    get_tensor_slice,
+    tensor_to_array,
+    hash_features,
+    reduce_embeddings,
+    load_embeddings
+)
+
+
+def loop_distances_for_subgraph(labels, adjacency_matrix, subgraph_id):
+    # the original scalar loop, kept as the reference for the vectorized version
+    subgraph_vertices = np.where(labels == subgraph_id)[0]
+    indices = []
+    values = []
+    for i in subgraph_vertices:
+        for x in subgraph_vertices:
+            for y in subgraph_vertices:
+                if adjacency_matrix[x, y] != 0 or i == x and x == y:
+                    if i == x and x == y:
+                        inverse_manhattan_distance = 1
+                    else:
+                        inverse_manhattan_distance = 0.75 / np.maximum(min(np.abs(x - i), np.abs(y - i)), 1)
+                    indices.append([i, x, y])
+                    values.append(inverse_manhattan_distance)
+    return indices, values
+
+
+class TestVectorEmbedding(unittest.TestCase):
+    def setUp(self):
+        suffix_tree = SuffixNode.from_text(
+            text="abbabababba yogabbagabba\nthe then they\n",
+            threshold=2,
+            delimiters={" ", "\n"}
+        )
+        self.dag = CompositionDAGNode()
+        self.dag.suffix_tree_to_dag(suffix_tree)
+        self.adjacency_matrix = self.dag.dag_store.adjacency_matrix
+
+    def test_calculate_distances_for_subgraph(self):
+        num_subgraphs, labels = connected_components(self.adjacency_matrix, directed=False, return_labels=True)
+        for subgraph_id in range(num_subgraphs):
+            indices, values = calculate_distances_for_subgraph(labels, self.adjacency_matrix, subgraph_id)
+            expected_indices, expected_values = loop_distances_for_subgraph(labels, self.adjacency_matrix, subgraph_id)
+            self.assertEqual(indices.tolist(), expected_indices)
+            self.assertEqual(values.tolist(), expected_values)
+
+    def test_vectorize_adjacency_matrix(self):
+        # a self-loop stands in for the seed's own entry instead of adding a second one
+        adjacency_matrix = self.adjacency_matrix.tolil()
+        adjacency_matrix[0, 0] = 1
+        adjacency_matrix = adjacency_matrix.tocsr()
+
+        num_subgraphs, labels = connected_components(adjacency_matrix, directed=False, return_labels=True)
+        expected = []
+        for subgraph_id in range(num_subgraphs):
+            expected.extend(zip(*loop_distances_for_subgraph(labels, adjacency_matrix, subgraph_id)))
+        # the tensor's indices come out sorted
+        expected.sort()
+
+        tensor = vectorize_adjacency_matrix(adjacency_matrix)
+        self.assertEqual(tensor.indices.tolist(), [index for index, _ in expected])
+        np.testing.assert_array_equal(tensor.values, np.array([value for _, value in expected], dtype=np.float32))
+
+    @unittest.skipUnless(importlib.util.find_spec("tensorflow"), "TensorFlow isn't installed")
+    def test_vectorize_adjacency_matrix_as_tf(self):
+        # the TensorFlow adapter holds the same entries
+        tensor = vectorize_adjacency_matrix(self.adjacency_matrix)
+        tf_tensor = vectorize_adjacency_matrix(self.adjacency_matrix, as_tf=True)
+        np.testing.assert_array_equal(tf_tensor.indices.numpy(), tensor.indices)
+        np.testing.assert_array_equal(tf_tensor.values.numpy(), tensor.values)
+
+    def test_vectorize_adjacency_matrix_in_parallel(self):
+        serial = vectorize_adjacency_matrix(self.adjacency_matrix)
+        # small batches, so the subgraphs are spread over several tasks
+        parallel = vectorize_adjacency_matrix(self.adjacency_matrix, low_mem=False, processes=2, batch_size=3)
+        np.testing.assert_array_equal(parallel.indices, serial.indices)
+        np.testing.assert_array_equal(parallel.values, serial.values)
+
+    def test_embedding_tensor(self):
+        tensor = vectorize_adjacency_matrix(self.adjacency_matrix)
+        embedding_tensor = EmbeddingTensor.from_sparse_tensor(tensor)
+        n = self.adjacency_matrix.shape[0]
+        dense = tensor_to_array(tensor)
+
+        for token_id in range(n):
+            token_slice = embedding_tensor.slice(token_id)
+            np.testing.assert_array_equal(tensor_to_array(token_slice), dense[token_id])
+            np.testing.assert_array_equal(token_slice.indices, get_tensor_slice(tensor, token_id).indices)
+            self.assertEqual(embedding_tensor.nnz(token_id), token_slice.nnz)
+
+        # a batch comes out stacked in the order asked for, repeats included
+        token_ids = [3, 0, n - 1, 3]
+        np.testing.assert_array_equal(tensor_to_array(embedding_tensor.slices(token_ids)), dense[token_ids])
+
+    def test_reduce_embeddings(self):
+        embedding_tensor = EmbeddingTensor.from_sparse_tensor(vectorize_adjacency_matrix(self.adjacency_matrix))
+        n = len(embedding_tensor)
+        dimensions, nonzeros = 16, 3
+
+        with tempfile.TemporaryDirectory() as directory:
+            filename = os.path.join(directory, "embeddings.npy")
+            reduce_embeddings(embedding_tensor, filename, dimensions=dimensions, batch_size=4, nonzeros=nonzeros)
+            embeddings = load_embeddings(filename)
+            self.assertEqual((embeddings.shape, embeddings.dtype), ((n, dimensions), np.float32))
+
+            # the same as multiplying the flattened slices by the projection matrix written out in full
+            salts = np.random.default_rng(0).integers(0, 2 ** 63, size=nonzeros, dtype=np.uint64)
+            features = np.arange(n * n, dtype=np.uint64)
+            projection = np.zeros((n * n, dimensions))
+            for salt in salts:
+                hashed = hash_features(features, salt)
+                buckets = (hashed & np.uint64(2 ** 63 - 1)) % np.uint64(dimensions)
+                np.add.at(projection, (np.arange(n * n), buckets.astype(np.int64)),
+                          np.where(hashed >> np.uint64(63), -1.0, 1.0))
+            dense = np.stack([tensor_to_array(embedding_tensor.slice(token_id)).ravel() for token_id in range(n)])
+            np.testing.assert_allclose(embeddings, dense @ projection / np.sqrt(nonzeros), rtol=1e-5, atol=1e-6)
+
+            # the batches don't change the result
+            other_filename = os.path.join(directory, "other_embeddings.npy")
+            reduce_embeddings(embedding_tensor, other_filename, dimensions=dimensions, batch_size=n, nonzeros=nonzeros)
+            np.testing.assert_array_equal(load_embeddings(other_filename), embeddings)
+            del embeddings